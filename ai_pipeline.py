@@ -0,0 +1,220 @@
+"""
+Асинхронный конвейер AI-анализа: таймауты, ограничение параллелизма, объединение запросов
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Шаблон запроса к модели; его хэш входит в ключ кэша анализов
+ANALYSIS_PROMPT_TEMPLATE = """
+Официальные данные ТН ВЭД:
+{context}
+
+Пользователь спрашивает: {user_query}
+
+Проанализируй и дополни официальную информацию:
+1. Подтверди правильность классификации
+2. Добавь практические советы по импорту/экспорту
+3. Укажи возможные альтернативы или похожие товары
+4. Предупреди о потенциальных сложностях
+"""
+
+
+def template_hash(template: str = ANALYSIS_PROMPT_TEMPLATE, user_query: str = "") -> str:
+    """Хэш шаблона запроса (и вопроса пользователя, если он входит в запрос) для ключа кэша"""
+    return hashlib.sha1(f"{template}\0{user_query}".encode('utf-8')).hexdigest()[:12]
+
+
+def build_analysis_prompt(product: Dict, user_query: str = "") -> str:
+    """Запрос к модели по записи товара (любая схема ключей)"""
+    context = "\n".join(f"{key}: {value}" for key, value in product.items())
+    return ANALYSIS_PROMPT_TEMPLATE.format(context=context, user_query=user_query or "анализ товара")
+
+
+@dataclass
+class AnalysisResult:
+    """Результат анализа"""
+    text: str
+    source: str  # 'backend', 'fallback'
+    latency: float
+    coalesced: bool = False  # результат получен из чужого (объединенного) вызова
+
+
+class AnalysisBackend:
+    """Интерфейс бэкенда анализа"""
+
+    async def analyze(self, prompt: str) -> str:
+        raise NotImplementedError
+
+
+class StubAnalysisBackend(AnalysisBackend):
+    """Локальная заглушка модели с настраиваемой задержкой и долей ошибок"""
+
+    def __init__(self, latency: float = 0.5, jitter: float = 0.0, error_rate: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.calls = 0
+
+    async def analyze(self, prompt: str) -> str:
+        self.calls += 1
+        await asyncio.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+        if self.error_rate and random.random() < self.error_rate:
+            raise RuntimeError("Stub backend error")
+        return f"Анализ Genspark AI для запроса: {prompt.strip()[:50]}... (заглушка)"
+
+
+class GensparkAgentBackend(AnalysisBackend):
+    """Адаптер синхронного агента с методом analyze(query) -> str"""
+
+    def __init__(self, agent):
+        self.agent = agent
+
+    async def analyze(self, prompt: str) -> str:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.agent.analyze, prompt)
+
+
+class BackgroundLoop:
+    """Цикл asyncio в отдельном потоке для вызова из синхронного кода"""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="ai-pipeline", daemon=True)
+        self._thread.start()
+
+    def run(self, coro, timeout: Optional[float] = None):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+class AsyncAnalysisClient:
+    """Клиент анализа с таймаутом, ограничением параллелизма и объединением запросов"""
+
+    def __init__(self, backend: AnalysisBackend, timeout: float = 8.0, max_concurrency: int = 4):
+        self.backend = backend
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._background: Optional[BackgroundLoop] = None
+        self._background_lock = threading.Lock()
+        self.stats = {"requests": 0, "backend_calls": 0, "coalesced": 0,
+                      "timeouts": 0, "errors": 0, "fallbacks": 0}
+
+    async def analyze(self, key: str, prompt: str, fallback: Callable[[], str],
+                      timeout: Optional[float] = None) -> AnalysisResult:
+        """Анализ по ключу (например, код и версия базы)
+
+        Одновременные запросы с одним ключом ждут один вызов бэкенда.
+        timeout — бюджет на ожидание модели (включая очередь на семафор и
+        ожидание чужого вызова); при превышении возвращается fallback().
+        """
+        self.stats["requests"] += 1
+        started = time.perf_counter()
+        budget = timeout or self.timeout
+
+        leader = self._inflight.get(key)
+        if leader is not None:
+            self.stats["coalesced"] += 1
+            try:
+                # Свой бюджет: ведущий запрос может ждать модель дольше
+                text, source = await asyncio.wait_for(asyncio.shield(leader), budget)
+            except asyncio.TimeoutError:
+                self.stats["timeouts"] += 1
+                self.stats["fallbacks"] += 1
+                text, source = fallback(), 'fallback'
+            except asyncio.CancelledError:
+                if not leader.cancelled():
+                    raise  # отменен сам ожидающий запрос
+                # Ведущий запрос отменен (например, клиент отключился): ответ по шаблону
+                self.stats["fallbacks"] += 1
+                text, source = fallback(), 'fallback'
+            except Exception as e:
+                logger.warning(f"Ошибка объединенного запроса анализа {key}: {e}")
+                self.stats["errors"] += 1
+                self.stats["fallbacks"] += 1
+                text, source = fallback(), 'fallback'
+            return AnalysisResult(text, source, time.perf_counter() - started, coalesced=True)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            text, source = await self._call_backend(prompt, fallback, budget)
+            future.set_result((text, source))
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._inflight.pop(key, None)
+        return AnalysisResult(text, source, time.perf_counter() - started)
+
+    async def _call_backend(self, prompt: str, fallback: Callable[[], str], timeout: float):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def guarded():
+            async with self._semaphore:
+                self.stats["backend_calls"] += 1
+                return await self.backend.analyze(prompt)
+
+        try:
+            return await asyncio.wait_for(guarded(), timeout), 'backend'
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            logger.warning(f"AI-анализ не уложился в {timeout:.1f}с, используется локальный анализ")
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.error(f"Ошибка бэкенда AI-анализа: {e}")
+        self.stats["fallbacks"] += 1
+        return fallback(), 'fallback'
+
+    def analyze_sync(self, key: str, prompt: str, fallback: Callable[[], str],
+                     timeout: Optional[float] = None) -> AnalysisResult:
+        """Синхронный вызов из обработчиков бота (через фоновый цикл asyncio)"""
+        with self._background_lock:
+            if self._background is None:
+                self._background = BackgroundLoop()
+        budget = timeout or self.timeout
+        try:
+            # Небольшой запас сверх бюджета: таймаут внутри цикла срабатывает раньше
+            return self._background.run(self.analyze(key, prompt, fallback, budget), budget + 1.0)
+        except FutureTimeoutError:
+            self.stats["timeouts"] += 1
+            self.stats["fallbacks"] += 1
+            return AnalysisResult(fallback(), 'fallback', budget)
+
+
+def create_client_from_env(env: Dict[str, str]) -> Optional[AsyncAnalysisClient]:
+    """Клиент по переменным окружения (AI_BACKEND=stub, AI_STUB_LATENCY, AI_TIMEOUT, AI_MAX_CONCURRENCY)
+
+    Без AI_BACKEND возвращает None — используется только локальный анализ.
+    """
+    backend_name = env.get("AI_BACKEND", "")
+    if backend_name == "stub":
+        backend: AnalysisBackend = StubAnalysisBackend(latency=float(env.get("AI_STUB_LATENCY", "0.5")))
+    elif not backend_name:
+        return None
+    else:
+        logger.error(f"Неизвестный AI_BACKEND: {json.dumps(backend_name)}")
+        return None
+    return AsyncAnalysisClient(
+        backend,
+        timeout=float(env.get("AI_TIMEOUT", "8")),
+        max_concurrency=int(env.get("AI_MAX_CONCURRENCY", "4"))
+    )
@@ -0,0 +1,149 @@
+"""
+Постоянный кэш AI-анализов в SQLite с TTL и ограничением размера
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_FILE = 'analysis_cache.sqlite'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS analyses (
+    code TEXT NOT NULL,
+    version TEXT NOT NULL,
+    template TEXT NOT NULL,
+    text TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    PRIMARY KEY (code, version, template)
+);
+CREATE INDEX IF NOT EXISTS idx_analyses_accessed ON analyses(accessed_at);
+"""
+
+
+class AnalysisCache:
+    """Кэш анализов в SQLite (код, версия базы, хэш шаблона) -> текст
+
+    Чтение ничего не пишет на диск: время обращения копится в памяти и
+    записывается одной транзакцией при put, очистке, закрытии или раз в
+    touch_interval секунд. Число записей ведется счетчиком.
+    """
+
+    def __init__(self, db_file: str = DEFAULT_CACHE_FILE, ttl: float = 7 * 24 * 3600,
+                 max_entries: int = 20000, touch_interval: float = 60.0, touch_batch: int = 500):
+        self.db_file = db_file
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.touch_interval = touch_interval
+        self.touch_batch = touch_batch
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # (код, версия, шаблон) -> время последнего чтения, еще не записанное в файл
+        self._touched: Dict[Tuple[str, str, str], float] = {}
+        self._flushed_at = time.monotonic()
+        self._conn = sqlite3.connect(db_file, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # В режиме WAL без fsync на каждую транзакцию файл остается целым; при сбое
+        # теряются лишь последние записи кэша
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM analyses").fetchone()[0]
+        self.purge_expired()
+
+    def get(self, code: str, version: str, template: str) -> Optional[str]:
+        """Анализ из кэша или None (нет записи или она устарела)"""
+        now = time.time()
+        key = (code, version, template)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT text, created_at FROM analyses WHERE code=? AND version=? AND template=?", key
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                self.misses += 1
+                return None
+            self._touched[key] = now
+            if (len(self._touched) >= self.touch_batch
+                    or time.monotonic() - self._flushed_at >= self.touch_interval):
+                self._flush_touched()
+                self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def _flush_touched(self):
+        """Запись накопленных времен обращения (под self._lock, без commit)"""
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE analyses SET accessed_at=? WHERE code=? AND version=? AND template=?",
+                ((accessed_at, *key) for key, accessed_at in self._touched.items())
+            )
+            self._touched.clear()
+        self._flushed_at = time.monotonic()
+
+    def put(self, code: str, version: str, template: str, text: str):
+        """Сохраняет анализ; при превышении размера вытесняет давно не читавшиеся записи"""
+        now = time.time()
+        key = (code, version, template)
+        with self._lock:
+            self._flush_touched()
+            updated = self._conn.execute(
+                "UPDATE analyses SET text=?, created_at=?, accessed_at=? WHERE code=? AND version=? AND template=?",
+                (text, now, now, *key)
+            ).rowcount
+            if not updated:
+                self._conn.execute("INSERT INTO analyses VALUES (?, ?, ?, ?, ?, ?)", (*key, text, now, now))
+                self._count += 1
+            if self._count > self.max_entries:
+                self._count -= self._conn.execute(
+                    "DELETE FROM analyses WHERE rowid IN "
+                    "(SELECT rowid FROM analyses ORDER BY accessed_at LIMIT ?)",
+                    (self._count - self.max_entries,)
+                ).rowcount
+            self._conn.commit()
+
+    def purge_expired(self) -> int:
+        """Удаляет устаревшие записи; возвращает их число"""
+        with self._lock:
+            self._flush_touched()
+            cursor = self._conn.execute("DELETE FROM analyses WHERE created_at < ?", (time.time() - self.ttl,))
+            self._conn.commit()
+            self._count -= cursor.rowcount
+        if cursor.rowcount:
+            logger.info(f"Кэш анализов: удалено устаревших записей: {cursor.rowcount}")
+        return cursor.rowcount
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self), "hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        with self._lock:
+            self._flush_touched()
+            self._conn.commit()
+            self._conn.close()
+
+
+def warm_up(codes: Iterable[str], analyze: Callable[[str], Optional[str]]) -> int:
+    """Прогрев: analyze(code) для каждого кода (сам сохраняет результат в кэш)
+
+    Возвращает число кодов, для которых анализ построен.
+    """
+    started = time.time()
+    done = 0
+    for code in codes:
+        try:
+            if analyze(code) is not None:
+                done += 1
+        except Exception as e:
+            logger.error(f"Ошибка прогрева анализа {code}: {e}")
+    logger.info(f"Прогрев кэша анализов: {done} кодов за {time.time() - started:.1f}с")
+    return done
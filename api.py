@@ -0,0 +1,237 @@
+"""
+REST API только для чтения поверх базы ТН ВЭД: коды, поиск, списки с курсорами и выгрузка
+"""
+
+import csv
+import dataclasses
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import Response, StreamingResponse
+
+from rendering import normalize_product
+
+logger = logging.getLogger(__name__)
+
+API_CACHE_MAX_AGE = int(os.getenv("API_CACHE_MAX_AGE", "300"))
+MAX_PAGE_SIZE = 100
+EXPORT_BATCH_ROWS = 500
+EXPORT_COLUMNS = ('code', 'name', 'description', 'group', 'duty', 'certification', 'restrictions')
+EXPORT_MEDIA_TYPES = {'csv': 'text/csv; charset=utf-8', 'jsonl': 'application/x-ndjson'}
+
+
+class BodyCache:
+    """LRU сериализованных тел ответов по ETag"""
+
+    def __init__(self, max_size: int = 5000):
+        self.max_size = max_size
+        self._bodies: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "not_modified": 0}
+
+    def get_or_build(self, etag: str, build: Callable[[], Dict]) -> bytes:
+        with self._lock:
+            body = self._bodies.get(etag)
+            if body is not None:
+                self._bodies.move_to_end(etag)
+                self.stats["hits"] += 1
+                return body
+
+        body = json.dumps(build(), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        with self._lock:
+            self.stats["misses"] += 1
+            self._bodies[etag] = body
+            if len(self._bodies) > self.max_size:
+                self._bodies.popitem(last=False)
+        return body
+
+    def export_entries(self) -> List[Tuple[str, bytes]]:
+        """Содержимое кэша от давних к свежим (для warm_state)"""
+        with self._lock:
+            return list(self._bodies.items())
+
+    def load_entries(self, entries: Iterable[Tuple[str, bytes]]):
+        """Добавляет сохраненные тела, не вытесняя уже построенные"""
+        with self._lock:
+            for etag, body in reversed(list(entries)):
+                if etag not in self._bodies:
+                    self._bodies[etag] = body
+                    self._bodies.move_to_end(etag, last=False)
+            while len(self._bodies) > self.max_size:
+                self._bodies.popitem(last=False)
+
+
+def make_etag(*parts) -> str:
+    """Сильный ETag из вида запроса, параметров и версии данных"""
+    digest = hashlib.sha1("\0".join(str(part) for part in parts).encode('utf-8')).hexdigest()[:20]
+    return f'"{digest}"'
+
+
+def _opaque_tag(value: str) -> str:
+    """ETag без признака слабого валидатора W/ (If-None-Match сравнивается слабо)"""
+    value = value.strip()
+    return value[2:] if value.startswith('W/') else value
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """If-None-Match содержит etag (или *), в том числе слабый W/"..." """
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = {_opaque_tag(value) for value in header.split(",")}
+    return "*" in candidates or _opaque_tag(etag) in candidates
+
+
+def product_json(product: Dict) -> Dict:
+    """Запись базы в схеме API"""
+    return dataclasses.asdict(normalize_product(product, escape=False))
+
+
+def _export_row(product: Dict) -> Dict:
+    """Запись выгрузки: ставки по странам — JSON, иначе готовая строка пошлин"""
+    row = product_json(product)
+    duties, duty_text = row.pop('duties'), row.pop('duty_text')
+    row['duty'] = json.dumps(duties, ensure_ascii=False) if duties else duty_text
+    return row
+
+
+def export_chunks(items: Iterable[Dict], fmt: str, batch: int = EXPORT_BATCH_ROWS) -> Iterator[bytes]:
+    """Выгрузка пачками: строки CSV (с заголовком) или JSON Lines в UTF-8"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == 'csv' else None
+    if writer:
+        writer.writerow(EXPORT_COLUMNS)
+    count = 0
+    for item in items:
+        row = _export_row(item)
+        if writer:
+            writer.writerow([row[column] if not isinstance(row[column], list) else '; '.join(row[column])
+                             for column in EXPORT_COLUMNS])
+        else:
+            buffer.write(json.dumps(row, ensure_ascii=False, separators=(',', ':')))
+            buffer.write("\n")
+        count += 1
+        if count % batch == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """Потоковое сжатие gzip"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def create_api_router(ved_db, body_cache: Optional[BodyCache] = None) -> APIRouter:
+    """Маршруты /api/... для базы ved_db"""
+    router = APIRouter(prefix="/api")
+    cache = body_cache or BodyCache()
+
+    def respond(request: Request, etag: str, build: Callable[[], Dict]) -> Response:
+        headers = {"ETag": etag, "Cache-Control": f"public, max-age={API_CACHE_MAX_AGE}"}
+        if etag_matches(request, etag):
+            cache.stats["not_modified"] += 1
+            return Response(status_code=304, headers=headers)
+        return Response(cache.get_or_build(etag, build), media_type="application/json", headers=headers)
+
+    def page_response(request: Request, kind: str, query: str, cursor: Optional[str], limit: int) -> Response:
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        etag = make_etag(kind, query, cursor or '', limit, ved_db.snapshot_version())
+        if cursor:
+            # До 304: курсор, чей запрос забыт, не должен подтверждать кэш клиента
+            try:
+                ved_db.validate_cursor(cursor)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+
+        def build() -> Dict:
+            try:
+                page = ved_db.get_page(kind, query, cursor=cursor, page_size=limit)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            return {
+                "query": page.query,
+                "offset": page.shown,
+                "items": [product_json(item) for item in page.items],
+                "next_cursor": page.next_cursor,
+                "version": ved_db.snapshot_version(),
+            }
+
+        return respond(request, etag, build)
+
+    @router.get("/code/{code}")
+    def get_code(code: str, request: Request):
+        code = code.strip()
+        version = ved_db.code_version(code)
+        cert_version = ved_db.certification.version
+        etag = make_etag("code", code, version, cert_version)
+        # Существование — до сравнения ETag: удаленный код дает 404, а не 304
+        if ved_db.find_by_code(code) is None:
+            raise HTTPException(status_code=404, detail=f"Код {code} не найден")
+
+        def build() -> Dict:
+            product = ved_db.find_by_code(code)
+            if product is None:
+                raise HTTPException(status_code=404, detail=f"Код {code} не найден")
+            result = product_json(product)
+            result["requirements"] = ved_db.get_certification_requirements(code)
+            result["version"] = version
+            return result
+
+        return respond(request, etag, build)
+
+    @router.get("/search")
+    def search(request: Request, q: str = Query('', max_length=200), cursor: Optional[str] = None,
+               limit: int = 20):
+        if not cursor and len(q.strip()) < 2:
+            raise HTTPException(status_code=400, detail="Запрос короче 2 символов")
+        return page_response(request, 's', q.strip(), cursor, limit)
+
+    @router.get("/group/{group}")
+    def group(group: str, request: Request, cursor: Optional[str] = None, limit: int = 50):
+        return page_response(request, 'g', group.strip(), cursor, limit)
+
+    @router.get("/prefix/{prefix}")
+    def prefix(prefix: str, request: Request, cursor: Optional[str] = None, limit: int = 50):
+        if not prefix.strip().isdigit():
+            raise HTTPException(status_code=400, detail="Префикс кода должен состоять из цифр")
+        return page_response(request, 'p', prefix.strip(), cursor, limit)
+
+    @router.get("/export")
+    def export(fmt: str = Query('csv', alias='format'), group: Optional[str] = None,
+               prefix: Optional[str] = None, compress: bool = Query(False, alias='gzip')):
+        if fmt not in EXPORT_MEDIA_TYPES:
+            raise HTTPException(status_code=400, detail="format: csv или jsonl")
+        if prefix and not prefix.strip().isdigit():
+            raise HTTPException(status_code=400, detail="Префикс кода должен состоять из цифр")
+
+        version, items = ved_db.iter_export(group, prefix)
+        chunks = export_chunks(items, fmt)
+        filename = f"tnved-{version or 'empty'}.{fmt}"
+        headers = {"X-Data-Version": str(version or ''), "Cache-Control": "no-store"}
+        if compress:
+            chunks = gzip_chunks(chunks)
+            filename += ".gz"
+            media_type = "application/gzip"
+        else:
+            media_type = EXPORT_MEDIA_TYPES[fmt]
+        headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+        logger.info(f"Выгрузка {filename}: группа {group or '-'}, префикс {prefix or '-'}")
+        return StreamingResponse(chunks, media_type=media_type, headers=headers)
+
+    return router
@@ -0,0 +1,143 @@
+"""
+Автодополнение для inline-запросов: префиксы кодов и слов с готовым top-k по популярности
+"""
+
+import heapq
+import logging
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_WORD_RE = re.compile(r'[0-9a-zа-яё]+')
+MIN_TOKEN_LENGTH = 3
+MAX_PREFIX_LENGTH = 12
+
+
+def normalize_tokens(text: str) -> List[str]:
+    """Слова текста в нижнем регистре (ё -> е)"""
+    return _WORD_RE.findall(text.lower().replace('ё', 'е'))
+
+
+class AutocompleteIndex:
+    """Префиксный индекс кодов и слов с top-k по популярности в каждом узле"""
+
+    def __init__(self, ved_db, k: int = 20, popularity: Optional[Dict[str, int]] = None):
+        self.ved_db = ved_db
+        self.k = k
+        self._lock = threading.Lock()
+        self._codes: Dict[str, Tuple[str, ...]] = {}
+        self._words: Dict[str, Tuple[str, ...]] = {}
+        self._texts: Dict[str, str] = {}
+        self._token_codes: Dict[str, List[str]] = {}
+        self._code_tokens: Dict[str, frozenset] = {}
+        self._popularity: Dict[str, int] = {}
+        self.built_at: Optional[float] = None
+        self.rebuild(popularity)
+
+    def rebuild(self, popularity: Optional[Dict[str, int]] = None):
+        """Полная сборка (после загрузки или патча базы)"""
+        started = time.perf_counter()
+        texts: Dict[str, str] = {}
+        code_tokens: Dict[str, frozenset] = {}
+        token_codes: Dict[str, set] = defaultdict(set)
+        for _, item in self.ved_db.iter_all_products():
+            code = item.get('код', '')
+            if not code or code in texts:
+                continue
+            text = item.get('полное_описание') or item.get('описание', '')
+            texts[code] = text
+            tokens = frozenset(token for token in normalize_tokens(f"{item.get('название', '')} {text}")
+                               if len(token) >= MIN_TOKEN_LENGTH and not token.isdigit())
+            code_tokens[code] = tokens
+            for token in tokens:
+                token_codes[token].add(code)
+
+        with self._lock:
+            self._texts = texts
+            self._code_tokens = code_tokens
+            self._token_codes = {token: sorted(codes) for token, codes in token_codes.items()}
+        self.refresh_popularity(popularity)
+        logger.info(f"Индекс автодополнения: {len(texts)} кодов, {len(token_codes)} слов, "
+                    f"{len(self._codes) + len(self._words)} узлов за {time.perf_counter() - started:.2f}с")
+
+    def refresh_popularity(self, popularity: Optional[Dict[str, int]] = None):
+        """Пересчет top-k узлов по новым счетчикам популярности"""
+        popularity = popularity or {}
+        k = self.k
+        rank = self._ranker(popularity)
+
+        code_candidates: Dict[str, List[str]] = defaultdict(list)
+        for code in self._texts:
+            for length in range(1, min(len(code), MAX_PREFIX_LENGTH) + 1):
+                code_candidates[code[:length]].append(code)
+        codes = {prefix: tuple(heapq.nsmallest(k, candidates, key=rank))
+                 for prefix, candidates in code_candidates.items()}
+
+        # Top-k префикса слова — слияние top-k слов с этим префиксом: код из общего
+        # top-k входит в top-k каждого своего слова, поэтому результат точный
+        word_candidates: Dict[str, set] = defaultdict(set)
+        for token, token_codes in self._token_codes.items():
+            best = heapq.nsmallest(k, token_codes, key=rank)
+            for length in range(1, min(len(token), MAX_PREFIX_LENGTH) + 1):
+                word_candidates[token[:length]].update(best)
+        words = {prefix: tuple(heapq.nsmallest(k, candidates, key=rank))
+                 for prefix, candidates in word_candidates.items()}
+
+        with self._lock:
+            self._codes = codes
+            self._words = words
+            self._popularity = popularity
+            self.built_at = time.time()
+
+    @staticmethod
+    def _ranker(popularity: Dict[str, int]):
+        def rank(code: str) -> Tuple[int, str]:
+            # heapq.nsmallest: больше запросов — выше, затем по коду
+            return -popularity.get(code, 0), code
+        return rank
+
+    def suggest(self, query: str, limit: int = 10) -> List[Tuple[str, str]]:
+        """Подсказки (код, полное описание) для введенного текста"""
+        query = (query or '').strip()
+        if not query:
+            return []
+
+        compact = query.replace(' ', '').replace('.', '')
+        if compact.isdigit():
+            codes = self._codes.get(compact[:MAX_PREFIX_LENGTH], ())
+            return [(code, self._texts.get(code, '')) for code in codes[:limit]]
+
+        tokens = normalize_tokens(query)
+        if not tokens:
+            return []
+        last = tokens[-1]
+        required = [token for token in tokens[:-1] if len(token) >= MIN_TOKEN_LENGTH]
+        if not required:
+            codes = self._words.get(last[:MAX_PREFIX_LENGTH], ())[:limit]
+            return [(code, self._texts.get(code, '')) for code in codes]
+
+        # Несколько слов: предыдущие должны встречаться целиком, последнее — префикс.
+        # Кандидаты — коды самого редкого из полных слов
+        lists = [self._token_codes.get(token) for token in required]
+        if not all(lists):
+            return []
+        code_tokens = self._code_tokens
+        candidates = [
+            code for code in min(lists, key=len)
+            if all(token in code_tokens[code] for token in required)
+            and any(token.startswith(last) for token in code_tokens[code])
+        ]
+        best = heapq.nsmallest(limit, candidates, key=self._ranker(self._popularity))
+        return [(code, self._texts.get(code, '')) for code in best]
+
+    def __len__(self) -> int:
+        return len(self._codes) + len(self._words)
+
+
+def popularity_counts(items: Iterable[Tuple[str, int]]) -> Dict[str, int]:
+    """Словарь популярности из пар (код, число запросов)"""
+    return {str(code): int(count) for code, count in items}
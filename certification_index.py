@@ -0,0 +1,175 @@
+"""
+Индекс требований сертификации: код -> требования и требование -> коды по главам
+"""
+
+import bisect
+import json
+import logging
+import os
+import re
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+_TR_TS_RE = re.compile(r'тр\s*[-_]?\s*(тс|еаэс)\s*(\d{3})', re.IGNORECASE)
+_SES_RE = re.compile(r'\bсэс\b|санитарно-эпидемиологическ', re.IGNORECASE)
+
+
+@dataclass(frozen=True)
+class Requirement:
+    """Требование сертификации"""
+    id: str     # нормализованный идентификатор, например "ТР ТС 020"
+    title: str  # полное название
+
+
+def normalize_requirement_id(text: str) -> Optional[str]:
+    """Нормализованный идентификатор требования или None, если текст не распознан"""
+    match = _TR_TS_RE.search(text)
+    if match:
+        return f"ТР {match.group(1).upper()} {match.group(2)}"
+    if _SES_RE.search(text):
+        return "СЭС"
+    return None
+
+
+def extract_requirement_ids(text: str) -> Set[str]:
+    """Все требования, упомянутые в тексте"""
+    ids = {f"ТР {kind.upper()} {number}" for kind, number in _TR_TS_RE.findall(text or '')}
+    if text and _SES_RE.search(text):
+        ids.add("СЭС")
+    return ids
+
+
+class CertificationIndex:
+    """Прямой и обратный индексы требований сертификации
+
+    Связи берутся из текста сертификации товара ("ТР ТС 020", "СЭС") и из
+    раздела "assignments" certification.json (требование -> префиксы кодов).
+    При изменении файла индекс не перестраивается на месте: reloaded()
+    возвращает новый объект, и база подменяет одну ссылку.
+    """
+
+    def __init__(self, cert_file: str = 'certification.json',
+                 products: Iterable[Tuple[str, str]] = ()):
+        """products — пары (код, текст сертификации товара)"""
+        self.cert_file = cert_file
+        self._products: Dict[str, str] = {}
+        for code, text in products:
+            self._products.setdefault(code, text)
+        self._sorted_codes = sorted(self._products)
+
+        self.version: Optional[str] = None
+        self.requirements: Dict[str, Requirement] = {}
+        self.by_code: Dict[str, Tuple[str, ...]] = {}
+        self.by_requirement: Dict[str, Dict[str, List[str]]] = {}
+        self._assignments: List[Tuple[str, str]] = []
+        self._mtime = _file_mtime(cert_file)
+        raw = self._read()
+        self.loaded = raw is not None
+        self._build(raw or {})
+        logger.info(f"Требования сертификации: {len(self.requirements)}, "
+                    f"кодов с требованиями: {len(self.by_code)} (версия {self.version})")
+
+    def _read(self) -> Optional[Dict]:
+        """Содержимое certification.json ({} — файла нет, None — ошибка чтения)"""
+        if self._mtime is None:
+            logger.warning(f"Файл {self.cert_file} не найден, требования сертификации не загружены")
+            return {}
+        try:
+            with open(self.cert_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(f"Ошибка загрузки {self.cert_file}: {e}")
+            return None
+
+    def reloaded(self) -> Optional["CertificationIndex"]:
+        """Новый индекс по изменившемуся файлу (None — файл не менялся или не читается)"""
+        if _file_mtime(self.cert_file) == self._mtime:
+            return None
+        index = CertificationIndex(self.cert_file, self._products.items())
+        return index if index.loaded else None
+
+    def _build(self, raw: Dict):
+        requirements: Dict[str, Requirement] = {}
+        for name, title in (raw.get('requirements') or {}).items():
+            req_id = normalize_requirement_id(name) or name.strip()
+            requirements[req_id] = Requirement(req_id, str(title))
+
+        forward: Dict[str, Set[str]] = {}
+        for code, text in self._products.items():
+            ids = extract_requirement_ids(text)
+            if ids:
+                forward[code] = ids
+
+        # Назначения по префиксам кодов: диапазон в отсортированном списке кодов
+        assignments: List[Tuple[str, str]] = []
+        for name, prefixes in (raw.get('assignments') or {}).items():
+            req_id = normalize_requirement_id(name) or name.strip()
+            for prefix in prefixes:
+                assignments.append((req_id, prefix))
+                start = bisect.bisect_left(self._sorted_codes, prefix)
+                stop = bisect.bisect_left(self._sorted_codes, prefix + '\uffff')
+                for code in self._sorted_codes[start:stop]:
+                    forward.setdefault(code, set()).add(req_id)
+        self._assignments = assignments
+
+        by_requirement: Dict[str, Dict[str, List[str]]] = {}
+        for code in sorted(forward):
+            for req_id in forward[code]:
+                by_requirement.setdefault(req_id, {}).setdefault(code[:2], []).append(code)
+                if req_id not in requirements:
+                    requirements[req_id] = Requirement(req_id, req_id)
+
+        self.requirements = requirements
+        self.by_code = {code: tuple(sorted(ids)) for code, ids in forward.items()}
+        self.by_requirement = by_requirement
+        # Версия из metadata плюс время изменения файла: правка без смены версии тоже видна
+        self.version = f"{(raw.get('metadata') or {}).get('version', '')}@{self._mtime or 0:.0f}"
+
+    def update_product(self, code: str, text: Optional[str]):
+        """Изменение одного товара (патч базы): text=None — товар удален
+
+        Обновляются только записи этого кода в обоих индексах.
+        """
+        for req_id in self.by_code.pop(code, ()):
+            chapter_codes = self.by_requirement.get(req_id, {}).get(code[:2], [])
+            if code in chapter_codes:
+                chapter_codes.remove(code)
+
+        if text is None:
+            if self._products.pop(code, None) is not None:
+                del self._sorted_codes[bisect.bisect_left(self._sorted_codes, code)]
+            return
+        if code not in self._products:
+            bisect.insort(self._sorted_codes, code)
+        self._products[code] = text
+
+        ids = extract_requirement_ids(text)
+        ids.update(req_id for req_id, prefix in self._assignments if code.startswith(prefix))
+        if not ids:
+            return
+        self.by_code[code] = tuple(sorted(ids))
+        for req_id in ids:
+            bisect.insort(self.by_requirement.setdefault(req_id, {}).setdefault(code[:2], []), code)
+            if req_id not in self.requirements:
+                self.requirements[req_id] = Requirement(req_id, req_id)
+
+    def requirements_for(self, code: str) -> List[Requirement]:
+        """Требования для кода"""
+        return [self.requirements[req_id] for req_id in self.by_code.get(code, ())]
+
+    def codes_for(self, requirement: str, chapter: Optional[str] = None) -> List[str]:
+        """Коды, для которых нужно требование (в главе chapter или во всех)"""
+        req_id = normalize_requirement_id(requirement) or requirement.strip()
+        chapters = self.by_requirement.get(req_id, {})
+        if chapter is not None:
+            return list(chapters.get(chapter.zfill(2), []))
+        return [code for chapter_codes in chapters.values() for code in chapter_codes]
+
+
+def _file_mtime(path: str) -> Optional[float]:
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
@@ -0,0 +1,130 @@
+"""
+Бюджет времени запроса: стадии смотрят на остаток и при его нехватке отвечают проще
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+from profiler import profiler
+
+logger = logging.getLogger(__name__)
+
+# Запас на отправку ответа, секунды
+SEND_RESERVE = 1.0
+# Меньше этого остатка модель не вызывается
+MIN_AI_SECONDS = 2.0
+# Остаток меньше этой доли бюджета считается малым
+LOW_BUDGET_FRACTION = 0.25
+
+
+class DeadlineStats:
+    """Превышения бюджета и упрощения ответа по стадиям"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {'count': 0, 'over_budget': 0, 'degraded': 0}
+        self.stages: Dict[str, Dict] = {}
+
+    def _stage(self, name: str) -> Dict:
+        return self.stages.setdefault(name, {'count': 0, 'overruns': 0, 'max_over_ms': 0.0, 'degraded': {}})
+
+    def record_stage(self, name: str, over: float):
+        """over — на сколько секунд стадия закончилась позже бюджета (<= 0 — уложилась)"""
+        with self._lock:
+            stage = self._stage(name)
+            stage['count'] += 1
+            if over > 0:
+                stage['overruns'] += 1
+                stage['max_over_ms'] = max(stage['max_over_ms'], round(over * 1000, 1))
+
+    def record_degrade(self, name: str, how: str):
+        with self._lock:
+            degraded = self._stage(name)['degraded']
+            degraded[how] = degraded.get(how, 0) + 1
+
+    def record_request(self, over: float, degraded: bool):
+        with self._lock:
+            self.requests['count'] += 1
+            self.requests['over_budget'] += over > 0
+            self.requests['degraded'] += degraded
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                'requests': dict(self.requests),
+                'stages': {name: dict(stage, degraded=dict(stage['degraded']))
+                           for name, stage in self.stages.items()},
+            }
+
+
+deadline_stats = DeadlineStats()
+
+
+class Deadline:
+    """Бюджет времени одного запроса; budget=None — без ограничения
+
+    Из бюджета заранее вычитается запас на отправку ответа (reserve).
+    """
+
+    def __init__(self, budget: Optional[float], reserve: float = SEND_RESERVE,
+                 stats: Optional[DeadlineStats] = None):
+        self.budget = budget
+        self.reserve = reserve
+        self.stats = stats or deadline_stats
+        self.started = time.monotonic()
+        self.degraded: Dict[str, str] = {}
+
+    @property
+    def limited(self) -> bool:
+        return self.budget is not None
+
+    def remaining(self) -> float:
+        """Остаток на обработку (без запаса на отправку), секунды"""
+        if self.budget is None:
+            return float('inf')
+        return self.started + self.budget - self.reserve - time.monotonic()
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def low(self, fraction: float = LOW_BUDGET_FRACTION) -> bool:
+        """Остаток меньше доли бюджета"""
+        return self.budget is not None and self.remaining() < self.budget * fraction
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator["Deadline"]:
+        """Стадия запроса: замер профилировщиком и учет превышения бюджета"""
+        with profiler.stage(name):
+            try:
+                yield self
+            finally:
+                if self.budget is not None:
+                    self.stats.record_stage(name, -self.remaining())
+
+    def degrade(self, stage: str, how: str):
+        """Стадия ответила проще из-за нехватки бюджета"""
+        if self.budget is None:
+            return
+        self.degraded[stage] = how
+        self.stats.record_degrade(stage, how)
+
+    def finish(self) -> float:
+        """Конец запроса: учет в статистике; превышение полного бюджета в секундах"""
+        if self.budget is None:
+            return 0.0
+        elapsed = time.monotonic() - self.started
+        over = elapsed - self.budget
+        self.stats.record_request(over, bool(self.degraded))
+        if over > 0:
+            logger.warning(f"Запрос превысил бюджет {self.budget:.1f}с на {over * 1000:.0f}мс"
+                           f"{', упрощено: ' + str(self.degraded) if self.degraded else ''}")
+        elif self.degraded:
+            logger.info(f"Ответ упрощен для бюджета {self.budget:.1f}с: {self.degraded}")
+        return over
+
+
+# Запросы без бюджета (прогрев, REST API): не истекает и в статистику не попадает
+NO_DEADLINE = Deadline(None)
@@ -0,0 +1,251 @@
+"""
+Типизированная таблица ставок пошлин в массивах NumPy
+"""
+
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Виды ставок
+NOT_SET = 0
+AD_VALOREM = 1
+SPECIFIC = 2
+COMBINED = 3
+
+_PERCENT_RE = re.compile(r'^(\d+(?:[.,]\d+)?)\s*%?$')
+_NUMBER_RE = re.compile(r'(\d+(?:[.,]\d+)?)\s*(%?)')
+
+_OPS = {
+    '==': np.equal,
+    '!=': np.not_equal,
+    '<': np.less,
+    '<=': np.less_equal,
+    '>': np.greater,
+    '>=': np.greater_equal,
+}
+
+
+def parse_duty(value: Any) -> Tuple[int, Optional[float], Optional[float], Optional[str]]:
+    """Разбор ставки: (вид, адвалорная %, специфическая ставка, единица)
+
+    Примеры: 5 или "5%" — адвалорная; "0,3 евро/кг" — специфическая;
+    "10%, но не менее 0,3 евро за 1 кг" — комбинированная; "-" — не установлена.
+    """
+    if value is None or isinstance(value, bool):
+        return NOT_SET, None, None, None
+    if isinstance(value, (int, float)):
+        return AD_VALOREM, float(value), None, None
+
+    text = str(value).strip()
+    if not text or text in ('-', '—', '–'):
+        return NOT_SET, None, None, None
+
+    match = _PERCENT_RE.match(text)
+    if match:
+        return AD_VALOREM, float(match.group(1).replace(',', '.')), None, None
+
+    ad_valorem = None
+    specific = None
+    unit = None
+    for number in _NUMBER_RE.finditer(text):
+        amount = float(number.group(1).replace(',', '.'))
+        if number.group(2):
+            if ad_valorem is None:
+                ad_valorem = amount
+        elif specific is None:
+            specific = amount
+            unit = text[number.end():].strip(' ,.;') or None
+
+    if ad_valorem is not None and specific is not None:
+        return COMBINED, ad_valorem, specific, unit
+    if ad_valorem is not None:
+        return AD_VALOREM, ad_valorem, None, None
+    if specific is not None:
+        return SPECIFIC, None, specific, unit
+    return NOT_SET, None, None, None
+
+
+def ad_valorem_rate(value: Any) -> Optional[float]:
+    """Адвалорная ставка в процентах или None, если ее нет"""
+    return parse_duty(value)[1]
+
+
+def format_duty(value: Any) -> str:
+    """Ставка для отображения"""
+    kind, percent, specific, unit = parse_duty(value)
+    if kind == NOT_SET:
+        return "не установлена"
+    if kind == AD_VALOREM:
+        return f"{percent:g}%"
+    if kind == SPECIFIC:
+        return f"{specific:g} {unit or ''}".strip()
+    return f"{percent:g}% + {specific:g} {unit or ''}".strip()
+
+
+class DutyTable:
+    """Ставки пошлин в массивах: строка — код, столбец — страна"""
+
+    def __init__(self, rows: Iterable[Tuple[str, str, Dict]]):
+        """rows — тройки (код, группа, duties); повторные коды пропускаются"""
+        codes: List[str] = []
+        groups: List[str] = []
+        duties_list: List[Dict] = []
+        seen = set()
+        for code, group, duties in rows:
+            if code in seen:
+                continue
+            seen.add(code)
+            codes.append(code)
+            groups.append(group)
+            duties_list.append(duties if isinstance(duties, dict) else {})
+
+        countries = {'base': None}
+        for duties in duties_list:
+            for country in duties:
+                countries.setdefault(str(country), None)
+        self.countries: List[str] = list(countries)
+        self.columns = {country: i for i, country in enumerate(self.countries)}
+        self.codes = codes
+        self.rows = {code: i for i, code in enumerate(codes)}
+
+        shape = (len(codes), len(self.countries))
+        self.kind = np.zeros(shape, dtype=np.int8)
+        self.ad_valorem = np.full(shape, np.nan, dtype=np.float32)
+        self.specific = np.full(shape, np.nan, dtype=np.float32)
+        self.units: Dict[Tuple[int, int], str] = {}
+        self.chapter = np.array([_chapter(code, group) for code, group in zip(codes, groups)], dtype=np.int16)
+        # Живые строки: после удаления по патчу и в резерве под добавления — False
+        self.alive = np.ones(len(codes), dtype=bool)
+        self._size = len(codes)
+
+        for row, duties in enumerate(duties_list):
+            for country, value in duties.items():
+                self._set(row, self.columns[str(country)], value)
+
+    def _set(self, row: int, column: int, value: Any):
+        kind, percent, specific, unit = parse_duty(value)
+        self.kind[row, column] = kind
+        self.ad_valorem[row, column] = np.nan if percent is None else percent
+        self.specific[row, column] = np.nan if specific is None else specific
+        if unit:
+            self.units[(row, column)] = unit
+        else:
+            self.units.pop((row, column), None)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def upsert(self, code: str, group: str, duties: Optional[Dict]):
+        """Добавление или замена ставок кода (применение патча)
+
+        duties=None — ставки существующего кода не меняются (только глава).
+        Новые строки берутся из резерва, который растет удвоением, поэтому
+        добавление амортизированно O(1). Новая страна добавляет столбец (копия массивов).
+        """
+        row = self.rows.get(code)
+        if duties is None and row is not None:
+            self.chapter[row] = _chapter(code, group)
+            return
+        duties = duties if isinstance(duties, dict) else {}
+        for country in duties:
+            if str(country) not in self.columns:
+                self._add_column(str(country))
+
+        if row is None:
+            if self._size == len(self.alive):
+                self._grow(max(16, 2 * len(self.alive)))
+            row = self._size
+            self._size += 1
+            self.rows[code] = row
+            self.codes.append(code)
+            self.alive[row] = True
+        for column in range(len(self.countries)):
+            self._set(row, column, None)
+        for country, value in duties.items():
+            self._set(row, self.columns[str(country)], value)
+        self.chapter[row] = _chapter(code, group)
+
+    def remove(self, code: str):
+        """Удаление кода: строка остается в массивах, но исключается из выборок"""
+        row = self.rows.pop(code, None)
+        if row is not None:
+            self.alive[row] = False
+
+    def _grow(self, capacity: int):
+        extra = capacity - len(self.alive)
+        columns = len(self.countries)
+        self.kind = np.vstack([self.kind, np.zeros((extra, columns), dtype=np.int8)])
+        self.ad_valorem = np.vstack([self.ad_valorem, np.full((extra, columns), np.nan, dtype=np.float32)])
+        self.specific = np.vstack([self.specific, np.full((extra, columns), np.nan, dtype=np.float32)])
+        self.chapter = np.concatenate([self.chapter, np.full(extra, -1, dtype=np.int16)])
+        self.alive = np.concatenate([self.alive, np.zeros(extra, dtype=bool)])
+
+    def _add_column(self, country: str):
+        self.columns[country] = len(self.countries)
+        self.countries.append(country)
+        rows = len(self.alive)
+        self.kind = np.hstack([self.kind, np.zeros((rows, 1), dtype=np.int8)])
+        self.ad_valorem = np.hstack([self.ad_valorem, np.full((rows, 1), np.nan, dtype=np.float32)])
+        self.specific = np.hstack([self.specific, np.full((rows, 1), np.nan, dtype=np.float32)])
+
+    def rate(self, code: str, country: str = 'base') -> Optional[float]:
+        """Адвалорная ставка кода для страны (None — не установлена)"""
+        row = self.rows.get(code)
+        column = self.columns.get(country)
+        if row is None or column is None:
+            return None
+        value = self.ad_valorem[row, column]
+        return None if np.isnan(value) else float(value)
+
+    def _column(self, country: str) -> np.ndarray:
+        column = self.columns.get(country)
+        if column is None:
+            return np.full(len(self.alive), np.nan, dtype=np.float32)
+        return self.ad_valorem[:, column]
+
+    def _chapter_mask(self, chapter: Optional[str]) -> np.ndarray:
+        if chapter is None:
+            return np.ones(len(self.alive), dtype=bool)
+        return self.chapter == int(chapter)
+
+    def _codes(self, mask: np.ndarray) -> List[str]:
+        return [self.codes[i] for i in np.flatnonzero(mask & self.alive)]
+
+    def select(self, country: str = 'base', op: str = '==', value: float = 0,
+               chapter: Optional[str] = None) -> List[str]:
+        """Коды, у которых адвалорная ставка страны удовлетворяет условию
+
+        Пример: select('base', '==', 0, chapter='85') — беспошлинные коды главы 85.
+        Неустановленные ставки (NaN) условию не удовлетворяют.
+        """
+        column = self._column(country)
+        with np.errstate(invalid='ignore'):
+            mask = _OPS[op](column, value) & ~np.isnan(column)
+        return self._codes(mask & self._chapter_mask(chapter))
+
+    def compare(self, country: str, other: str = 'base', op: str = '>',
+                chapter: Optional[str] = None) -> List[str]:
+        """Коды, где ставка country op ставка other (обе должны быть установлены)
+
+        Пример: compare('china', 'base', '>') — ставка для Китая выше базовой.
+        """
+        left, right = self._column(country), self._column(other)
+        with np.errstate(invalid='ignore'):
+            mask = _OPS[op](left, right) & ~np.isnan(left) & ~np.isnan(right)
+        return self._codes(mask & self._chapter_mask(chapter))
+
+    def not_set(self, country: str = 'base', chapter: Optional[str] = None) -> List[str]:
+        """Коды без установленной ставки для страны"""
+        column = self.columns.get(country)
+        if column is None:
+            return self._codes(self._chapter_mask(chapter))
+        return self._codes((self.kind[:, column] == NOT_SET) & self._chapter_mask(chapter))
+
+
+def _chapter(code: str, group: str) -> int:
+    """Номер главы: из группы, иначе из первых двух цифр кода (-1, если не число)"""
+    for candidate in (group, code[:2]):
+        if candidate and candidate[:2].isdigit():
+            return int(candidate[:2])
+    return -1
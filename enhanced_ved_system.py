@@ -7,20 +7,21 @@ import json
 import re
 import hashlib
 import logging
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
 from dataclasses import dataclass
 from pathlib import Path
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('ved_expert.log'),
-        logging.StreamHandler()
-    ]
-)
+from product_cards import card_cache
+from duty_table import format_duty
+from ai_pipeline import ANALYSIS_PROMPT_TEMPLATE, AsyncAnalysisClient, template_hash
+from analysis_cache import AnalysisCache
+from rendering import normalize_product, render_official_data
+from sharded_search import ShardedSearch
+from ved_router import generate_ai_analysis
+
 logger = logging.getLogger('VEDExpert')
 
 @dataclass
@@ -50,25 +51,97 @@ class EnhancedCache:
     def _generate_key(self, query: str) -> str:
         return hashlib.md5(query.lower().encode()).hexdigest()
     
-    def get(self, query: str) -> Optional[Dict]:
+    def get(self, query: str, count: bool = True) -> Optional[Dict]:
+        """Запись кэша; count=False — без учета в статистике (повторная проверка)"""
         key = self._generate_key(query)
         if key in self.cache:
             timestamp, value = self.cache[key]
             if datetime.now() - timestamp < self.ttl:
-                self.stats["hits"] += 1
-                logger.debug(f"Cache HIT for query: {query[:20]}...")
+                if count:
+                    self.stats["hits"] += 1
+                logger.debug("Cache HIT for query: %.20s...", query)
                 return value
             else:
-                del self.cache[key]
+                self.cache.pop(key, None)
         
-        self.stats["misses"] += 1
-        logger.debug(f"Cache MISS for query: {query[:20]}...")
+        if count:
+            self.stats["misses"] += 1
+        logger.debug("Cache MISS for query: %.20s...", query)
         return None
     
     def set(self, query: str, value: Dict):
         key = self._generate_key(query)
         self.cache[key] = (datetime.now(), value)
-        logger.debug(f"Cached result for query: {query[:20]}...")
+        logger.debug("Cached result for query: %.20s...", query)
+    
+    def export_entries(self) -> Dict[str, Tuple[datetime, Dict]]:
+        """Содержимое кэша (для warm_state)"""
+        return dict(self.cache)
+    
+    def load_entries(self, entries: Dict[str, Tuple[datetime, Dict]]):
+        """Добавляет сохраненные записи, у которых не истек TTL"""
+        now = datetime.now()
+        for key, (timestamp, value) in entries.items():
+            if key not in self.cache and now - timestamp < self.ttl:
+                self.cache[key] = (timestamp, value)
+
+class SingleFlight:
+    """Объединение одинаковых одновременных запросов
+    
+    Первый вызов с ключом выполняет функцию, остальные вызовы с тем же ключом,
+    пришедшие до ее завершения, ждут тот же результат (или то же исключение).
+    """
+    
+    def __init__(self, timeout: Optional[float] = 30.0):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Future] = {}
+        self.stats = {"calls": 0, "executed": 0, "shared": 0, "rechecked": 0, "timeouts": 0}
+    
+    def _count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+    
+    def do(self, key: str, fn: Callable, recheck: Optional[Callable] = None):
+        """fn() для ключа; recheck() — повторная проверка кэша ведущим вызовом
+        
+        Ведущий вызов сначала вызывает recheck: результат мог попасть в кэш
+        между промахом вызывающего и захватом ключа. Ожидающий вызов ждет
+        не дольше timeout и затем выполняет fn() сам.
+        """
+        with self._lock:
+            self.stats["calls"] += 1
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+            else:
+                self.stats["shared"] += 1
+        
+        if not leader:
+            try:
+                return future.result(self.timeout)
+            except FutureTimeoutError:
+                self._count("timeouts")
+                logger.warning(f"Ожидание объединенного запроса превысило {self.timeout}с, выполняется свой")
+                return fn()
+        
+        try:
+            result = recheck() if recheck is not None else None
+            if result is not None:
+                self._count("rechecked")
+            else:
+                self._count("executed")
+                result = fn()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
 
 class SmartQueryParser:
     """Умный парсер пользовательских запросов"""
@@ -110,7 +183,7 @@ class SmartQueryParser:
             result['search_type'] = 'tnved_code'
             result['codes'] = tnved_codes
             result['confidence'] = 1.0
-            logger.info(f"Detected TNVED codes: {tnved_codes}")
+            logger.debug("Detected TNVED codes: %s", tnved_codes)
             return result
         
         # Поиск HS кодов
@@ -119,7 +192,7 @@ class SmartQueryParser:
             result['search_type'] = 'hs_code'
             result['codes'] = hs_codes
             result['confidence'] = 0.8
-            logger.info(f"Detected HS codes: {hs_codes}")
+            logger.debug("Detected HS codes: %s", hs_codes)
             return result
         
         # Поиск по синонимам
@@ -135,14 +208,14 @@ class SmartQueryParser:
             result['search_type'] = 'category_match'
             result['keywords'] = matched_categories
             result['confidence'] = 0.9
-            logger.info(f"Matched categories: {matched_categories}")
+            logger.debug("Matched categories: %s", matched_categories)
             return result
         
         # Общий текстовый поиск
         result['search_type'] = 'text_search'
         result['keywords'] = query_lower.split()
         result['confidence'] = 0.5
-        logger.info(f"Text search with keywords: {result['keywords']}")
+        logger.debug("Text search with keywords: %s", result['keywords'])
         
         return result
 
@@ -157,8 +230,12 @@ class EnhancedVEDDatabase:
         
         self.data_path = data_path
         self.database = {}
+        self.version = None
         self.cache = EnhancedCache()
+        self.single_flight = SingleFlight()
         self.parser = SmartQueryParser()
+        # Необязательный шардированный поиск по тексту (enable_sharded_search)
+        self.sharded_search: Optional[ShardedSearch] = None
         
         self._load_database()
         logger.info("EnhancedVEDDatabase initialized successfully")
@@ -167,8 +244,9 @@ class EnhancedVEDDatabase:
         """Загружает базу данных"""
         try:
             db_file = self.data_path / "tnved_database.json"
-            with open(db_file, "r", encoding="utf-8") as f:
-                self.database = json.load(f)
+            raw_bytes = db_file.read_bytes()
+            self.database = json.loads(raw_bytes.decode("utf-8"))
+            self.version = hashlib.sha1(raw_bytes).hexdigest()[:12]
             
             codes_count = len(self.database.get("codes", []))
             logger.info(f"Database loaded: {codes_count} products")
@@ -187,6 +265,25 @@ class EnhancedVEDDatabase:
         if cached_result:
             return SearchResult(**cached_result)
         
+        def recheck() -> Optional[SearchResult]:
+            cached_result = self.cache.get(query, count=False)
+            return SearchResult(**cached_result) if cached_result else None
+        
+        # Одинаковые запросы, пришедшие до заполнения кэша, ждут один поиск
+        return self.single_flight.do(query.lower(), lambda: self._search_and_cache(query), recheck)
+    
+    def get_search_stats(self) -> Dict[str, int]:
+        """Статистика кэша поиска и объединения запросов (shared — сэкономленные поиски)"""
+        return {
+            "cache_hits": self.cache.stats["hits"],
+            "cache_misses": self.cache.stats["misses"],
+            "searches_executed": self.single_flight.stats["executed"],
+            "searches_shared": self.single_flight.stats["shared"],
+            "searches_rechecked": self.single_flight.stats["rechecked"],
+        }
+    
+    def _search_and_cache(self, query: str) -> SearchResult:
+        """Поиск без кэша; результат сохраняется в кэш"""
         # Парсим запрос
         parsed = self.parser.parse_query(query)
         result = None
@@ -219,7 +316,7 @@ class EnhancedVEDDatabase:
             'search_type': search_type
         })
         
-        logger.info(f"Search completed: {search_type}, confidence: {confidence}")
+        logger.debug("Search completed: %s, confidence: %s", search_type, confidence)
         return search_result
     
     def _search_by_code(self, code: str) -> Optional[Dict]:
@@ -238,8 +335,25 @@ class EnhancedVEDDatabase:
                     return product
         return None
     
+    def enable_sharded_search(self, shards: Optional[int] = None) -> ShardedSearch:
+        """Поиск по тексту через процессы-шарды по главам (см. sharded_search.py)"""
+        if self.sharded_search is None:
+            self.sharded_search = ShardedSearch(shards)
+        self.sharded_search.build(
+            ((position, str(product.get("code", ""))[:2],
+              f"{product.get('name', '')} {product.get('description', '')}".lower())
+             for position, product in enumerate(self.database.get("codes", []))),
+            self.version
+        )
+        return self.sharded_search
+    
     def _search_by_text(self, keywords: List[str]) -> Optional[Dict]:
         """Поиск по тексту"""
+        if self.sharded_search is not None and self.sharded_search.version == self.version:
+            hits = self.sharded_search.search_keywords(keywords, 1)
+            if hits is not None:
+                return self.database["codes"][hits[0][1]] if hits else None
+        
         best_match = None
         best_score = 0
         
@@ -260,17 +374,23 @@ class EnhancedVEDDatabase:
 class GensparktVEDIntegration:
     """Интеграция с Genspark для профессионального анализа"""
     
-    def __init__(self, genspark_agent):
+    def __init__(self, genspark_agent, analysis_client: Optional[AsyncAnalysisClient] = None,
+                 analysis_cache: Optional[AnalysisCache] = None):
         self.genspark_agent = genspark_agent
+        # Асинхронный клиент с таймаутом и объединением запросов (ai_pipeline)
+        self.analysis_client = analysis_client
+        # Постоянный кэш анализов (код, версия базы, хэш шаблона и вопроса)
+        self.analysis_cache = analysis_cache
         logger.info("GensparktVEDIntegration initialized")
     
-    def analyze_with_context(self, official_data: Dict, user_query: str) -> VEDAnalysis:
-        """Анализ с контекстом официальных данных"""
+    def analyze_with_context(self, official_data: Dict, user_query: str,
+                             version: Optional[str] = None) -> VEDAnalysis:
+        """Анализ с контекстом официальных данных (version — версия базы для кэша)"""
         
         if not official_data:
             # Если нет официальных данных, используем только Genspark
             logger.warning("No official data found, using Genspark only")
-            genspark_result = self._get_genspark_analysis(user_query)
+            genspark_result, _ = self._run_analysis(user_query, key=user_query)
             
             return VEDAnalysis(
                 official_data={},
@@ -281,20 +401,18 @@ class GensparktVEDIntegration:
         
         # Формируем контекст для Genspark
         context = self._format_official_context(official_data)
-        enhanced_query = f"""
-Официальные данные ТН ВЭД:
-{context}
-
-Пользователь спрашивает: {user_query}
-
-Проанализируй и дополни официальную информацию:
-1. Подтверди правильность классификации
-2. Добавь практические советы по импорту/экспорту
-3. Укажи возможные альтернативы или похожие товары
-4. Предупреди о потенциальных сложностях
-"""
+        enhanced_query = ANALYSIS_PROMPT_TEMPLATE.format(context=context, user_query=user_query)
         
-        genspark_analysis = self._get_genspark_analysis(enhanced_query)
+        code = official_data.get('code')
+        template = template_hash(ANALYSIS_PROMPT_TEMPLATE, user_query)
+        use_cache = self.analysis_cache is not None and bool(version) and bool(code)
+        genspark_analysis = self.analysis_cache.get(code, version, template) if use_cache else None
+        if genspark_analysis is None:
+            genspark_analysis, source = self._run_analysis(
+                enhanced_query, key=f"{version}:{code}:{template}", official_data=official_data
+            )
+            if use_cache and source == 'backend':  # шаблон и заглушка не кэшируются
+                self.analysis_cache.put(code, version, template, genspark_analysis)
         
         return VEDAnalysis(
             official_data=official_data,
@@ -314,7 +432,7 @@ class GensparktVEDIntegration:
         
         duties = data.get('duties', {})
         if duties:
-            duties_text = "Пошлины: " + ", ".join([f"{k}: {v}%" for k, v in duties.items()])
+            duties_text = "Пошлины: " + ", ".join([f"{k}: {format_duty(v)}" for k, v in duties.items()])
             context_parts.append(duties_text)
         
         cert = data.get('certification', [])
@@ -327,6 +445,15 @@ class GensparktVEDIntegration:
         
         return "\n".join(context_parts)
     
+    def _run_analysis(self, query: str, key: str, official_data: Optional[Dict] = None) -> Tuple[str, str]:
+        """Анализ через асинхронный клиент (если подключен): (текст, источник)"""
+        if self.analysis_client is None:
+            return self._get_genspark_analysis(query), 'genspark'
+        fallback = (lambda: generate_ai_analysis(official_data)) if official_data \
+            else (lambda: "Анализ Genspark AI временно недоступен")
+        result = self.analysis_client.analyze_sync(key, query, fallback)
+        return result.text, result.source
+
     def _get_genspark_analysis(self, query: str) -> str:
         """Получает анализ от Genspark"""
         try:
@@ -335,21 +462,21 @@ class GensparktVEDIntegration:
             
             # Заглушка для демонстрации
             result = f"Анализ Genspark AI для запроса: {query[:50]}... (интеграция с реальным агентом)"
-            logger.info("Genspark analysis completed")
+            logger.debug("Genspark analysis completed")
             return result
             
         except Exception as e:
             logger.error(f"Genspark analysis failed: {e}")
             return "Анализ Genspark AI временно недоступен"
 
-def format_enhanced_response(analysis: VEDAnalysis) -> str:
+def format_enhanced_response(analysis: VEDAnalysis, version: Optional[str] = None) -> str:
     """Форматирует расширенный ответ пользователю"""
     
     blocks = []
     
     # Официальные данные (приоритет)
     if analysis.official_data:
-        official_block = format_official_data(analysis.official_data)
+        official_block = format_official_data(analysis.official_data, version)
         blocks.append(f"📊 *ОФИЦИАЛЬНЫЕ ДАННЫЕ ТН ВЭД:*\n{official_block}")
     
     # Анализ Genspark
@@ -363,51 +490,37 @@ def format_enhanced_response(analysis: VEDAnalysis) -> str:
     
     return "\n\n".join(blocks)
 
-def format_official_data(data: Dict) -> str:
-    """Форматирует официальные данные"""
-    lines = [
-        f"📌 **{data.get('name', 'Товар')}**",
-        f"🔢 Код: `{data.get('code', 'Н/Д')}`",
-        f"📝 {data.get('description', 'Описание отсутствует')}"
-    ]
-    
-    duties = data.get('duties', {})
-    if duties:
-        duties_lines = ["💰 **Пошлины:**"]
-        for country, rate in duties.items():
-            country_name = {
-                'base': 'Базовая ставка',
-                'china': 'Китай',
-                'eu': 'ЕС',
-                'usa': 'США'
-            }.get(country, country.capitalize())
-            duties_lines.append(f"  • {country_name}: {rate}%")
-        lines.extend(duties_lines)
-    
-    cert = data.get('certification', [])
-    if cert:
-        lines.append(f"📄 **Сертификация:** {', '.join(cert)}")
-    
-    restrictions = data.get('restrictions', [])
-    if restrictions:
-        lines.append(f"⚠️ **Ограничения:** {', '.join(restrictions)}")
-    else:
-        lines.append("✅ **Ограничения:** отсутствуют")
-    
-    return "\n".join(lines)
+def format_official_data(data: Dict, version: Optional[str] = None) -> str:
+    """Форматирует официальные данные (с кэшем по версии базы и коду)"""
+    return card_cache.get_or_render(
+        'enhanced', version, str(data.get('code') or data.get('код') or ''), lambda: _render_official_data(data)
+    )
+
+def _render_official_data(data: Dict) -> str:
+    """Отрисовка блока официальных данных"""
+    return render_official_data(normalize_product(data))
 
 # Основной класс системы
 class EnhancedVEDExpertSystem:
     """Расширенная система ВЭД Эксперт"""
     
-    def __init__(self, genspark_agent=None):
+    def __init__(self, genspark_agent=None, analysis_client: Optional[AsyncAnalysisClient] = None,
+                 analysis_cache: Optional[AnalysisCache] = None):
         self.database = EnhancedVEDDatabase()
-        self.genspark_integration = GensparktVEDIntegration(genspark_agent) if genspark_agent else None
+        self.genspark_integration = (
+            GensparktVEDIntegration(genspark_agent, analysis_client, analysis_cache) if genspark_agent else None
+        )
         logger.info("EnhancedVEDExpertSystem initialized")
     
+    def register_warm_state(self, warm_state):
+        """Кэш поиска переживает перезапуск при той же версии базы (см. warm_state.py)"""
+        cache = self.database.cache
+        warm_state.register('enhanced_cache', cache.export_entries, cache.load_entries,
+                            version=lambda: self.database.version)
+    
     def process_query(self, query: str) -> str:
         """Обрабатывает запрос пользователя"""
-        logger.info(f"Processing query: {query[:50]}...")
+        logger.debug("Processing query: %.50s...", query)
         
         # Поиск в официальной базе
         search_result = self.database.smart_search(query)
@@ -415,20 +528,23 @@ class EnhancedVEDExpertSystem:
         # Анализ через Genspark (если доступен)
         if self.genspark_integration:
             analysis = self.genspark_integration.analyze_with_context(
-                search_result.product, query
+                search_result.product, query, self.database.version
             )
-            response = format_enhanced_response(analysis)
+            response = format_enhanced_response(analysis, self.database.version)
         else:
             # Только официальные данные
             if search_result.product:
-                response = f"📊 *Найден товар:*\n{format_official_data(search_result.product)}"
+                response = f"📊 *Найден товар:*\n{format_official_data(search_result.product, self.database.version)}"
             else:
                 response = "❌ Товар не найден в официальной базе ТН ВЭД"
         
-        logger.info(f"Query processed, confidence: {search_result.confidence}")
+        logger.debug("Query processed, confidence: %s", search_result.confidence)
         return response
 
 if __name__ == "__main__":
+    from logging_setup import setup_logging
+    setup_logging(log_file='ved_expert.log', structured=False)
+
     # Тестирование системы
     system = EnhancedVEDExpertSystem()
     
@@ -444,4 +560,5 @@ if __name__ == "__main__":
         print("-" * 50)
         result = system.process_query(query)
         print(result)
-        print("=" * 50)
\ No newline at end of file
+        print("=" * 50)
+    print(f"\nСтатистика поиска: {system.database.get_search_stats()}")
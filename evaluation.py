@@ -0,0 +1,309 @@
+"""
+Оценка точности, скорости и калибровки путей классификации и поиска на размеченном наборе
+"""
+
+import json
+import logging
+import re
+import statistics
+import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DATASET = 'evaluation_dataset.jsonl'
+TOP_K = 5
+CALIBRATION_BINS = 10
+CODE_PATTERN = re.compile(r'\b\d{10}\b')
+
+# Ранжированные коды и уверенность в первом (None — путь ее не возвращает)
+Prediction = Tuple[List[str], Optional[float]]
+
+
+@dataclass
+class EvalItem:
+    """Размеченный запрос; expected — допустимые коды или их префиксы ("1806" — любой код позиции)"""
+    id: str
+    query: str
+    expected: List[str]
+    material: str = ''
+    function: str = ''
+
+
+def load_dataset(path: str = DEFAULT_DATASET) -> List[EvalItem]:
+    """Набор из JSON Lines; ValueError при ошибке разметки"""
+    items = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            raw = json.loads(line)
+            expected = raw.get('expected')
+            if isinstance(expected, str):
+                expected = [expected]
+            if not raw.get('query') or not expected:
+                raise ValueError(f"{path}:{number}: нужны query и expected")
+            items.append(EvalItem(
+                id=str(raw.get('id') or number),
+                query=raw['query'],
+                expected=[str(code) for code in expected],
+                material=raw.get('material', ''),
+                function=raw.get('function', ''),
+            ))
+    return items
+
+
+def is_match(code: str, expected: List[str]) -> bool:
+    return any(code.startswith(label) for label in expected)
+
+
+def codes_in_text(text: Optional[str]) -> List[str]:
+    """Коды ТН ВЭД в ответе в порядке появления, без повторов"""
+    return list(dict.fromkeys(CODE_PATTERN.findall(text or '')))
+
+
+# Пути классификации и поиска: фабрика -> predict(item) -> Prediction
+
+def classifier_path(k: int) -> Callable[[EvalItem], Prediction]:
+    from wed_expert_genspark_integration import GensparktWEDAgent, ProductClassification
+    agent = GensparktWEDAgent()
+
+    def predict(item: EvalItem) -> Prediction:
+        result = agent.determine_tn_ved(ProductClassification(
+            name=item.query, material=item.material, function=item.function,
+            processing_level='', origin_country='', value=0.0
+        ))
+        return [result.code], result.confidence
+    return predict
+
+
+def _ved_database():
+    from ved_database import VEDDatabase
+    return VEDDatabase()
+
+
+def improved_search_path(k: int, ved_db=None) -> Callable[[EvalItem], Prediction]:
+    from ved_router import improved_search
+    ved_db = ved_db or _ved_database()
+
+    def predict(item: EvalItem) -> Prediction:
+        return codes_in_text(improved_search(item.query, ved_db))[:k], None
+    return predict
+
+
+def name_search_path(k: int, ved_db=None) -> Callable[[EvalItem], Prediction]:
+    ved_db = ved_db or _ved_database()
+
+    def predict(item: EvalItem) -> Prediction:
+        page = ved_db.get_page('s', item.query, page_size=k)
+        return [product['код'] for product in page.items], None
+    return predict
+
+
+def smart_search_path(k: int) -> Callable[[EvalItem], Prediction]:
+    from enhanced_ved_system import EnhancedVEDDatabase
+    database = EnhancedVEDDatabase()
+
+    def predict(item: EvalItem) -> Prediction:
+        result = database.smart_search(item.query)
+        if not result.product:
+            return [], None
+        return [str(result.product.get('code', ''))], result.confidence
+    return predict
+
+
+PATHS: Dict[str, Callable[..., Callable[[EvalItem], Prediction]]] = {
+    'determine_tn_ved': classifier_path,
+    'improved_search': improved_search_path,
+    'name_search': name_search_path,
+    'smart_search': smart_search_path,
+}
+
+
+def calibration(pairs: List[Tuple[float, bool]], bins: int = CALIBRATION_BINS) -> Optional[Dict]:
+    """ECE и Brier score по парам (уверенность, верен ли top-1)"""
+    if not pairs:
+        return None
+    buckets: List[List[Tuple[float, bool]]] = [[] for _ in range(bins)]
+    for confidence, correct in pairs:
+        buckets[min(int(confidence * bins), bins - 1)].append((confidence, correct))
+
+    table = []
+    ece = 0.0
+    for number, bucket in enumerate(buckets):
+        if not bucket:
+            continue
+        mean_confidence = statistics.fmean(confidence for confidence, _ in bucket)
+        accuracy = sum(correct for _, correct in bucket) / len(bucket)
+        ece += abs(accuracy - mean_confidence) * len(bucket) / len(pairs)
+        table.append({
+            'range': [round(number / bins, 2), round((number + 1) / bins, 2)],
+            'count': len(bucket),
+            'confidence': round(mean_confidence, 3),
+            'accuracy': round(accuracy, 3),
+        })
+    brier = statistics.fmean((confidence - correct) ** 2 for confidence, correct in pairs)
+    return {'ece': round(ece, 4), 'brier': round(brier, 4), 'bins': table}
+
+
+def evaluate_path(predict: Callable[[EvalItem], Prediction], items: List[EvalItem], k: int = TOP_K) -> Dict:
+    """Прогон набора через путь: метрики и ответы по запросам"""
+    results = {}
+    latencies = []
+    pairs = []
+    for item in items:
+        started = time.perf_counter()
+        try:
+            codes, confidence = predict(item)
+        except Exception as e:
+            logger.error(f"Ошибка на запросе {item.id}: {e}")
+            codes, confidence = [], None
+        latencies.append(time.perf_counter() - started)
+
+        top1 = bool(codes) and is_match(codes[0], item.expected)
+        results[item.id] = {
+            'query': item.query,
+            'expected': item.expected,
+            'predicted': codes[:k],
+            'confidence': confidence,
+            'top1': top1,
+            'topk': any(is_match(code, item.expected) for code in codes[:k]),
+        }
+        if confidence is not None:
+            pairs.append((confidence, top1))
+
+    total = len(items) or 1
+    elapsed = sum(latencies)
+    latencies_ms = sorted(latency * 1000 for latency in latencies) or [0.0]
+    metrics = {
+        'items': len(items),
+        'top1': round(sum(entry['top1'] for entry in results.values()) / total, 4),
+        'topk': round(sum(entry['topk'] for entry in results.values()) / total, 4),
+        'answered': round(sum(bool(entry['predicted']) for entry in results.values()) / total, 4),
+        'items_per_second': round(len(items) / elapsed, 1) if elapsed else None,
+        'p50_ms': round(latencies_ms[len(latencies_ms) // 2], 3),
+        'p95_ms': round(latencies_ms[min(len(latencies_ms) - 1, int(len(latencies_ms) * 0.95))], 3),
+        'calibration': calibration(pairs),
+    }
+    return {'metrics': metrics, 'items': results}
+
+
+def run_evaluation(dataset: str = DEFAULT_DATASET, paths: Optional[List[str]] = None,
+                   k: int = TOP_K, label: str = '') -> Dict:
+    """Оценка всех (или перечисленных) путей на наборе"""
+    items = load_dataset(dataset)
+    names = paths or list(PATHS)
+    unknown = [name for name in names if name not in PATHS]
+    if unknown:
+        raise ValueError(f"Неизвестные пути: {', '.join(unknown)} (есть: {', '.join(PATHS)})")
+
+    # Одна база на оба пути VEDDatabase: загрузка не входит в замер скорости
+    shared_db = _ved_database() if {'improved_search', 'name_search'} & set(names) else None
+    result = {
+        'label': label,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'dataset': dataset,
+        'k': k,
+        'paths': {},
+    }
+    for name in names:
+        factory = PATHS[name]
+        predict = factory(k, shared_db) if name in ('improved_search', 'name_search') else factory(k)
+        result['paths'][name] = evaluate_path(predict, items, k)
+        metrics = result['paths'][name]['metrics']
+        logger.info(f"{name}: top-1 {metrics['top1']:.1%}, top-{k} {metrics['topk']:.1%}, "
+                    f"{metrics['items_per_second']} запросов/с")
+    return result
+
+
+def diff_results(old: Dict, new: Dict) -> Dict:
+    """Сравнение двух результатов: изменения метрик и top-1 по запросам"""
+    diff = {}
+    for name in sorted(set(old['paths']) | set(new['paths'])):
+        if name not in old['paths'] or name not in new['paths']:
+            diff[name] = {'missing_in': 'old' if name not in old['paths'] else 'new'}
+            continue
+        before, after = old['paths'][name], new['paths'][name]
+        metrics = {}
+        for key in ('top1', 'topk', 'answered', 'items_per_second', 'p50_ms', 'p95_ms'):
+            a, b = before['metrics'].get(key), after['metrics'].get(key)
+            metrics[key] = {'old': a, 'new': b, 'delta': round(b - a, 4) if a is not None and b is not None else None}
+        for key in ('ece', 'brier'):
+            a = (before['metrics'].get('calibration') or {}).get(key)
+            b = (after['metrics'].get('calibration') or {}).get(key)
+            metrics[key] = {'old': a, 'new': b, 'delta': round(b - a, 4) if a is not None and b is not None else None}
+
+        fixed, broken, changed = [], [], []
+        for item_id, entry in after['items'].items():
+            previous = before['items'].get(item_id)
+            if previous is None:
+                continue
+            if entry['top1'] and not previous['top1']:
+                fixed.append(item_id)
+            elif previous['top1'] and not entry['top1']:
+                broken.append(item_id)
+            elif entry['predicted'][:1] != previous['predicted'][:1]:
+                changed.append(item_id)
+        diff[name] = {'metrics': metrics, 'fixed': fixed, 'broken': broken, 'changed': changed}
+    return diff
+
+
+def format_report(result: Dict) -> str:
+    k = result['k']
+    title = f"Оценка {result['label']}" if result.get('label') else "Оценка"
+    lines = [f"{title} ({result['dataset']}, {result['created']})"]
+    for name, path in result['paths'].items():
+        metrics = path['metrics']
+        line = (f"{name:>17}: top-1 {metrics['top1']:6.1%}  top-{k} {metrics['topk']:6.1%}  "
+                f"ответ {metrics['answered']:6.1%}  {metrics['items_per_second']} запр/с  "
+                f"p95 {metrics['p95_ms']} мс")
+        if metrics['calibration']:
+            line += f"  ECE {metrics['calibration']['ece']}  Brier {metrics['calibration']['brier']}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def format_diff(diff: Dict) -> str:
+    lines = []
+    for name, entry in diff.items():
+        if 'missing_in' in entry:
+            lines.append(f"{name}: нет в {'старом' if entry['missing_in'] == 'old' else 'новом'} результате")
+            continue
+        changes = ", ".join(f"{key} {value['old']} -> {value['new']}"
+                            for key, value in entry['metrics'].items() if value['old'] != value['new'])
+        lines.append(f"{name}: {changes or 'метрики без изменений'}")
+        for title, ids in (('стали верными', entry['fixed']), ('стали неверными', entry['broken']),
+                           ('другой top-1', entry['changed'])):
+            if ids:
+                lines.append(f"  {title}: {', '.join(ids)}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    command = sys.argv[1] if len(sys.argv) > 1 else ''
+    if command == 'run':
+        dataset = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_DATASET
+        output = sys.argv[3] if len(sys.argv) > 3 else ''
+        paths = sys.argv[4].split(',') if len(sys.argv) > 4 else None
+        result = run_evaluation(dataset, paths, label=output)
+        if output:
+            with open(output, 'w', encoding='utf-8') as f:
+                json.dump(result, f, ensure_ascii=False, indent=1)
+        print(format_report(result))
+    elif command == 'diff' and len(sys.argv) > 3:
+        with open(sys.argv[2], 'r', encoding='utf-8') as f:
+            old = json.load(f)
+        with open(sys.argv[3], 'r', encoding='utf-8') as f:
+            new = json.load(f)
+        diff = diff_results(old, new)
+        print(format_diff(diff))
+        sys.exit(1 if any(entry.get('broken') for entry in diff.values()) else 0)
+    else:
+        print("Использование: python evaluation.py run [evaluation_dataset.jsonl] [result.json] [пути через запятую]\n"
+              "               python evaluation.py diff before.json after.json")
+        sys.exit(1)
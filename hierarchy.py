@@ -0,0 +1,84 @@
+"""
+Полные иерархические описания кодов ТН ВЭД
+"""
+
+import re
+from typing import Iterable, List, Tuple
+
+_DASHES_RE = re.compile(r'^((?:[–—-]\s*)+)')
+# Остатки разбора исходного тарифа: вместо описания только номер кода ("0207 14 700 1")
+_CODE_ONLY_RE = re.compile(r'^\d{4}(?:\s\d{1,3})*$')
+
+# Разделитель уровней в полном описании
+LEVEL_SEPARATOR = ": "
+
+
+def split_level(description: str) -> Tuple[int, str]:
+    """(уровень по числу тире, текст без тире)"""
+    text = (description or '').strip()
+    match = _DASHES_RE.match(text)
+    if not match:
+        return 0, text
+    depth = sum(1 for char in match.group(1) if char in '–—-')
+    return depth, text[match.end():].strip()
+
+
+def _join(parts: List[str]) -> str:
+    """Путь из описаний уровней; двоеточия и запятые в конце родительских уровней убираются"""
+    return LEVEL_SEPARATOR.join([part.rstrip(' :;,') for part in parts[:-1]] + parts[-1:])
+
+
+# Длины префиксов кода, на которых стоят уровни: товарная позиция и субпозиции.
+# Записей-глав (XX00000000) в базе нет: единственная такая запись — остаток разбора
+ANCHOR_LENGTHS = (4, 5, 6)
+
+
+def _level_text(description: str) -> Tuple[int, str]:
+    depth, text = split_level(description)
+    return depth, '' if _CODE_ONLY_RE.match(text) else text
+
+
+def build_full_descriptions(items: Iterable[Tuple[str, str]]) -> List[str]:
+    """Полные описания для пар (код, описание); результат в порядке входа
+
+    Уровни выше субпозиции берутся по префиксу кода: товарная позиция
+    (XXXX000000) и субпозиции (XXXXX00000, XXXXXX0000), если такие записи
+    есть; глава — граница, через которую путь не идет. Внутри субпозиции (первые 6 цифр) родитель —
+    ближайшая предыдущая запись с меньшим числом тире. Повторы одного и
+    того же фрагмента подряд в путь не дублируются.
+    """
+    items = list(items)
+    order = sorted(range(len(items)), key=lambda i: (items[i][0], i))
+    result = [''] * len(items)
+
+    anchors = {}
+    for code, description in items:
+        if code not in anchors:
+            anchors[code] = _level_text(description)[1]
+
+    subheading = None
+    stack: List[Tuple[int, str]] = []
+    for position in order:
+        code, description = items[position]
+        depth, text = _level_text(description)
+        parts = []
+        for length in ANCHOR_LENGTHS:
+            anchor = code[:length].ljust(len(code), '0')
+            if anchor != code and anchors.get(anchor):
+                parts.append(anchors[anchor])
+
+        if code[:6] != subheading:
+            subheading = code[:6]
+            stack = []
+        # Сама субпозиция уже в пути как уровень по префиксу
+        if text and code[6:].strip('0'):
+            while stack and stack[-1][0] >= depth:
+                stack.pop()
+            parts.extend(part for _, part in stack)
+            stack.append((depth, text))
+        parts.append(text)
+
+        path = [part for number, part in enumerate(parts)
+                if part and (number == 0 or part != parts[number - 1])]
+        result[position] = _join(path) if path else text
+    return result
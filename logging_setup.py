@@ -0,0 +1,179 @@
+"""
+Единая настройка логирования ВЭД Эксперт: запись через фоновую очередь
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, Optional, Tuple
+
+# Поля LogRecord, которые не считаются пользовательскими (extra=...)
+_RESERVED_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_listener: Optional[QueueListener] = None
+_setup_lock = threading.Lock()
+
+
+class StructuredFormatter(logging.Formatter):
+    """Форматтер структурированных записей: одна JSON-строка на событие"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            'ts': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        # Дополнительные поля, переданные через extra={...}
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith('_'):
+                payload[key] = value
+        if record.exc_info:
+            payload['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            payload['exc'] = record.exc_text
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает только долю DEBUG-записей, остальные уровни — все"""
+
+    def __init__(self, rate: float = 0.01):
+        super().__init__()
+        self.rate = max(0.0, min(1.0, rate))
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG:
+            return True
+        return self.rate >= 1.0 or random.random() < self.rate
+
+
+class RateLimitFilter(logging.Filter):
+    """Ограничивает частоту ERROR-записей с одного места вызова
+
+    Не более `burst` записей за `interval` секунд на пару (файл, строка).
+    Число подавленных записей добавляется к следующей пропущенной.
+    """
+
+    def __init__(self, interval: float = 60.0, burst: int = 5):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self._windows: Dict[Tuple[str, int], list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.ERROR:
+            return True
+
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window else 0
+                self._windows[key] = [now, 1, 0]
+            elif window[1] < self.burst:
+                window[1] += 1
+                suppressed = 0
+            else:
+                window[2] += 1
+                return False
+
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class _NonFormattingQueueHandler(QueueHandler):
+    """QueueHandler без форматтера в вызывающем потоке
+
+    В вызывающем потоке в сообщение подставляются аргументы (getMessage),
+    оформление записи (время, JSON) выполняет фоновый поток. Записи,
+    отброшенные уровнем или фильтрами, не форматируются вовсе, поэтому
+    в горячем пути аргументы передаются в стиле %, а не f-строкой.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging(
+    level: Optional[str] = None,
+    log_file: Optional[str] = None,
+    sample_rate: Optional[float] = None,
+    structured: Optional[bool] = None,
+) -> None:
+    """Настраивает корневой логгер приложения (повторный вызов игнорируется)
+
+    Параметры по умолчанию берутся из окружения: LOG_LEVEL, LOG_FILE,
+    LOG_DEBUG_SAMPLE_RATE, LOG_STRUCTURED.
+    """
+    global _listener
+
+    with _setup_lock:
+        if _listener is not None:
+            return
+
+        level = level or os.getenv('LOG_LEVEL', 'INFO')
+        log_file = log_file if log_file is not None else os.getenv('LOG_FILE', 'ved_bot.log')
+        if sample_rate is None:
+            sample_rate = float(os.getenv('LOG_DEBUG_SAMPLE_RATE', '0.01'))
+        if structured is None:
+            structured = os.getenv('LOG_STRUCTURED', '1') != '0'
+
+        if structured:
+            formatter: logging.Formatter = StructuredFormatter()
+        else:
+            formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+        handlers = [logging.StreamHandler()]
+        if log_file:
+            handlers.append(RotatingFileHandler(
+                log_file, maxBytes=10 * 1024 * 1024, backupCount=5, encoding='utf-8'
+            ))
+        for handler in handlers:
+            handler.setFormatter(formatter)
+
+        log_queue: queue.Queue = queue.Queue(-1)
+        queue_handler = _NonFormattingQueueHandler(log_queue)
+        # Фильтры работают в вызывающем потоке: отброшенные записи не попадают в очередь
+        queue_handler.addFilter(SamplingFilter(sample_rate))
+        queue_handler.addFilter(RateLimitFilter())
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(queue_handler)
+        root.setLevel(level)
+
+        _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+
+
+def log_queue() -> Optional[queue.Queue]:
+    """Очередь записей, ожидающих фоновой записи (для диагностики памяти)"""
+    return _listener.queue if _listener is not None else None
+
+
+def shutdown_logging() -> None:
+    """Дописывает очередь и останавливает фоновый поток записи"""
+    global _listener
+
+    with _setup_lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        _listener = None
@@ -1,32 +1,47 @@
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import JSONResponse
+import atexit
+import hmac
 import os
 import telebot
 import logging
 import json
 import time
+import threading
 from datetime import datetime, timedelta
-from typing import Dict, Set
-from collections import defaultdict
+from typing import Dict
+from logging_setup import setup_logging, log_queue
+
+# Логирование через фоновую очередь (см. logging_setup); настраивается
+# до импорта модулей, которые пишут в лог при загрузке
+setup_logging()
+
 from ved_database import VEDDatabase
-from ved_router import route_message, handle_ai_analysis
-
-# Настройка логирования с ротацией
-from logging.handlers import RotatingFileHandler
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        RotatingFileHandler('ved_bot.log', maxBytes=10*1024*1024, backupCount=5),
-        logging.StreamHandler()
-    ]
-)
+from sketches import PopularityTracker, UniqueCounter
+from ved_router import (route_message_chunks, handle_ai_analysis, handle_search_page, configure_ai_client,
+                        configure_analysis_cache, warm_up_analyses, analysis_stats, configure_query_log,
+                        warm_up_queries)
+from query_log import QueryLog, DEFAULT_QUERY_LOG_FILE
+from ai_pipeline import create_client_from_env
+from analysis_cache import AnalysisCache, DEFAULT_CACHE_FILE
+from tariff_patch import DEFAULT_PATCH_DIR, PatchError, apply_patch_dir, load_patch
+from memory_debug import memory_report, format_report, tracemalloc_diff
+from product_cards import card_cache
+import ved_router
+from profiler import profiler
+from autocomplete import AutocompleteIndex, popularity_counts
+from api import BodyCache, create_api_router
+from warm_state import WarmState, DEFAULT_WARM_STATE_FILE
+from deadline import Deadline, deadline_stats
+
 logger = logging.getLogger("VED_BOT")
 
 # Конфигурация
 BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 WEBHOOK_URL = "https://vedexpert-production.up.railway.app/webhook"
 ADMIN_IDS = [181780572]  # ID администраторов
+# Бюджет времени на ответ, секунды (см. deadline.py): меньше таймаута вебхука Telegram
+REQUEST_BUDGET = float(os.getenv("REQUEST_BUDGET", "10"))
 
 if not BOT_TOKEN:
     logger.error("❌ BOT_TOKEN не найден!")
@@ -39,9 +54,10 @@ app = FastAPI()
 class BotStats:
     def __init__(self):
         self.start_time = datetime.now()
-        self.users: Set[int] = set()
+        # Память фиксирована: HyperLogLog для пользователей, Space-Saving для кодов
+        self.users = UniqueCounter()
         self.requests_count = 0
-        self.popular_codes: Dict[str, int] = defaultdict(int)
+        self.popular_codes = PopularityTracker()
         self.errors_count = 0
         self.ai_requests = 0
         
@@ -51,36 +67,198 @@ class BotStats:
     def add_request(self, code: str = None):
         self.requests_count += 1
         if code:
-            self.popular_codes[code] += 1
+            self.popular_codes.add(code)
             
     def add_error(self):
         self.errors_count += 1
         
     def add_ai_request(self):
         self.ai_requests += 1
+    
+    def export_state(self) -> Dict:
+        """Счетчики для warm_state (вместе со start_time: деплой не сбрасывает uptime)"""
+        return dict(self.__dict__)
+    
+    def load_state(self, state: Dict):
+        self.__dict__.update(state)
         
-    def get_stats(self) -> Dict:
+    def get_stats(self, window: str = 'all') -> Dict:
+        """Сводка; window ('hour', 'day', 'all') — окно для пользователей и популярных кодов"""
         uptime = datetime.now() - self.start_time
         return {
             "uptime": str(uptime).split('.')[0],
-            "users_count": len(self.users),
+            "users_count": self.users.count(window),
+            "users_today": self.users.count('day'),
             "requests_count": self.requests_count,
             "errors_count": self.errors_count,
             "ai_requests": self.ai_requests,
-            "popular_codes": dict(sorted(self.popular_codes.items(), 
-                                       key=lambda x: x[1], reverse=True)[:5])
+            "popular_codes": dict(self.popular_codes.top(5, window)),
+            "popular_codes_hour": dict(self.popular_codes.top(5, 'hour'))
         }
 
 stats = BotStats()
 
+# Префикс callback_data кнопки "Далее" в постраничной выдаче
+PAGE_CALLBACK_PREFIX = "page:"
+
+def page_keyboard(next_cursor):
+    """Inline-клавиатура с кнопкой следующей страницы (или None)"""
+    if not next_cursor:
+        return None
+    markup = telebot.types.InlineKeyboardMarkup()
+    markup.add(telebot.types.InlineKeyboardButton(
+        "➡️ Далее", callback_data=PAGE_CALLBACK_PREFIX + next_cursor
+    ))
+    return markup
+
 # Инициализируем базу данных
+# VED_DB_BACKEND=sqlite — база в файле SQLite (общий кэш страниц для нескольких воркеров)
+DB_BACKEND = os.getenv("VED_DB_BACKEND", "memory")
+SQLITE_PATH = os.getenv("VED_SQLITE_PATH", "tnved_database.sqlite")
+
 try:
-    ved_db = VEDDatabase()
-    logger.info("✅ VEDDatabase загружена успешно")
+    if DB_BACKEND == "sqlite":
+        from ved_sqlite import SQLiteVEDDatabase, import_json, schema_is_current
+        if not schema_is_current(SQLITE_PATH):
+            import_json("tnved_database.json", SQLITE_PATH)
+        ved_db = SQLiteVEDDatabase(SQLITE_PATH)
+    else:
+        ved_db = VEDDatabase()
+    logger.info(f"✅ VEDDatabase загружена успешно (хранилище: {DB_BACKEND})")
 except Exception as e:
     logger.error(f"❌ Ошибка загрузки базы данных: {e}")
     ved_db = None
 
+# Патчи базы из каталога VED_PATCH_DIR применяются при старте по порядку имен
+PATCH_DIR = os.getenv("VED_PATCH_DIR", DEFAULT_PATCH_DIR)
+if ved_db and DB_BACKEND != "sqlite":
+    applied = apply_patch_dir(ved_db, PATCH_DIR)
+    if applied:
+        logger.info(f"✅ Применено патчей базы: {applied} (версия {ved_db.patch_version})")
+
+# Шардированный поиск по названию: VED_SEARCH_SHARDS процессов-воркеров по главам (0 — выключен)
+SEARCH_SHARDS = int(os.getenv("VED_SEARCH_SHARDS", "0"))
+if ved_db and DB_BACKEND != "sqlite" and SEARCH_SHARDS > 0:
+    atexit.register(ved_db.enable_sharded_search(SEARCH_SHARDS).close)
+
+# AI-анализ через внешнюю модель: AI_BACKEND, AI_TIMEOUT, AI_MAX_CONCURRENCY
+ai_client = create_client_from_env(os.environ)
+configure_ai_client(ai_client)
+if ai_client:
+    logger.info(f"✅ AI-анализ: {type(ai_client.backend).__name__}, таймаут {ai_client.timeout}с")
+
+# Постоянный кэш анализов: ANALYSIS_CACHE_FILE (пусто — отключен), TTL в часах, размер в записях
+ANALYSIS_CACHE_FILE = os.getenv("ANALYSIS_CACHE_FILE", DEFAULT_CACHE_FILE)
+ANALYSIS_WARMUP_INTERVAL = int(os.getenv("ANALYSIS_WARMUP_INTERVAL", "3600"))
+ANALYSIS_WARMUP_TOP = int(os.getenv("ANALYSIS_WARMUP_TOP", "50"))
+
+analysis_cache = None
+if ANALYSIS_CACHE_FILE:
+    try:
+        analysis_cache = AnalysisCache(
+            ANALYSIS_CACHE_FILE,
+            ttl=float(os.getenv("ANALYSIS_CACHE_TTL_HOURS", "168")) * 3600,
+            max_entries=int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "20000"))
+        )
+        logger.info(f"✅ Кэш анализов: {ANALYSIS_CACHE_FILE}, записей: {len(analysis_cache)}")
+        atexit.register(analysis_cache.close)
+    except Exception as e:
+        logger.error(f"❌ Ошибка открытия кэша анализов: {e}")
+configure_analysis_cache(analysis_cache)
+
+def analysis_warmup_loop():
+    """Периодический прогрев кэша анализов для популярных кодов"""
+    while True:
+        time.sleep(ANALYSIS_WARMUP_INTERVAL)
+        try:
+            if ved_db:
+                analysis_cache.purge_expired()
+                warm_up_analyses(ved_db, ANALYSIS_WARMUP_TOP)
+        except Exception as e:
+            logger.error(f"❌ Ошибка прогрева кэша анализов: {e}")
+
+if analysis_cache and ANALYSIS_WARMUP_INTERVAL > 0:
+    threading.Thread(target=analysis_warmup_loop, name="analysis-warmup", daemon=True).start()
+
+# Автодополнение inline-запросов; top-k узлов пересчитывается по счетчикам популярности
+AUTOCOMPLETE_REFRESH_INTERVAL = int(os.getenv("AUTOCOMPLETE_REFRESH_INTERVAL", "600"))
+
+def current_popularity() -> Dict[str, int]:
+    return popularity_counts(ved_router.request_stats['popular_codes'].top(200))
+
+autocomplete = None
+if ved_db:
+    try:
+        autocomplete = AutocompleteIndex(ved_db)
+    except Exception as e:
+        logger.error(f"❌ Ошибка сборки индекса автодополнения: {e}")
+
+def autocomplete_refresh_loop():
+    """Периодический пересчет популярности в узлах автодополнения"""
+    while True:
+        time.sleep(AUTOCOMPLETE_REFRESH_INTERVAL)
+        try:
+            autocomplete.refresh_popularity(current_popularity())
+        except Exception as e:
+            logger.error(f"❌ Ошибка обновления автодополнения: {e}")
+
+if autocomplete and AUTOCOMPLETE_REFRESH_INTERVAL > 0:
+    threading.Thread(target=autocomplete_refresh_loop, name="autocomplete-refresh", daemon=True).start()
+
+# Теплое состояние: WARM_STATE_FILE (пусто — отключено) сохраняется при остановке приложения и
+# восстанавливается при старте. Кэши — только к той же версии базы (с патчами), счетчики — всегда
+WARM_STATE_FILE = os.getenv("WARM_STATE_FILE", DEFAULT_WARM_STATE_FILE)
+api_cache = BodyCache()
+
+def data_version():
+    return ved_db.snapshot_version() if ved_db else None
+
+warm_state = None
+if WARM_STATE_FILE:
+    warm_state = WarmState(WARM_STATE_FILE, version=data_version)
+    warm_state.register('bot_stats', stats.export_state, stats.load_state, version=lambda: None)
+    warm_state.register('request_stats', lambda: dict(ved_router.request_stats),
+                        ved_router.request_stats.update, version=lambda: None)
+    warm_state.register('card_cache', card_cache.export_entries, card_cache.load_entries)
+    warm_state.register('api_cache', api_cache.export_entries, api_cache.load_entries)
+    if ved_db:
+        warm_state.register('cursor_queries', ved_db.export_cursor_queries, ved_db.load_cursor_queries)
+    warm_state.restore()
+
+@app.on_event("shutdown")
+def save_warm_state():
+    if warm_state:
+        warm_state.save()
+
+# Журнал запросов и прогрев при старте: QUERY_LOG_FILE (пусто — отключен), WARMUP_QUERIES — сколько
+# самых частых запросов прогнать через поиск и отрисовку до готовности /health
+QUERY_LOG_FILE = os.getenv("QUERY_LOG_FILE", DEFAULT_QUERY_LOG_FILE)
+WARMUP_QUERIES = int(os.getenv("WARMUP_QUERIES", "200"))
+
+query_log = None
+if QUERY_LOG_FILE:
+    try:
+        query_log = QueryLog(
+            QUERY_LOG_FILE,
+            max_bytes=int(os.getenv("QUERY_LOG_MAX_BYTES", str(5 * 1024 * 1024))),
+            backups=int(os.getenv("QUERY_LOG_BACKUPS", "3")),
+            salt=os.getenv("QUERY_LOG_SALT")
+        )
+        atexit.register(query_log.close)
+    except Exception as e:
+        logger.error(f"❌ Ошибка открытия журнала запросов: {e}")
+configure_query_log(query_log)
+
+def startup_warmup():
+    """Прогрев кэшей самыми частыми запросами из журнала"""
+    result = query_log.warm_up(lambda queries: warm_up_queries(queries, ved_db), WARMUP_QUERIES)
+    logger.info(f"✅ Прогрев завершен: {result['queries']} запросов за {result['seconds']:.2f}с, "
+                f"карточек в кэше: {len(card_cache)}")
+
+if query_log and ved_db and WARMUP_QUERIES > 0:
+    query_log.warmup['state'] = 'warming'
+    threading.Thread(target=startup_warmup, name="startup-warmup", daemon=True).start()
+
 # Обработчики команд
 @bot.message_handler(commands=['start'])
 def send_welcome(message):
@@ -155,7 +333,7 @@ def send_stats(message):
 📊 **Статистика бота:**
 
 ⏱️ **Время работы:** {bot_stats['uptime']}
-👥 **Пользователей:** {bot_stats['users_count']}
+👥 **Пользователей:** {bot_stats['users_count']} (за сутки: {bot_stats['users_today']})
 📝 **Запросов:** {bot_stats['requests_count']}
 🤖 **AI-запросов:** {bot_stats['ai_requests']}
 ❌ **Ошибок:** {bot_stats['errors_count']}
@@ -164,6 +342,11 @@ def send_stats(message):
 """
         for code, count in bot_stats['popular_codes'].items():
             stats_text += f"• `{code}`: {count} раз\n"
+        
+        if bot_stats['popular_codes_hour']:
+            stats_text += "\n⏰ **За последний час:**\n"
+            for code, count in bot_stats['popular_codes_hour'].items():
+                stats_text += f"• `{code}`: {count} раз\n"
             
         bot.reply_to(message, stats_text, parse_mode='Markdown')
         logger.info(f"📊 Статистика запрошена: {message.from_user.id}")
@@ -171,15 +354,157 @@ def send_stats(message):
         logger.error(f"❌ Ошибка в /stats: {e}")
         bot.reply_to(message, "Произошла ошибка. Попробуйте позже.")
 
+@bot.message_handler(commands=['reload_cert'])
+def reload_certification(message):
+    try:
+        if message.from_user.id not in ADMIN_IDS:
+            bot.reply_to(message, "❌ Доступ запрещен")
+            return
+        if not ved_db:
+            bot.reply_to(message, "❌ База данных недоступна")
+            return
+        
+        changed = ved_db.reload_certification()
+        requirements_count = len(ved_db.certification.requirements)
+        bot.reply_to(
+            message,
+            f"✅ Требования сертификации перечитаны: {requirements_count}" if changed
+            else "ℹ️ certification.json не изменился"
+        )
+        logger.info(f"📜 Перезагрузка сертификации: {message.from_user.id}, изменено: {changed}")
+    except Exception as e:
+        logger.error(f"❌ Ошибка в /reload_cert: {e}")
+        bot.reply_to(message, "Произошла ошибка. Попробуйте позже.")
+
+@bot.message_handler(commands=['apply_patch'])
+def apply_database_patch(message):
+    try:
+        if message.from_user.id not in ADMIN_IDS:
+            bot.reply_to(message, "❌ Доступ запрещен")
+            return
+        if not ved_db:
+            bot.reply_to(message, "❌ База данных недоступна")
+            return
+        
+        parts = message.text.split()
+        if len(parts) < 2:
+            bot.reply_to(message, f"Использование: /apply_patch <файл из {PATCH_DIR}>")
+            return
+        
+        name = os.path.basename(parts[1])
+        try:
+            summary = ved_db.apply_patch(load_patch(os.path.join(PATCH_DIR, name)))
+        except PatchError as e:
+            bot.reply_to(message, f"❌ {e}")
+            return
+        if autocomplete:
+            autocomplete.rebuild(current_popularity())
+        bot.reply_to(
+            message,
+            f"✅ Патч {summary['version']} применен: изменено кодов {summary['changed_codes']} "
+            f"за {summary['seconds'] * 1000:.1f} мс"
+        )
+        logger.info(f"🩹 Патч базы {name}: {message.from_user.id}")
+    except Exception as e:
+        logger.error(f"❌ Ошибка в /apply_patch: {e}")
+        bot.reply_to(message, "Произошла ошибка. Попробуйте позже.")
+
+def collect_memory_report(trace: bool = False) -> Dict:
+    """Отчет о памяти по основным структурам процесса"""
+    structures = {
+        "ved_db.data": getattr(ved_db, 'data', None),
+        "ved_db.search_text": getattr(ved_db, '_search_text', None),
+        "ved_db.by_code": getattr(ved_db, '_by_code', None),
+        "ved_db.code_order": getattr(ved_db, '_code_order', None),
+        "ved_db.duty_table": getattr(ved_db, 'duty_table', None),
+        "ved_db.certification": getattr(ved_db, 'certification', None),
+        "ved_db.cursor_queries": getattr(ved_db, '_cursor_queries', None),
+        "card_cache": card_cache._cards,
+        "router.request_stats": ved_router.request_stats,
+        "bot_stats": stats,
+        "log_queue": log_queue(),
+    }
+    return memory_report(structures, getattr(ved_db, 'load_phases', None), trace)
+
+@bot.message_handler(commands=['memory'])
+def memory_stats(message):
+    try:
+        if message.from_user.id not in ADMIN_IDS:
+            bot.reply_to(message, "❌ Доступ запрещен")
+            return
+        
+        # /memory trace — включить tracemalloc и показать рост, /memory stop — выключить
+        text = message.text.lower()
+        if 'stop' in text:
+            tracemalloc_diff.stop()
+        bot.reply_to(message, format_report(collect_memory_report('trace' in text)))
+    except Exception as e:
+        logger.error(f"❌ Ошибка в /memory: {e}")
+        bot.reply_to(message, "Произошла ошибка. Попробуйте позже.")
+
+@bot.message_handler(commands=['profile'])
+def profile_command(message):
+    try:
+        if message.from_user.id not in ADMIN_IDS:
+            bot.reply_to(message, "❌ Доступ запрещен")
+            return
+        
+        # /profile start [секунды] [доля запросов] | /profile stop | /profile status
+        parts = message.text.split()
+        action = parts[1] if len(parts) > 1 else 'status'
+        if action == 'start':
+            duration = float(parts[2]) if len(parts) > 2 else 60.0
+            sample_rate = float(parts[3]) if len(parts) > 3 else 1.0
+            if profiler.start(duration, sample_rate):
+                bot.reply_to(message, f"✅ Профилирование включено на {duration:g}с, доля запросов {sample_rate:g}")
+            else:
+                bot.reply_to(message, "ℹ️ Профилирование уже идет")
+        elif action == 'stop':
+            path = profiler.stop()
+            bot.reply_to(message, f"✅ Профиль записан: {path}" if path else "ℹ️ Профилирование не было включено")
+        else:
+            lines = [f"Профилирование: {'включено' if profiler.active else 'выключено'}"]
+            for name, stage in profiler.stage_summary().items():
+                lines.append(f"• {name}: {stage['count']} шт., p50 {stage['p50_ms']} мс, p95 {stage['p95_ms']} мс")
+            bot.reply_to(message, "\n".join(lines))
+        logger.info(f"🔬 /profile {action}: {message.from_user.id}")
+    except ValueError:
+        bot.reply_to(message, "Использование: /profile start [секунды] [доля 0..1] | stop | status")
+    except Exception as e:
+        logger.error(f"❌ Ошибка в /profile: {e}")
+        bot.reply_to(message, "Произошла ошибка. Попробуйте позже.")
+
+@bot.message_handler(commands=['warm_analyses'])
+def warm_analyses(message):
+    try:
+        if message.from_user.id not in ADMIN_IDS:
+            bot.reply_to(message, "❌ Доступ запрещен")
+            return
+        if not ved_db or not analysis_cache:
+            bot.reply_to(message, "❌ Кэш анализов недоступен")
+            return
+        
+        done = warm_up_analyses(ved_db, ANALYSIS_WARMUP_TOP)
+        bot.reply_to(message, f"✅ Анализы подготовлены для {done} популярных кодов")
+        logger.info(f"🔥 Прогрев кэша анализов: {message.from_user.id}, кодов: {done}")
+    except Exception as e:
+        logger.error(f"❌ Ошибка в /warm_analyses: {e}")
+        bot.reply_to(message, "Произошла ошибка. Попробуйте позже.")
+
 # Основной обработчик сообщений
 @bot.message_handler(func=lambda message: True)
 def handle_message(message):
+    with profiler.request('message'):
+        _handle_message(message)
+
+def _handle_message(message):
     start_time = time.time()
+    deadline = Deadline(REQUEST_BUDGET)
     try:
         stats.add_user(message.from_user.id)
         user_text = message.text.strip()
         
-        logger.info(f"📩 Сообщение от {message.from_user.id}: {user_text}")
+        logger.debug("📩 Сообщение от %s: %s", message.from_user.id, user_text)
         
         if not ved_db:
             bot.reply_to(message, "❌ База данных недоступна. Обратитесь к администратору.")
@@ -188,13 +513,16 @@ def handle_message(message):
         # Проверка на AI-анализ
         if "анализ" in user_text.lower():
             stats.add_ai_request()
-            response = handle_ai_analysis(user_text, ved_db)
+            with deadline.stage('routing'):
+                response = handle_ai_analysis(user_text, ved_db, deadline)
             if response:
-                bot.reply_to(message, response, parse_mode='Markdown')
+                with deadline.stage('send'):
+                    bot.reply_to(message, response, parse_mode='Markdown')
                 return
         
         # Обычная обработка
-        response = route_message(user_text, ved_db)
+        with deadline.stage('routing'):
+            messages, next_cursor = route_message_chunks(user_text, ved_db, message.from_user.id, deadline)
         
         # Извлекаем код для статистики
         import re
@@ -205,11 +533,18 @@ def handle_message(message):
             stats.add_request()
         
         # Отправляем ответ
-        bot.reply_to(message, response, parse_mode='Markdown')
+        # Длинный ответ уже разложен по сообщениям Telegram; кнопка — под последним
+        with deadline.stage('send'):
+            bot.reply_to(message, messages[0], parse_mode='Markdown',
+                         reply_markup=page_keyboard(next_cursor) if len(messages) == 1 else None)
+            for number, chunk in enumerate(messages[1:], 2):
+                bot.send_message(message.chat.id, chunk, parse_mode='Markdown',
+                                 reply_markup=page_keyboard(next_cursor) if number == len(messages) else None)
         
         # Логируем время обработки
         process_time = time.time() - start_time
-        logger.info(f"⏱️ Обработка заняла: {process_time:.2f}с")
+        logger.debug("⏱️ Обработка заняла: %.2fс", process_time,
+                     extra={'user_id': message.from_user.id, 'duration_ms': round(process_time * 1000, 1)})
         
     except Exception as e:
         stats.add_error()
@@ -220,15 +555,69 @@ def handle_message(message):
             bot.reply_to(message, error_msg)
         except:
             logger.error("❌ Не удалось отправить сообщение об ошибке")
+    finally:
+        deadline.finish()
+
+# Inline-запросы: @bot 8471… или @bot ноут…
+@bot.inline_handler(func=lambda query: True)
+def handle_inline_query(inline_query):
+    try:
+        if not autocomplete:
+            return
+        with profiler.request('inline'):
+            suggestions = autocomplete.suggest(inline_query.query, limit=10)
+            results = [
+                telebot.types.InlineQueryResultArticle(
+                    id=code,
+                    title=code,
+                    description=text[:200],
+                    input_message_content=telebot.types.InputTextMessageContent(code)
+                )
+                for code, text in suggestions
+            ]
+            with profiler.stage('send'):
+                bot.answer_inline_query(inline_query.id, results, cache_time=60)
+    except Exception as e:
+        logger.error(f"❌ Ошибка inline-запроса: {e}")
+
+# Кнопка "Далее" в постраничной выдаче
+@bot.callback_query_handler(func=lambda call: (call.data or '').startswith(PAGE_CALLBACK_PREFIX))
+def handle_page_callback(call):
+    try:
+        if not ved_db:
+            bot.answer_callback_query(call.id, "База данных недоступна")
+            return
+        
+        cursor = call.data[len(PAGE_CALLBACK_PREFIX):]
+        deadline = Deadline(REQUEST_BUDGET)
+        response, next_cursor = handle_search_page(cursor, ved_db, deadline)
+        deadline.finish()
+        bot.edit_message_text(
+            response,
+            chat_id=call.message.chat.id,
+            message_id=call.message.message_id,
+            parse_mode='Markdown',
+            reply_markup=page_keyboard(next_cursor)
+        )
+        bot.answer_callback_query(call.id)
+    except Exception as e:
+        stats.add_error()
+        logger.error(f"❌ Ошибка перехода по страницам: {e}")
+        try:
+            bot.answer_callback_query(call.id, "Произошла ошибка. Попробуйте позже.")
+        except:
+            logger.error("❌ Не удалось ответить на callback")
 
 # Webhook handler
 @app.post("/webhook")
 async def webhook(request: Request):
     try:
         json_data = await request.json()
-        logger.debug(f"🛰️ Webhook получен")
-        update = telebot.types.Update.de_json(json_data)
-        bot.process_new_updates([update])
+        logger.debug("🛰️ Webhook получен")
+        # Обработчики бота выполняются в пуле потоков telebot: здесь — разбор и постановка в очередь
+        with profiler.request('webhook'):
+            update = telebot.types.Update.de_json(json_data)
+            bot.process_new_updates([update])
         return {"status": "ok"}
     except Exception as e:
         stats.add_error()
@@ -240,24 +629,58 @@ async def webhook(request: Request):
 async def health_check():
     try:
         bot_stats = stats.get_stats()
-        return {
-            "status": "ok",
+        # Пока идет прогрев, сервис не готов принимать трафик (503 для проверки готовности)
+        warming = query_log is not None and query_log.warmup['state'] == 'warming'
+        payload = {
+            "status": "warming" if warming else "ok",
             "database": "connected" if ved_db else "disconnected",
             "stats": bot_stats
         }
+        if query_log is not None:
+            payload["warmup"] = query_log.warmup_stats()
+        return JSONResponse(payload, status_code=503) if warming else payload
     except Exception as e:
         logger.error(f"❌ Ошибка health check: {e}")
         return {"status": "error"}
 
+# REST API только для чтения: /api/code, /api/search, /api/group, /api/prefix (ETag + Cache-Control)
+if ved_db:
+    app.include_router(create_api_router(ved_db, api_cache))
+
 # Статистика API для мониторинга
 @app.get("/api/stats")
 async def api_stats():
     try:
-        return stats.get_stats()
+        result = stats.get_stats()
+        result.update(analysis_stats())
+        result["api_cache"] = dict(api_cache.stats)
+        result["deadlines"] = deadline_stats.snapshot()
+        if query_log is not None:
+            result["warmup"] = query_log.warmup_stats()
+            result["warmup"]["card_cache"] = dict(card_cache.stats)
+        if warm_state is not None:
+            result["warm_state"] = dict(warm_state.stats)
+        return result
     except Exception as e:
         logger.error(f"❌ Ошибка API статистики: {e}")
         return {"error": "Stats unavailable"}
 
+# Диагностика памяти: только при заданном DEBUG_TOKEN (заголовок X-Debug-Token)
+DEBUG_TOKEN = os.getenv("DEBUG_TOKEN", "")
+
+@app.get("/debug/memory")
+def debug_memory(request: Request, trace: bool = False):
+    # Обычная функция: FastAPI выполняет ее в пуле потоков, gc.collect и обход
+    # структур не блокируют цикл событий
+    token = request.headers.get("X-Debug-Token", "")
+    if not DEBUG_TOKEN or not hmac.compare_digest(token.encode('utf-8'), DEBUG_TOKEN.encode('utf-8')):
+        raise HTTPException(status_code=404)
+    try:
+        return collect_memory_report(trace)
+    except Exception as e:
+        logger.error(f"❌ Ошибка /debug/memory: {e}")
+        return {"error": "Memory report unavailable"}
+
 if __name__ == "__main__":
     logger.info("🚀 Запуск ВЭД Эксперт бота...")
     logger.info(f"📊 База данных: {'✅ Подключена' if ved_db else '❌ Не подключена'}")
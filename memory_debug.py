@@ -0,0 +1,176 @@
+"""
+Диагностика памяти процесса бота: размеры структур, RSS и разница снимков tracemalloc
+"""
+
+import gc
+import logging
+import sys
+import threading
+import tracemalloc
+import types
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_CONTAINERS = (dict, list, tuple, set, frozenset)
+
+
+def deep_sizeof(obj: Any, seen: Optional[set] = None) -> int:
+    """Размер объекта со всеми вложенными объектами в байтах
+
+    seen — id уже учтенных объектов (общий для нескольких вызовов, чтобы
+    разделяемые объекты не считались дважды). Массивы NumPy — по nbytes.
+    """
+    if seen is None:
+        seen = set()
+    total = 0
+    stack = [obj]
+    while stack:
+        current = stack.pop()
+        if id(current) in seen:
+            continue
+        seen.add(id(current))
+        nbytes = getattr(current, 'nbytes', None)
+        if isinstance(nbytes, int) and not isinstance(current, (str, bytes)):
+            total += sys.getsizeof(current, 0) + nbytes
+            continue
+        total += sys.getsizeof(current, 0)
+        if isinstance(current, (str, bytes, int, float, bool, type(None), types.ModuleType)):
+            continue
+        if isinstance(current, dict):
+            stack.extend(current.keys())
+            stack.extend(current.values())
+        elif isinstance(current, _CONTAINERS):
+            stack.extend(current)
+        elif hasattr(current, '__dict__') and not isinstance(current, type):
+            stack.append(vars(current))
+        elif hasattr(current, '__slots__'):
+            stack.extend(getattr(current, name) for name in current.__slots__ if hasattr(current, name))
+    return total
+
+
+def process_rss() -> Optional[int]:
+    """Резидентная память процесса в байтах (Linux /proc, иначе пик по getrusage)"""
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+    except Exception:
+        return None
+
+
+def structure_sizes(structures: Dict[str, Any]) -> Dict[str, int]:
+    """Размеры структур в порядке перечисления (общие объекты — в первой)"""
+    seen: set = set()
+    sizes = {}
+    for name, obj in structures.items():
+        if obj is None:
+            continue
+        try:
+            sizes[name] = deep_sizeof(obj, seen)
+        except Exception as e:
+            logger.error(f"Ошибка подсчета размера {name}: {e}")
+    return sizes
+
+
+class TracemallocDiff:
+    """Разница снимков tracemalloc между вызовами"""
+
+    def __init__(self, frames: int = 1):
+        self.frames = frames
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    @property
+    def active(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def diff(self, top: int = 15) -> Dict:
+        """Первый вызов включает трассировку; следующие возвращают рост с прошлого вызова"""
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(self.frames)
+                self._snapshot = tracemalloc.take_snapshot()
+                return {"started": True, "top": []}
+
+            snapshot = tracemalloc.take_snapshot().filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            ))
+            stats = snapshot.compare_to(self._snapshot, 'lineno') if self._snapshot else []
+            self._snapshot = snapshot
+            current, peak = tracemalloc.get_traced_memory()
+            return {
+                "started": False,
+                "traced_bytes": current,
+                "traced_peak_bytes": peak,
+                "top": [
+                    {"where": str(stat.traceback[0]), "size_diff": stat.size_diff,
+                     "size": stat.size, "count_diff": stat.count_diff}
+                    for stat in stats[:top]
+                ],
+            }
+
+    def stop(self):
+        with self._lock:
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+            self._snapshot = None
+
+
+tracemalloc_diff = TracemallocDiff()
+
+
+def memory_report(structures: Dict[str, Any], load_phases: Optional[Dict] = None,
+                  trace: bool = False) -> Dict:
+    """Полный отчет о памяти"""
+    gc.collect()
+    report = {
+        "rss_bytes": process_rss(),
+        "structures": structure_sizes(structures),
+        "load_phases": load_phases or {},
+        "gc_objects": len(gc.get_objects()),
+    }
+    if trace:
+        report["tracemalloc"] = tracemalloc_diff.diff()
+    elif tracemalloc_diff.active:
+        report["tracemalloc"] = {"active": True}
+    return report
+
+
+def format_bytes(size: Optional[int]) -> str:
+    if size is None:
+        return "н/д"
+    for unit in ("Б", "КБ", "МБ"):
+        if abs(size) < 1024:
+            return f"{size:.0f} {unit}"
+        size /= 1024
+    return f"{size:.1f} ГБ"
+
+
+def format_report(report: Dict, top: int = 12) -> str:
+    """Отчет для сообщения бота"""
+    lines: List[str] = [f"🧠 Память процесса: {format_bytes(report.get('rss_bytes'))}", ""]
+    for name, size in sorted(report["structures"].items(), key=lambda item: -item[1])[:top]:
+        lines.append(f"• {name}: {format_bytes(size)}")
+
+    phases = report.get("load_phases") or {}
+    if phases:
+        timings = ", ".join(f"{name} {value:.3f}с" for name, value in phases.items()
+                            if isinstance(value, float) and name != 'total')
+        lines += ["", f"⏱ Загрузка базы ({phases.get('loaded_at', '')}): {timings}; всего {phases.get('total', 0):.3f}с"]
+
+    trace = report.get("tracemalloc")
+    if trace and trace.get("started"):
+        lines += ["", "tracemalloc включен, повторите команду для разницы снимков"]
+    elif trace and trace.get("top"):
+        lines += ["", "📈 Рост с прошлого снимка:"]
+        lines += [f"• {entry['where']}: {format_bytes(entry['size_diff'])}" for entry in trace["top"][:5]]
+    return "\n".join(lines)
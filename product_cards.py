@@ -0,0 +1,99 @@
+"""
+Кэш отрисованных карточек товаров по версии базы и коду
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+
+class CardCache:
+    """LRU-кэш карточек с ключом (вид карточки, версия базы, код)"""
+
+    def __init__(self, max_size: int = 20000):
+        self.max_size = max_size
+        self._cards: "OrderedDict[Tuple[str, Hashable, str], bytes]" = OrderedDict()
+        # код -> ключи его карточек: сброс по коду без обхода всего кэша
+        self._keys_by_code: Dict[str, Set[Tuple[str, Hashable, str]]] = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def get_or_render(self, kind: str, version: Optional[Hashable], code: str,
+                      render: Callable[[], str]) -> str:
+        """Возвращает карточку из кэша или отрисовывает и запоминает ее"""
+        if version is None or not code:
+            return render()
+
+        key = (kind, version, code)
+        with self._lock:
+            card = self._cards.get(key)
+            if card is not None:
+                self._cards.move_to_end(key)
+                self.stats["hits"] += 1
+                return card.decode('utf-8')
+
+        text = render()
+        with self._lock:
+            self.stats["misses"] += 1
+            self._store(key, text.encode('utf-8'))
+            self._evict()
+        return text
+
+    def _store(self, key: Tuple[str, Hashable, str], card: bytes):
+        self._cards[key] = card
+        self._keys_by_code.setdefault(key[2], set()).add(key)
+
+    def _evict(self):
+        while len(self._cards) > self.max_size:
+            key, _ = self._cards.popitem(last=False)
+            self._discard_key(key)
+
+    def _discard_key(self, key: Tuple[str, Hashable, str]):
+        keys = self._keys_by_code.get(key[2])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_code[key[2]]
+
+    def _remove_code(self, code: str) -> int:
+        keys = self._keys_by_code.pop(code, ())
+        for key in keys:
+            del self._cards[key]
+        return len(keys)
+
+    def invalidate(self, code: Optional[str] = None) -> int:
+        """Удаляет карточки одного кода (или все); возвращает число удаленных"""
+        with self._lock:
+            if code is None:
+                removed = len(self._cards)
+                self._cards.clear()
+                self._keys_by_code.clear()
+                return removed
+            return self._remove_code(code)
+
+    def invalidate_many(self, codes: Iterable[str]) -> int:
+        """Удаляет карточки нескольких кодов; время пропорционально числу удаляемых"""
+        with self._lock:
+            return sum(self._remove_code(code) for code in set(codes))
+
+    def export_entries(self) -> List[Tuple[Tuple[str, Hashable, str], bytes]]:
+        """Содержимое кэша от давних к свежим (для warm_state)"""
+        with self._lock:
+            return list(self._cards.items())
+
+    def load_entries(self, entries: Iterable[Tuple[Tuple[str, Hashable, str], bytes]]):
+        """Добавляет сохраненные карточки, не вытесняя уже отрисованные"""
+        with self._lock:
+            # Сохраненные старше уже отрисованных после старта: в начало очереди LRU
+            for key, card in reversed(list(entries)):
+                if key not in self._cards:
+                    self._store(key, card)
+                    self._cards.move_to_end(key, last=False)
+            self._evict()
+
+    def __len__(self) -> int:
+        return len(self._cards)
+
+
+# Общий кэш для всех форматтеров
+card_cache = CardCache()
@@ -0,0 +1,205 @@
+"""
+Профилировщик запросов по требованию: время стадий и свернутые стеки выбранных запросов
+"""
+
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from datetime import datetime
+from typing import Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROFILE_DIR = 'profiles'
+
+
+class _NullContext:
+    """Пустой контекст для выключенного профилировщика"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL = _NullContext()
+
+
+class _RequestState:
+    """Стадии выполняющегося запроса (стек имен)"""
+
+    def __init__(self, name: str):
+        self.stages: List[str] = [name]
+
+
+class _StageContext:
+    def __init__(self, profiler: "Profiler", state: _RequestState, name: str):
+        self.profiler = profiler
+        self.state = state
+        self.name = name
+
+    def __enter__(self):
+        self.state.stages.append(self.name)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler._record(self.name, time.perf_counter() - self.started)
+        self.state.stages.pop()
+        return False
+
+
+class _RequestContext:
+    def __init__(self, profiler: "Profiler", name: str):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.state = _RequestState(self.name)
+        self.profiler._local.state = self.state
+        self.profiler._threads[threading.get_ident()] = self.state
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler._record(self.name, time.perf_counter() - self.started)
+        self.profiler._threads.pop(threading.get_ident(), None)
+        self.profiler._local.state = None
+        return False
+
+
+class Profiler:
+    """Профилировщик стадий и стеков выбранных запросов"""
+
+    def __init__(self, output_dir: str = DEFAULT_PROFILE_DIR, interval: float = 0.005,
+                 max_timings: int = 10000):
+        self.output_dir = output_dir
+        self.interval = interval
+        self.max_timings = max_timings
+        self.active = False
+        self.sample_rate = 1.0
+        self.deadline: Optional[float] = None
+        self.started_at: Optional[float] = None
+        self._local = threading.local()
+        self._threads: Dict[int, _RequestState] = {}
+        self._stacks: Counter = Counter()
+        self._timings: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=self.max_timings))
+        self._lock = threading.Lock()
+        self._sampler: Optional[threading.Thread] = None
+
+    def request(self, name: str):
+        """Контекст обработки запроса (корневая стадия)"""
+        if not self.active:
+            return _NULL
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return _NULL
+        return _RequestContext(self, name)
+
+    def stage(self, name: str):
+        """Контекст стадии внутри выбранного запроса"""
+        if not self.active:
+            return _NULL
+        state = getattr(self._local, 'state', None)
+        if state is None:
+            return _NULL
+        return _StageContext(self, state, name)
+
+    def start(self, duration: Optional[float] = 60.0, sample_rate: float = 1.0) -> bool:
+        """Включение на duration секунд (None — до stop()); False, если уже включен"""
+        with self._lock:
+            if self.active:
+                return False
+            self._stacks = Counter()
+            self._timings.clear()
+            self.sample_rate = max(0.0, min(1.0, sample_rate))
+            self.started_at = time.time()
+            self.deadline = time.time() + duration if duration else None
+            self.active = True
+            self._sampler = threading.Thread(target=self._sample_loop, name="profiler", daemon=True)
+            self._sampler.start()
+        logger.info(f"Профилирование включено: доля запросов {self.sample_rate}, "
+                    f"длительность {duration or 'до остановки'}")
+        return True
+
+    def stop(self) -> Optional[str]:
+        """Выключение и запись результатов; путь к файлу стеков или None"""
+        with self._lock:
+            if not self.active:
+                return None
+            self.active = False
+            sampler = self._sampler
+        if sampler is not None and sampler is not threading.current_thread():
+            sampler.join()
+        return self._write()
+
+    def _record(self, name: str, seconds: float):
+        self._timings[name].append(seconds)
+
+    def _sample_loop(self):
+        own = threading.get_ident()
+        while self.active:
+            if self.deadline is not None and time.time() >= self.deadline:
+                self.stop()
+                return
+            time.sleep(self.interval)
+            if not self._threads:
+                continue
+            frames = sys._current_frames()
+            for thread_id, state in list(self._threads.items()):
+                frame = frames.get(thread_id)
+                if frame is None or thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.reverse()
+                self._stacks[";".join(state.stages + stack)] += 1
+
+    def stage_summary(self) -> Dict[str, Dict[str, float]]:
+        """Статистика стадий: число, среднее, p50, p95, max (мс)"""
+        summary = {}
+        for name, values in list(self._timings.items()):
+            ordered = sorted(values)
+            if not ordered:
+                continue
+            summary[name] = {
+                'count': len(ordered),
+                'mean_ms': round(sum(ordered) / len(ordered) * 1000, 2),
+                'p50_ms': round(ordered[len(ordered) // 2] * 1000, 2),
+                'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 2),
+                'max_ms': round(ordered[-1] * 1000, 2),
+            }
+        return summary
+
+    def _write(self) -> Optional[str]:
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            stamp = datetime.fromtimestamp(self.started_at or time.time()).strftime('%Y%m%d-%H%M%S')
+            base = os.path.join(self.output_dir, f"profile-{stamp}")
+            with open(f"{base}.collapsed", 'w', encoding='utf-8') as f:
+                for stack, count in self._stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            with open(f"{base}.stages.json", 'w', encoding='utf-8') as f:
+                json.dump({
+                    'started_at': self.started_at,
+                    'sample_rate': self.sample_rate,
+                    'samples': sum(self._stacks.values()),
+                    'stages': self.stage_summary(),
+                }, f, ensure_ascii=False, indent=2)
+            logger.info(f"Профиль записан: {base}.collapsed ({sum(self._stacks.values())} снимков стеков)")
+            return f"{base}.collapsed"
+        except Exception as e:
+            logger.error(f"Ошибка записи профиля: {e}")
+            return None
+
+
+# Общий профилировщик процесса
+profiler = Profiler(os.getenv('PROFILE_DIR', DEFAULT_PROFILE_DIR))
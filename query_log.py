@@ -0,0 +1,122 @@
+"""
+Журнал запросов (обезличенный, с ротацией) и прогрев кэшей по нему после перезапуска
+"""
+
+import hashlib
+import hmac
+import logging
+import os
+import queue
+import secrets
+import threading
+import time
+from collections import Counter
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUERY_LOG_FILE = 'query_log.tsv'
+MAX_QUERY_LENGTH = 100
+
+
+def normalize_query(text: str) -> str:
+    """Запрос в нижнем регистре с одиночными пробелами (как в счетчиках популярности)"""
+    return ' '.join((text or '').lower().split())[:MAX_QUERY_LENGTH]
+
+
+def anonymize_user(user_id, salt: bytes) -> str:
+    """Обезличенный идентификатор пользователя"""
+    if user_id is None:
+        return '-'
+    return hmac.new(salt, str(user_id).encode('utf-8'), hashlib.sha256).hexdigest()[:12]
+
+
+class QueryLog:
+    """Ротируемый журнал нормализованных запросов
+
+    Строки "время<TAB>пользователь<TAB>запрос" пишутся через очередь и
+    фоновый поток, поэтому запись не задерживает ответ.
+    """
+
+    def __init__(self, path: str = DEFAULT_QUERY_LOG_FILE, max_bytes: int = 5 * 1024 * 1024,
+                 backups: int = 3, salt: Optional[str] = None):
+        self.path = path
+        self.backups = backups
+        self._salt = salt.encode('utf-8') if salt else secrets.token_bytes(16)
+        self._lock = threading.Lock()
+        self._warmed: frozenset = frozenset()
+        self.warmup = {'state': 'idle', 'queries': 0, 'seconds': 0.0, 'live': 0, 'hits': 0}
+
+        handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        self._queue: queue.Queue = queue.Queue(-1)
+        self._listener = QueueListener(self._queue, handler)
+        self._listener.start()
+        # Отдельный логгер без распространения: строки журнала не попадают в основной лог
+        self._logger = logging.getLogger(f"{__name__}.{id(self)}")
+        self._logger.propagate = False
+        self._logger.setLevel(logging.INFO)
+        self._logger.addHandler(QueueHandler(self._queue))
+
+    def append(self, query: str, user_id=None):
+        """Запись запроса (нормализуется здесь же)"""
+        normalized = normalize_query(query)
+        if not normalized:
+            return
+        self._logger.info(f"{int(time.time())}\t{anonymize_user(user_id, self._salt)}\t{normalized}")
+        if self._warmed:
+            with self._lock:
+                self.warmup['live'] += 1
+                if normalized in self._warmed:
+                    self.warmup['hits'] += 1
+
+    def files(self) -> List[str]:
+        """Файлы журнала от старых к новым"""
+        paths = [f"{self.path}.{number}" for number in range(self.backups, 0, -1)] + [self.path]
+        return [path for path in paths if os.path.exists(path)]
+
+    def top_queries(self, limit: int = 200) -> List[str]:
+        """Самые частые запросы по всем файлам журнала"""
+        counts: Counter = Counter()
+        for path in self.files():
+            try:
+                with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                    for line in f:
+                        parts = line.rstrip('\n').split('\t', 2)
+                        if len(parts) == 3 and parts[2]:
+                            counts[parts[2]] += 1
+            except OSError as e:
+                logger.error(f"Ошибка чтения журнала запросов {path}: {e}")
+        return [query for query, _ in counts.most_common(limit)]
+
+    def warm_up(self, replay, limit: int = 200) -> Dict:
+        """Прогрев: replay(queries) для самых частых запросов журнала"""
+        self.warmup.update(state='warming')
+        started = time.perf_counter()
+        queries = self.top_queries(limit)
+        try:
+            replay(queries)
+        except Exception as e:
+            logger.error(f"Ошибка прогрева по журналу запросов: {e}")
+        seconds = time.perf_counter() - started
+        with self._lock:
+            self._warmed = frozenset(queries)
+            self.warmup.update(state='done', queries=len(queries), seconds=round(seconds, 3), live=0, hits=0)
+        logger.info(f"Прогрев по журналу запросов: {len(queries)} запросов за {seconds:.2f}с")
+        return self.warmup_stats()
+
+    def warmup_stats(self) -> Dict:
+        """Состояние прогрева и доля живых запросов из прогретого набора"""
+        with self._lock:
+            stats = dict(self.warmup)
+        stats['hit_rate'] = round(stats['hits'] / stats['live'], 3) if stats['live'] else None
+        return stats
+
+    def close(self):
+        """Дописывает очередь и закрывает файл (повторный вызов ничего не делает)"""
+        if self._listener._thread is None:
+            return
+        self._listener.stop()
+        for handler in self._listener.handlers:
+            handler.close()
@@ -0,0 +1,266 @@
+"""
+Единый движок отрисовки ответов бота: карточки товаров и раскладка по сообщениям Telegram
+"""
+
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from duty_table import ad_valorem_rate, format_duty
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_LIMIT = 4096
+CARD_SEPARATOR = "\n\n" + "─" * 50 + "\n\n"
+
+# Символы разметки Telegram Markdown (parse_mode='Markdown')
+_MARKDOWN_ESCAPE = str.maketrans({'_': '\\_', '*': '\\*', '`': '\\`', '[': '\\['})
+
+# Коды сертификации, которые в базе означают "нет требований"
+_NO_CERTIFICATION = ('', '-', 'Не указана')
+
+COUNTRY_NAMES = {
+    'base': 'Базовая ставка',
+    'china': 'Китай',
+    'eu': 'ЕС',
+    'usa': 'США',
+}
+
+
+def escape_markdown(text: Any) -> str:
+    """Экранирование символов разметки Telegram Markdown"""
+    return str(text).translate(_MARKDOWN_ESCAPE)
+
+
+@dataclass
+class ProductView:
+    """Запись товара в единой схеме (текстовые поля уже экранированы)"""
+    code: str
+    name: str
+    description: str
+    group: str
+    duties: Dict[str, Any] = field(default_factory=dict)  # ставки по странам (английская схема)
+    duty_text: str = ''                                   # готовая строка пошлин (русская схема)
+    certification: List[str] = field(default_factory=list)
+    restrictions: List[str] = field(default_factory=list)
+
+
+def _as_list(value: Any) -> List[str]:
+    if not value:
+        return []
+    if isinstance(value, dict):
+        value = value.get('type', '')
+    if isinstance(value, str):
+        return [] if value.strip() in _NO_CERTIFICATION else [value]
+    return [str(item) for item in value]
+
+
+def normalize_product(product: Dict, escape: bool = True) -> ProductView:
+    """Запись в любой из схем ключей -> ProductView
+
+    Описание берется полным иерархическим (полное_описание), если оно есть.
+    """
+    def pick(*keys: str, default: Any = '') -> Any:
+        for key in keys:
+            value = product.get(key)
+            if value not in (None, ''):
+                return value
+        return default
+
+    duties = pick('duties', 'пошлина', default={})
+    duty_text = ''
+    if isinstance(duties, str):
+        duty_text, duties = duties, {}
+
+    text = escape_markdown if escape else str
+    return ProductView(
+        code=str(pick('code', 'код')),
+        name=text(pick('name', 'название')),
+        description=text(pick('полное_описание', 'description', 'описание')),
+        group=text(pick('group', 'группа')),
+        duties=duties if isinstance(duties, dict) else {},
+        duty_text=text(duty_text),
+        certification=[text(item) for item in _as_list(pick('certification', 'сертификация', default=[]))],
+        restrictions=[text(item) for item in _as_list(pick('restrictions', 'ограничения', default=[]))],
+    )
+
+
+def rate_emoji(rate: Optional[float]) -> str:
+    """Эмодзи в зависимости от адвалорной ставки"""
+    if rate is None:
+        return "❔"
+    elif rate == 0:
+        return "🆓"
+    elif rate <= 5:
+        return "💚"
+    elif rate <= 15:
+        return "💛"
+    elif rate <= 25:
+        return "🧡"
+    else:
+        return "🔴"
+
+
+def cert_emoji(cert: str) -> str:
+    """Эмодзи для типа сертификации"""
+    cert_lower = cert.lower()
+    if "тр тс" in cert_lower:
+        return "🛡️"
+    elif "сэс" in cert_lower:
+        return "🩺"
+    elif "ветеринарное" in cert_lower:
+        return "🐾"
+    elif "фитосанитарное" in cert_lower:
+        return "🌱"
+    else:
+        return "📋"
+
+
+# Шаблоны карточки ved_router
+_ROUTER_HEAD = "🏷️ *{name}*\n📋 Код ТН ВЭД: `{code}`\n".format
+_ROUTER_DESCRIPTION = "📝 {}\n".format
+_ROUTER_GROUP = "🔍 Группа: {}\n\n💰 *Пошлины:*\n".format
+_ROUTER_DUTY = "• {label}: {rate} {emoji}\n".format
+_ROUTER_DUTY_TEXT = "• {}\n".format
+_ROUTER_EAEU = "• Беларусь: {belarus} 🆓\n• Казахстан: {kazakhstan} 🆓\n\n".format
+_ROUTER_ITEM = "• {}\n".format
+_ROUTER_CERT = "• {} {}\n".format
+_ROUTER_FOOTER = "🤖 Хотите AI-анализ? Напишите: `анализ {}`\n".format
+
+# Шаблон карточки VEDDatabase
+_DATABASE_CARD = ("📦 **Код ТН ВЭД:** {code}\n"
+                  "📝 **Название:** {name}\n"
+                  "📋 **Описание:** {description}\n"
+                  "📂 **Группа:** {group}\n"
+                  "💰 **Пошлина:** {duty}\n"
+                  "✅ **Сертификация:** {cert}").format
+
+# Шаблоны блока официальных данных enhanced_ved_system
+_ENHANCED_HEAD = "📌 **{name}**\n🔢 Код: `{code}`\n📝 {description}".format
+_ENHANCED_DUTY = "\n  • {}: {}".format
+
+
+def render_router_card(view: ProductView) -> str:
+    """Статическая часть карточки ved_router (без счетчика запросов)"""
+    parts = [_ROUTER_HEAD(name=view.name or 'Название не найдено', code=view.code or 'Неизвестно')]
+    if view.description:
+        parts.append(_ROUTER_DESCRIPTION(view.description))
+    parts.append(_ROUTER_GROUP(view.group))
+
+    if view.duties or not view.duty_text:
+        for key, label in COUNTRY_NAMES.items():
+            rate = view.duties.get(key, 0)
+            parts.append(_ROUTER_DUTY(label=label, rate=format_duty(rate), emoji=rate_emoji(ad_valorem_rate(rate))))
+    else:
+        parts.append(_ROUTER_DUTY_TEXT(view.duty_text))
+    parts.append(_ROUTER_EAEU(belarus=format_duty(view.duties.get('belarus', 0)),
+                              kazakhstan=format_duty(view.duties.get('kazakhstan', 0))))
+
+    if view.certification:
+        parts.append("📜 *Сертификация:*\n")
+        parts.extend(_ROUTER_CERT(cert, cert_emoji(cert)) for cert in view.certification)
+        parts.append("\n")
+
+    if view.restrictions:
+        parts.append("⚠️ *Ограничения:*\n")
+        parts.extend(_ROUTER_ITEM(restriction) for restriction in view.restrictions)
+        parts.append("\n")
+    else:
+        parts.append("✅ *Ограничения:* отсутствуют\n\n")
+
+    parts.append(_ROUTER_FOOTER(view.code or 'Неизвестно'))
+    return "".join(parts)
+
+
+def render_database_card(view: ProductView, certification: Optional[str] = None) -> str:
+    """Карточка VEDDatabase; certification — готовый (неэкранированный) текст требований"""
+    if certification is not None:
+        cert = escape_markdown(certification)
+    else:
+        cert = "; ".join(view.certification) or 'Не указана'
+    return _DATABASE_CARD(
+        code=view.code or 'Не указан',
+        name=view.name or 'Не указано',
+        description=view.description or 'Не указано',
+        group=view.group or 'Не указана',
+        duty=view.duty_text or _duties_line(view.duties) or 'Не указана',
+        cert=cert,
+    )
+
+
+def render_official_data(view: ProductView) -> str:
+    """Блок официальных данных enhanced_ved_system"""
+    parts = [_ENHANCED_HEAD(name=view.name or 'Товар', code=view.code or 'Н/Д',
+                            description=view.description or 'Описание отсутствует')]
+    if view.duties:
+        parts.append("\n💰 **Пошлины:**")
+        parts.extend(_ENHANCED_DUTY(COUNTRY_NAMES.get(country, country.capitalize()), format_duty(rate))
+                     for country, rate in view.duties.items())
+    elif view.duty_text:
+        parts.append(f"\n💰 **Пошлины:** {view.duty_text}")
+    if view.certification:
+        parts.append(f"\n📄 **Сертификация:** {', '.join(view.certification)}")
+    if view.restrictions:
+        parts.append(f"\n⚠️ **Ограничения:** {', '.join(view.restrictions)}")
+    else:
+        parts.append("\n✅ **Ограничения:** отсутствуют")
+    return "".join(parts)
+
+
+def _duties_line(duties: Dict[str, Any]) -> str:
+    return ", ".join(f"{country}: {format_duty(rate)}" for country, rate in duties.items())
+
+
+def _split_text(text: str, limit: int) -> Iterator[str]:
+    """Части текста не длиннее limit, разрезанные по строкам (карточка длиннее лимита)"""
+    if len(text) <= limit:
+        yield text
+        return
+    piece: List[str] = []
+    size = 0
+    for line in text.split("\n"):
+        while len(line) > limit:
+            if piece:
+                yield "\n".join(piece)
+                piece, size = [], 0
+            yield line[:limit]
+            line = line[limit:]
+        added = len(line) + (1 if piece else 0)
+        if piece and size + added > limit:
+            yield "\n".join(piece)
+            piece, size, added = [], 0, len(line)
+        piece.append(line)
+        size += added
+    if piece:
+        yield "\n".join(piece)
+
+
+def chunk_messages(cards: Iterable[str], header: str = "", separator: str = CARD_SEPARATOR,
+                   footer: str = "", limit: int = TELEGRAM_LIMIT) -> Iterator[str]:
+    """Раскладка карточек по сообщениям не длиннее limit
+
+    Карточки читаются из итератора по одной; сообщение отдается, как
+    только следующая карточка в него не помещается. header — начало
+    первого сообщения, footer — конец последнего. Карточка длиннее
+    лимита режется по строкам.
+    """
+    current: List[str] = []
+    size = len(header)
+    prefix = header
+
+    for card in cards:
+        for piece in _split_text(card, limit):
+            added = len(piece) + (len(separator) if current else 0)
+            if size + added > limit and (current or prefix):
+                yield prefix + separator.join(current) if current else prefix.rstrip()
+                current, size, prefix = [], 0, ""
+                added = len(piece)
+            current.append(piece)
+            size += added
+
+    if footer and size + len(footer) > limit and (current or prefix):
+        yield prefix + separator.join(current)
+        current, prefix = [], ""
+    message = prefix + separator.join(current) + footer
+    if message:
+        yield message
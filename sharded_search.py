@@ -0,0 +1,485 @@
+"""
+Шардированный текстовый поиск по главам ТН ВЭД в процессах-воркерах над mmap-сегментами
+"""
+
+import heapq
+import json
+import logging
+import mmap
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter, defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from itertools import count, islice
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_MAGIC = b'VEDSHRD1'
+_HEADER = struct.Struct('<8sq')  # магия, число строк
+ROW_SEPARATOR = b'\x00'
+
+
+def default_shards() -> int:
+    return max(1, os.cpu_count() or 1)
+
+
+def assign_chapters(sizes: Dict[str, int], shards: int) -> List[List[str]]:
+    """Жадное распределение глав по шардам: крупные главы — в наименее загруженный шард"""
+    heap = [(0, shard) for shard in range(shards)]
+    assignment: List[List[str]] = [[] for _ in range(shards)]
+    for chapter in sorted(sizes, key=lambda name: (-sizes[name], name)):
+        load, shard = heapq.heappop(heap)
+        assignment[shard].append(chapter)
+        heapq.heappush(heap, (load + sizes[chapter], shard))
+    return assignment
+
+
+def write_segment(path: str, rows: Sequence[Tuple[int, str]]):
+    """Сегмент шарда из пар (позиция в базе, строка поиска) в порядке позиций
+
+    Запись во временный файл и os.replace: воркер, читающий старый
+    сегмент, продолжает работать со своей копией до команды load.
+    """
+    offsets = array('q', [0])
+    positions = array('q')
+    chunks = []
+    total = 0
+    for position, text in rows:
+        data = text.encode('utf-8') + ROW_SEPARATOR
+        chunks.append(data)
+        total += len(data)
+        offsets.append(total)
+        positions.append(position)
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(SEGMENT_MAGIC, len(positions)))
+        offsets.tofile(f)
+        positions.tofile(f)
+        f.write(b''.join(chunks) or ROW_SEPARATOR)
+    os.replace(tmp_path, path)
+
+
+class Segment:
+    """Сегмент шарда, отображенный в память (сторона воркера)"""
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, rows = _HEADER.unpack_from(self._mm, 0)
+        if magic != SEGMENT_MAGIC:
+            raise ValueError(f"Некорректный сегмент {path}")
+        view = memoryview(self._mm)
+        offsets_start = _HEADER.size
+        positions_start = offsets_start + (rows + 1) * 8
+        self.text_start = positions_start + rows * 8
+        self.offsets = view[offsets_start:positions_start].cast('q')
+        self.positions = view[positions_start:self.text_start].cast('q')
+        self.rows = rows
+
+    def _row_at(self, offset: int) -> int:
+        return bisect_right(self.offsets, offset - self.text_start) - 1
+
+    def find(self, needle: bytes, start_position: int = 0, k: Optional[int] = None) -> List[int]:
+        """Позиции записей (по возрастанию) с подстрокой needle, начиная с start_position"""
+        found: List[int] = []
+        row = bisect_left(self.positions, start_position)
+        if row >= self.rows:
+            return found
+        offset = self.text_start + self.offsets[row]
+        end = self.text_start + self.offsets[self.rows]
+        mm = self._mm
+        while k is None or len(found) < k:
+            hit = mm.find(needle, offset, end)
+            if hit < 0:
+                break
+            row = self._row_at(hit)
+            found.append(self.positions[row])
+            offset = self.text_start + self.offsets[row + 1]
+        return found
+
+    def keyword_hits(self, keywords: Iterable[bytes], k: int) -> List[Tuple[int, int]]:
+        """top-k пар (число совпавших слов, позиция)"""
+        scores: Counter = Counter()
+        for keyword in keywords:
+            scores.update(self.find(keyword))
+        best = heapq.nsmallest(k, scores.items(), key=lambda item: (-item[1], item[0]))
+        return [(score, position) for position, score in best]
+
+    def close(self):
+        self.offsets.release()
+        self.positions.release()
+        self._mm.close()
+
+
+def worker_main(path: str):
+    """Цикл воркера: JSON-запрос из stdin -> JSON-ответ в stdout"""
+    # Обмен всегда в UTF-8, независимо от локали и PYTHONIOENCODING
+    sys.stdin.reconfigure(encoding='utf-8')
+    sys.stdout.reconfigure(encoding='utf-8')
+    segment = Segment(path)
+    for line in sys.stdin:
+        request = None
+        try:
+            request = json.loads(line)
+            op = request.get('op')
+            if op == 'search':
+                result = segment.find(request['q'].encode('utf-8'), request.get('start', 0), request.get('k'))
+            elif op == 'keywords':
+                result = segment.keyword_hits((word.encode('utf-8') for word in request['q']), request['k'])
+            elif op == 'load':
+                segment.close()
+                segment = Segment(request.get('path', path))
+                result = segment.rows
+            elif op == 'ping':
+                result = segment.rows
+            else:
+                raise ValueError(f"неизвестная операция {op!r}")
+            response = {'id': request.get('id'), 'ok': True, 'result': result}
+        except Exception as e:
+            response = {'id': request.get('id') if isinstance(request, dict) else None, 'ok': False, 'error': str(e)}
+        sys.stdout.write(json.dumps(response) + "\n")
+        sys.stdout.flush()
+
+
+class _Worker:
+    """Процесс-воркер шарда: запросы пишутся под своей блокировкой, ответы разбираются по id
+
+    Поток-читатель передает ответ ожидающему запросу; ответ на запрос,
+    который уже не ждут (истек срок), отбрасывается.
+    """
+
+    def __init__(self, path: str):
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), 'worker', path],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, encoding='utf-8', bufsize=1,
+            env=dict(os.environ, PYTHONIOENCODING='utf-8'),
+        )
+        self._write_lock = threading.Lock()
+        self._pending: Dict[int, Future] = {}
+        self._pending_lock = threading.Lock()
+        self.alive = True
+        self._reader = threading.Thread(target=self._read_loop, name=f"shard-{self.process.pid}", daemon=True)
+        self._reader.start()
+
+    def send(self, request_id: int, request: Dict) -> Future:
+        future: Future = Future()
+        with self._pending_lock:
+            if not self.alive:
+                raise RuntimeError(f"воркер {self.process.pid} завершился")
+            self._pending[request_id] = future
+        try:
+            with self._write_lock:
+                self.process.stdin.write(json.dumps(dict(request, id=request_id), ensure_ascii=False) + "\n")
+                self.process.stdin.flush()
+        except Exception:
+            self.forget(request_id)
+            raise
+        return future
+
+    def forget(self, request_id: int):
+        with self._pending_lock:
+            self._pending.pop(request_id, None)
+
+    def _read_loop(self):
+        for line in self.process.stdout:
+            try:
+                response = json.loads(line)
+            except ValueError:
+                continue
+            with self._pending_lock:
+                future = self._pending.pop(response.get('id'), None)
+            if future is None:
+                continue
+            if response.get('ok'):
+                future.set_result(response['result'])
+            else:
+                future.set_exception(RuntimeError(response.get('error')))
+        with self._pending_lock:
+            self.alive = False
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            future.set_exception(RuntimeError(f"воркер {self.process.pid} завершился"))
+
+    def stop(self, timeout: float):
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=timeout)
+        except Exception:
+            self.process.kill()
+
+
+class ShardedSearch:
+    """Поиск по строкам, разделенным по главам между процессами-воркерами
+
+    Строки подаются парами (позиция, глава, строка поиска); позиции —
+    номера записей в базе вызывающего кода, по ним сливаются ответы.
+    Запросы из разных потоков выполняются одновременно; ответ, не
+    пришедший за timeout секунд, считается отказом (None — вызывающий
+    код ищет последовательным просмотром).
+    """
+
+    def __init__(self, shards: Optional[int] = None, segment_dir: Optional[str] = None,
+                 timeout: float = 5.0):
+        self.shards = shards or default_shards()
+        self.timeout = timeout
+        self._own_dir = segment_dir is None
+        self.segment_dir = segment_dir or tempfile.mkdtemp(prefix='ved_shards_')
+        os.makedirs(self.segment_dir, exist_ok=True)
+        self._workers: List[_Worker] = []
+        self._lock = threading.Lock()  # запуск, перезагрузка и остановка воркеров
+        self._request_ids = count()
+        self._stats_lock = threading.Lock()
+        self.version: Optional[str] = None
+        self.rows = 0
+        # Строки по главам и распределение глав: патч переписывает только шарды своих глав
+        self._chapters: Dict[str, List[Tuple[int, str]]] = defaultdict(list)
+        self._position_chapter: Dict[int, str] = {}
+        self._assignment: Dict[str, int] = {}
+        self._shard_sizes: List[int] = [0] * self.shards
+        self.stats = {'queries': 0, 'errors': 0, 'timeouts': 0, 'builds': 0, 'build_seconds': 0.0,
+                      'updates': 0, 'updated_shards': 0}
+
+    def _segment_path(self, shard: int) -> str:
+        return os.path.join(self.segment_dir, f"shard-{shard:02d}.seg")
+
+    def build(self, rows: Iterable[Tuple[int, str, str]], version: Optional[str] = None):
+        """Запись сегментов и (пере)загрузка воркеров"""
+        started = time.perf_counter()
+        chapters: Dict[str, List[Tuple[int, str]]] = defaultdict(list)
+        position_chapter: Dict[int, str] = {}
+        sizes: Counter = Counter()
+        for position, chapter, text in rows:
+            if not text:
+                continue
+            chapters[chapter].append((position, text))
+            position_chapter[position] = chapter
+            sizes[chapter] += len(text)
+
+        assignment = assign_chapters(sizes, self.shards)
+        self._chapters = chapters
+        self._position_chapter = position_chapter
+        self._assignment = {chapter: shard for shard, shard_chapters in enumerate(assignment)
+                            for chapter in shard_chapters}
+        self._shard_sizes = [sum(sizes[chapter] for chapter in shard_chapters) for shard_chapters in assignment]
+        self._reload(range(self.shards), version)
+        seconds = time.perf_counter() - started
+        self.stats['builds'] += 1
+        self.stats['build_seconds'] = round(seconds, 3)
+        logger.info(f"Шардированный поиск: {self.rows} строк, {len(chapters)} глав, "
+                    f"{self.shards} шардов за {seconds:.2f}с")
+
+    def update(self, rows: Iterable[Tuple[int, str, str]], version: Optional[str] = None) -> int:
+        """Изменение отдельных строк (патч базы); число переписанных шардов
+
+        rows — (позиция, глава, строка поиска), пустая строка — запись удалена.
+        Переписываются и перечитываются только шарды затронутых глав;
+        новая глава уходит в наименее загруженный шард.
+        """
+        touched = set()
+        for position, chapter, text in rows:
+            old_chapter = self._position_chapter.pop(position, None)
+            if old_chapter is not None:
+                chapter_rows = self._chapters[old_chapter]
+                index = bisect_left(chapter_rows, (position,))
+                shard = self._assignment[old_chapter]
+                self._shard_sizes[shard] -= len(chapter_rows[index][1])
+                del chapter_rows[index]
+                touched.add(shard)
+            if not text:
+                continue
+            if chapter not in self._assignment:
+                self._assignment[chapter] = min(range(self.shards), key=self._shard_sizes.__getitem__)
+            shard = self._assignment[chapter]
+            insort(self._chapters[chapter], (position, text))
+            self._position_chapter[position] = chapter
+            self._shard_sizes[shard] += len(text)
+            touched.add(shard)
+
+        self._reload(sorted(touched), version)
+        self.stats['updates'] += 1
+        self.stats['updated_shards'] += len(touched)
+        return len(touched)
+
+    def _reload(self, shards: Iterable[int], version: Optional[str]):
+        """Запись сегментов шардов и их перечитывание воркерами"""
+        shards = list(shards)
+        shard_chapters: Dict[int, List[str]] = defaultdict(list)
+        for chapter, shard in self._assignment.items():
+            shard_chapters[shard].append(chapter)
+        for shard in shards:
+            rows = heapq.merge(*(self._chapters[chapter] for chapter in shard_chapters[shard]))
+            write_segment(self._segment_path(shard), list(rows))
+
+        with self._lock:
+            # Пока воркеры перечитывают сегменты, версия не совпадает ни с какой базой
+            self.version = None
+            if not self._workers:
+                self._start_workers()
+            elif shards:
+                self._broadcast([self._workers[shard] for shard in shards], [{'op': 'load'}] * len(shards))
+            self.version = version
+            self.rows = len(self._position_chapter)
+
+    def _start_workers(self):
+        workers = [_Worker(self._segment_path(shard)) for shard in range(self.shards)]
+        try:
+            self._broadcast(workers, [{'op': 'ping'}] * self.shards)
+        except Exception:
+            for worker in workers:
+                worker.stop(self.timeout)
+            raise
+        self._workers = workers
+
+    def _broadcast(self, workers: List[_Worker], requests: List[Dict]) -> List:
+        """Отправка запросов всем воркерам и сбор ответов не дольше timeout
+
+        Сначала запросы уходят всем шардам, затем ожидаются ответы, поэтому
+        шарды работают одновременно. FutureTimeoutError — ответ не успел.
+        """
+        deadline = time.monotonic() + self.timeout
+        sent: List[Tuple[_Worker, int, Future]] = []
+        try:
+            for worker, request in zip(workers, requests):
+                request_id = next(self._request_ids)
+                sent.append((worker, request_id, worker.send(request_id, request)))
+            return [future.result(max(0.0, deadline - time.monotonic())) for _, _, future in sent]
+        finally:
+            for worker, request_id, _ in sent:
+                worker.forget(request_id)
+
+    def _query(self, request: Dict) -> Optional[List]:
+        workers = self._workers
+        if not workers:
+            return None
+        self._count('queries')
+        try:
+            return self._broadcast(workers, [request] * len(workers))
+        except FutureTimeoutError:
+            self._count('timeouts')
+            logger.warning(f"Шардированный поиск не ответил за {self.timeout}с, последовательный просмотр")
+            return None
+        except Exception as e:
+            self._count('errors')
+            logger.error(f"Ошибка шардированного поиска: {e}")
+            with self._lock:
+                if self._workers is workers:
+                    self._stop_workers()
+            return None
+
+    def _count(self, name: str):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def search(self, query: str, k: int = 10, start: int = 0) -> Optional[List[int]]:
+        """Первые k позиций (>= start) со строкой query; None — шарды недоступны"""
+        results = self._query({'op': 'search', 'q': query.lower(), 'k': k, 'start': start})
+        if results is None:
+            return None
+        return list(islice(heapq.merge(*results), k))
+
+    def search_keywords(self, keywords: Sequence[str], k: int = 10) -> Optional[List[Tuple[int, int]]]:
+        """top-k пар (число совпавших слов, позиция); None — шарды недоступны"""
+        results = self._query({'op': 'keywords', 'q': [word.lower() for word in keywords], 'k': k})
+        if results is None:
+            return None
+        hits = (tuple(hit) for shard_hits in results for hit in shard_hits)
+        return heapq.nsmallest(k, hits, key=lambda hit: (-hit[0], hit[1]))
+
+    @property
+    def active(self) -> bool:
+        return bool(self._workers)
+
+    def _stop_workers(self):
+        workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.stop(self.timeout)
+
+    def close(self):
+        """Остановка воркеров и удаление временных сегментов"""
+        with self._lock:
+            self._stop_workers()
+        if self._own_dir:
+            shutil.rmtree(self.segment_dir, ignore_errors=True)
+
+
+# Число одновременных клиентов в замере
+BENCH_CLIENTS = 8
+
+
+def _bench_queries(texts: Sequence[str], count: int = 40) -> List[str]:
+    """Запросы для замера: частые и редкие слова из самой базы"""
+    words: Counter = Counter()
+    for text in texts:
+        words.update(word for word in text.split() if len(word) >= 5 and word.isalpha())
+    ordered = [word for word, _ in words.most_common()]
+    half = count // 2
+    return ordered[:half] + ordered[-half:]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == 'worker':
+        worker_main(sys.argv[2])
+        sys.exit(0)
+
+    logging.basicConfig(level=logging.INFO)
+
+    if len(sys.argv) < 2 or sys.argv[1] != 'bench':
+        print("Использование: python sharded_search.py bench [tnved_database.json] [множитель] [шарды...]")
+        sys.exit(1)
+
+    from ved_database import VEDDatabase
+    db = VEDDatabase(sys.argv[2] if len(sys.argv) > 2 else 'tnved_database.json')
+    scale = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+    shard_counts = [int(value) for value in sys.argv[4:]] or sorted({1, 2, 4, default_shards()})
+
+    # Номенклатура в scale раз больше: копии строк со своими позициями
+    base_rows = [(position, item.get('группа') or item['код'][:2], db.search_line(item))
+                 for position, item in db.iter_all_products()]
+    size = len(db.data)
+    rows = [(copy * size + position, chapter, text)
+            for copy in range(scale) for position, chapter, text in base_rows]
+    texts = [text for _, _, text in rows]
+    queries = _bench_queries([text for _, _, text in base_rows])
+    print(f"Строк: {len(rows)} (x{scale}), запросов: {len(queries)}, ядер: {os.cpu_count()}")
+
+    started = time.perf_counter()
+    for query in queries:
+        scores: Counter = Counter()
+        for word in query.split():
+            scores.update(position for position, text in enumerate(texts) if word in text)
+        heapq.nsmallest(10, scores.items(), key=lambda item: (-item[1], item[0]))
+    linear = (time.perf_counter() - started) / len(queries)
+    print(f"Последовательный просмотр: {linear * 1000:.2f} мс/запрос")
+
+    baseline = None
+    for shards in shard_counts:
+        engine = ShardedSearch(shards)
+        try:
+            engine.build(rows)
+            started = time.perf_counter()
+            for query in queries:
+                engine.search_keywords(query.split(), 10)
+            elapsed = (time.perf_counter() - started) / len(queries)
+            baseline = baseline or elapsed
+
+            # Одновременные запросы из нескольких потоков (как обработчики вебхука)
+            with ThreadPoolExecutor(BENCH_CLIENTS) as pool:
+                started = time.perf_counter()
+                list(pool.map(lambda query: engine.search_keywords(query.split(), 10), queries * BENCH_CLIENTS))
+                throughput = len(queries) * BENCH_CLIENTS / (time.perf_counter() - started)
+            print(f"Шардов {shards}: {elapsed * 1000:.2f} мс/запрос, ускорение к 1 шарду x{baseline / elapsed:.2f}, "
+                  f"к последовательному x{linear / elapsed:.2f}; {BENCH_CLIENTS} клиентов: "
+                  f"{throughput:.0f} запросов/с, таймаутов {engine.stats['timeouts']}")
+        finally:
+            engine.close()
@@ -0,0 +1,213 @@
+"""
+Офлайн-индекс похожих кодов ТН ВЭД (TF-IDF по символьным n-граммам)
+"""
+
+import json
+import logging
+import math
+import re
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from hierarchy import build_full_descriptions
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_FILE = Path(__file__).parent / 'similar_codes.npz'
+
+NGRAM_SIZE = 3
+_WORD_RE = re.compile(r'[a-zа-яё0-9]+')
+
+
+def product_text(item: Dict, full_description: Optional[str] = None) -> str:
+    """Текст товара для индекса (исходная запись tnved_database.json)
+
+    full_description — полное иерархическое описание (hierarchy.py) вместо фрагмента.
+    """
+    name = str(item.get('name', '')).strip()
+    description = full_description or str(item.get('description', '')).strip()
+    if name and name != '-':
+        return f"{name} {description}"
+    return description
+
+
+def _ngrams(text: str) -> Counter:
+    """Символьные n-граммы слов текста (слово дополняется пробелами по краям)"""
+    grams: Counter = Counter()
+    for word in _WORD_RE.findall(text.lower().replace('ё', 'е')):
+        padded = f" {word} "
+        for i in range(max(1, len(padded) - NGRAM_SIZE + 1)):
+            grams[padded[i:i + NGRAM_SIZE]] += 1
+    return grams
+
+
+def _tfidf_matrix(docs: List[Counter], vocabulary: Dict[str, int], idf):
+    """CSR-матрица TF-IDF (сублинейный tf, L2-нормировка строк)"""
+    import numpy as np
+    from scipy import sparse
+
+    indptr = [0]
+    indices: List[int] = []
+    values: List[float] = []
+    for grams in docs:
+        for gram, count in grams.items():
+            column = vocabulary.get(gram)
+            if column is not None:
+                indices.append(column)
+                values.append(1.0 + math.log(count))
+        indptr.append(len(indices))
+
+    matrix = sparse.csr_matrix(
+        (np.asarray(values, dtype=np.float32), np.asarray(indices, dtype=np.int32),
+         np.asarray(indptr, dtype=np.int64)),
+        shape=(len(docs), len(vocabulary))
+    )
+    matrix = matrix.multiply(idf.reshape(1, -1)).tocsr()
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sparse.diags(1.0 / norms).dot(matrix).astype(np.float32).tocsr()
+
+
+def _top_k(scores, k: int) -> Tuple["np.ndarray", "np.ndarray"]:
+    """Индексы и значения k наибольших элементов в каждой строке плотной матрицы"""
+    import numpy as np
+
+    k = min(k, scores.shape[1])
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-part_scores, axis=1)
+    return np.take_along_axis(part, order, axis=1), np.take_along_axis(part_scores, order, axis=1)
+
+
+def build_index(json_file: str = 'tnved_database.json', out_file: Optional[str] = None,
+                k: int = 10, batch_size: int = 512, texts: Optional[Dict[str, str]] = None) -> str:
+    """Строит индекс похожих кодов и сохраняет его в .npz
+
+    texts — готовые тексты по кодам (если не заданы, берутся из product_text).
+    """
+    import numpy as np
+
+    started = time.time()
+    out_file = str(out_file or DEFAULT_INDEX_FILE)
+
+    if texts is None:
+        with open(json_file, 'r', encoding='utf-8') as f:
+            items = json.load(f)
+        full = build_full_descriptions(
+            (str(item.get('code', '')).strip(), str(item.get('description', ''))) for item in items
+        )
+        texts = {}
+        for item, full_description in zip(items, full):
+            code = str(item.get('code', '')).strip()
+            if code and code not in texts:
+                texts[code] = product_text(item, full_description)
+
+    codes = list(texts)
+    docs = [_ngrams(texts[code]) for code in codes]
+
+    document_frequency: Counter = Counter()
+    for grams in docs:
+        document_frequency.update(grams.keys())
+    vocabulary = {gram: i for i, gram in enumerate(sorted(document_frequency))}
+    n_docs = len(docs)
+    idf = np.array(
+        [math.log((1 + n_docs) / (1 + document_frequency[gram])) + 1.0 for gram in sorted(document_frequency)],
+        dtype=np.float32
+    )
+
+    matrix = _tfidf_matrix(docs, vocabulary, idf)
+    matrix_t = matrix.T.tocsr()
+
+    neighbors = np.zeros((n_docs, min(k, max(n_docs - 1, 1))), dtype=np.int32)
+    scores = np.zeros(neighbors.shape, dtype=np.float32)
+    for start in range(0, n_docs, batch_size):
+        stop = min(start + batch_size, n_docs)
+        block = matrix[start:stop].dot(matrix_t).toarray()
+        # Сам код не считается своим соседом
+        block[np.arange(stop - start), np.arange(start, stop)] = -1.0
+        idx, val = _top_k(block, neighbors.shape[1])
+        neighbors[start:stop] = idx
+        scores[start:stop] = val
+
+    np.savez_compressed(
+        out_file,
+        codes=np.array(codes),
+        texts=np.array([texts[code] for code in codes]),
+        neighbors=neighbors,
+        scores=scores,
+        vocabulary=np.array(sorted(document_frequency)),
+        idf=idf,
+        data=matrix.data, indices=matrix.indices, indptr=matrix.indptr,
+        shape=np.array(matrix.shape),
+    )
+    logger.info(f"Индекс похожих кодов построен: {n_docs} кодов за {time.time() - started:.1f}с -> {out_file}")
+    return out_file
+
+
+class SimilarCodesIndex:
+    """Загруженный индекс похожих кодов"""
+
+    def __init__(self, path: str):
+        import numpy as np
+        from scipy import sparse
+
+        with np.load(path) as npz:
+            self.codes = [str(code) for code in npz['codes']]
+            self.texts = [str(text) for text in npz['texts']]
+            self.neighbors = npz['neighbors']
+            self.scores = npz['scores']
+            self.vocabulary = {str(gram): i for i, gram in enumerate(npz['vocabulary'])}
+            self.idf = npz['idf']
+            self.matrix_t = sparse.csr_matrix(
+                (npz['data'], npz['indices'], npz['indptr']), shape=tuple(npz['shape'])
+            ).T.tocsr()
+        self.rows = {code: i for i, code in enumerate(self.codes)}
+
+    def text(self, code: str) -> str:
+        """Текст, по которому код попал в индекс"""
+        row = self.rows.get(code)
+        return self.texts[row] if row is not None else ''
+
+    @classmethod
+    def load_default(cls) -> Optional["SimilarCodesIndex"]:
+        """Индекс из файла по умолчанию или None, если он не собран или нет NumPy/SciPy"""
+        if not DEFAULT_INDEX_FILE.exists():
+            return None
+        try:
+            return cls(str(DEFAULT_INDEX_FILE))
+        except Exception as e:
+            logger.error(f"Ошибка загрузки индекса похожих кодов: {e}")
+            return None
+
+    def similar(self, code: str, k: int = 5) -> List[Tuple[str, float]]:
+        """k заранее посчитанных соседей кода: O(1) на запрос"""
+        row = self.rows.get(code)
+        if row is None:
+            return []
+        return [(self.codes[j], float(score))
+                for j, score in zip(self.neighbors[row][:k], self.scores[row][:k]) if score > 0]
+
+    def query(self, texts: Iterable[str], k: int = 5) -> List[List[Tuple[str, float]]]:
+        """Соседи произвольных текстов: все тексты одним разреженным умножением"""
+        texts = list(texts)
+        if not texts:
+            return []
+        vectors = _tfidf_matrix([_ngrams(text) for text in texts], self.vocabulary, self.idf)
+        block = vectors.dot(self.matrix_t).toarray()
+        idx, val = _top_k(block, k)
+        return [
+            [(self.codes[j], float(score)) for j, score in zip(row_idx, row_val) if score > 0]
+            for row_idx, row_val in zip(idx, val)
+        ]
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    if len(sys.argv) >= 2 and sys.argv[1] == 'build':
+        build_index(*sys.argv[2:4])
+    else:
+        print("Использование: python similar_codes.py build [tnved_database.json] [similar_codes.npz]")
@@ -0,0 +1,308 @@
+"""
+Вероятностные структуры фиксированного размера для статистики
+"""
+
+import hashlib
+import heapq
+import math
+import threading
+import time
+from operator import itemgetter
+from typing import Dict, Hashable, List, Optional, Tuple
+
+
+class SpaceSaving:
+    """Алгоритм Space-Saving (Metwally и др.) со структурой stream-summary
+
+    Хранит не более capacity счетчиков. Счетчики сгруппированы по значению,
+    поэтому и инкремент, и вытеснение минимального выполняются за O(1).
+    Оценка частоты завышена не более чем на error элемента.
+    """
+
+    def __init__(self, capacity: int = 200):
+        self.capacity = capacity
+        self._counts: Dict[Hashable, int] = {}
+        self._errors: Dict[Hashable, int] = {}
+        # значение счетчика -> элементы с этим значением (dict как упорядоченное множество)
+        self._buckets: Dict[int, Dict[Hashable, None]] = {}
+        self._min = 0
+        self.total = 0
+
+    def _move(self, item: Hashable, old: int, new: int):
+        bucket = self._buckets[old]
+        del bucket[item]
+        if not bucket:
+            del self._buckets[old]
+            if old == self._min:
+                self._min = new
+        self._buckets.setdefault(new, {})[item] = None
+        self._counts[item] = new
+
+    def add(self, item: Hashable) -> Optional[Tuple[Hashable, int]]:
+        """Учесть одно появление элемента; вытесненный элемент и его счетчик или None"""
+        self.total += 1
+        count = self._counts.get(item)
+        if count is not None:
+            self._move(item, count, count + 1)
+            return None
+
+        if len(self._counts) < self.capacity:
+            self._counts[item] = 1
+            self._errors[item] = 0
+            self._buckets.setdefault(1, {})[item] = None
+            self._min = 1
+            return None
+
+        # Вытесняем элемент с минимальным счетчиком, новый наследует его значение
+        victim = next(iter(self._buckets[self._min]))
+        floor = self._min
+        del self._counts[victim]
+        del self._errors[victim]
+        bucket = self._buckets[floor]
+        del bucket[victim]
+        if not bucket:
+            del self._buckets[floor]
+        self._counts[item] = floor + 1
+        self._errors[item] = floor
+        self._buckets.setdefault(floor + 1, {})[item] = None
+        if floor not in self._buckets:
+            self._min = floor + 1
+        return victim, floor
+
+    def estimate(self, item: Hashable) -> int:
+        """Оценка частоты элемента (0, если он не отслеживается)"""
+        return self._counts.get(item, 0)
+
+    def top(self, k: int = 5) -> List[Tuple[Hashable, int]]:
+        """k самых частых элементов: O(B log k), B — число разных значений счетчиков (<= capacity)"""
+        result: List[Tuple[Hashable, int]] = []
+        for count in heapq.nlargest(k, self._buckets):
+            for item in self._buckets[count]:
+                result.append((item, count))
+                if len(result) >= k:
+                    return result
+        return result
+
+    def items(self) -> Dict[Hashable, int]:
+        return dict(self._counts)
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+
+class HyperLogLog:
+    """Оценка числа уникальных элементов в 2^p байт"""
+
+    def __init__(self, p: int = 12):
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(self.m)
+        if self.m >= 128:
+            self._alpha = 0.7213 / (1 + 1.079 / self.m)
+        else:
+            self._alpha = {16: 0.673, 32: 0.697, 64: 0.709}[self.m]
+
+    def add(self, item: Hashable):
+        digest = hashlib.blake2b(str(item).encode('utf-8'), digest_size=8).digest()
+        x = int.from_bytes(digest, 'big')
+        index = x >> (64 - self.p)
+        rest = (x << self.p) & 0xFFFFFFFFFFFFFFFF
+        rank = 65 - rest.bit_length() if rest else 65 - self.p
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog"):
+        """Объединение (максимум по регистрам); p должны совпадать"""
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self) -> int:
+        estimate = self._alpha * self.m * self.m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        # Поправка для малых значений: линейный подсчет по пустым регистрам
+        if estimate <= 2.5 * self.m and zeros:
+            estimate = self.m * math.log(self.m / zeros)
+        return int(round(estimate))
+
+
+# Окна по умолчанию: имя -> (длина окна в секундах, число слотов); None — все время
+DEFAULT_WINDOWS: Dict[str, Optional[Tuple[int, int]]] = {
+    'hour': (3600, 12),
+    'day': (86400, 24),
+    'all': None,
+}
+
+
+class _WindowedSketch:
+    """Общая часть оконных счетчиков: кольцо слотов на каждое окно"""
+
+    def __init__(self, windows: Optional[Dict[str, Optional[Tuple[int, int]]]] = None):
+        self.windows = dict(windows or DEFAULT_WINDOWS)
+        # окно -> список слотов [номер интервала, структура]
+        self._rings: Dict[str, List[list]] = {}
+        self._all = {}
+        for name, spec in self.windows.items():
+            if spec is None:
+                self._all[name] = self._new_sketch()
+            else:
+                _, slots = spec
+                self._rings[name] = [[-1, self._new_sketch()] for _ in range(slots)]
+        self._lock = threading.Lock()
+
+    def _new_sketch(self):
+        raise NotImplementedError
+
+    def _slot_expired(self, window: str, sketch):
+        """Слот окна очищается (вышел из окна); sketch — его прежняя структура"""
+
+    def _current_slots(self, now: float):
+        """Пары (окно, структура текущего слота) всех окон; устаревшие слоты очищаются"""
+        for name, ring in self._rings.items():
+            length, slots = self.windows[name]
+            epoch = int(now // (length / slots))
+            slot = ring[epoch % slots]
+            if slot[0] != epoch:
+                if slot[0] >= 0:
+                    self._slot_expired(name, slot[1])
+                slot[0] = epoch
+                slot[1] = self._new_sketch()
+            yield name, slot[1]
+        yield from self._all.items()
+
+    def _expire(self, window: str, now: float):
+        """Очистка слотов окна, вышедших из него к моменту now (без записи в окно)"""
+        length, slots = self.windows[window]
+        epoch = int(now // (length / slots))
+        for slot in self._rings[window]:
+            if slot[0] >= 0 and epoch - slot[0] >= slots:
+                self._slot_expired(window, slot[1])
+                slot[0] = -1
+                slot[1] = self._new_sketch()
+
+    def _live_slots(self, window: str, now: float) -> List:
+        """Структуры слотов окна, попадающих в окно на момент now"""
+        if window in self._all:
+            return [self._all[window]]
+        length, slots = self.windows[window]
+        epoch = int(now // (length / slots))
+        return [sketch for slot_epoch, sketch in self._rings[window]
+                if epoch - slot_epoch < slots]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+
+class PopularityTracker(_WindowedSketch):
+    """Популярные элементы за окна времени на основе SpaceSaving
+
+    Для окон со слотами поддерживается сумма счетчиков живых слотов: она
+    меняется при записи и при очистке слота, поэтому чтение окна не
+    объединяет слоты заново.
+    """
+
+    def __init__(self, capacity: int = 200, windows=None):
+        self.capacity = capacity
+        super().__init__(windows)
+        self._merged: Dict[str, Dict[Hashable, int]] = {name: {} for name in self._rings}
+
+    def _new_sketch(self) -> SpaceSaving:
+        return SpaceSaving(self.capacity)
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        if '_merged' not in state:
+            # Снимок теплого состояния без суммы слотов
+            self._merged = {name: {} for name in self._rings}
+            for name, ring in self._rings.items():
+                merged = self._merged[name]
+                for epoch, sketch in ring:
+                    for item, count in sketch.items().items() if epoch >= 0 else ():
+                        merged[item] = merged.get(item, 0) + count
+
+    @staticmethod
+    def _subtract(merged: Dict[Hashable, int], item: Hashable, count: int):
+        left = merged.get(item, 0) - count
+        if left > 0:
+            merged[item] = left
+        else:
+            merged.pop(item, None)
+
+    def _slot_expired(self, window: str, sketch: SpaceSaving):
+        merged = self._merged[window]
+        for item, count in sketch.items().items():
+            self._subtract(merged, item, count)
+
+    def add(self, item: Hashable, now: Optional[float] = None):
+        now = time.time() if now is None else now
+        with self._lock:
+            for window, sketch in self._current_slots(now):
+                before = sketch.estimate(item)
+                evicted = sketch.add(item)
+                merged = self._merged.get(window)
+                if merged is None:
+                    continue
+                merged[item] = merged.get(item, 0) + sketch.estimate(item) - before
+                if evicted is not None:
+                    self._subtract(merged, *evicted)
+
+    def estimate(self, item: Hashable, window: str = 'all', now: Optional[float] = None) -> int:
+        now = time.time() if now is None else now
+        with self._lock:
+            if window in self._all:
+                return self._all[window].estimate(item)
+            self._expire(window, now)
+            return self._merged[window].get(item, 0)
+
+    def top(self, k: int = 5, window: str = 'all', now: Optional[float] = None) -> List[Tuple[Hashable, int]]:
+        """k популярных элементов окна
+
+        Окно без слотов — SpaceSaving.top. Окно со слотами — выбор k из
+        поддерживаемой суммы слотов, O(n log k) при n <= слоты × capacity
+        элементов; от длины потока время не зависит.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            if window in self._all:
+                return self._all[window].top(k)
+            self._expire(window, now)
+            return heapq.nlargest(k, self._merged[window].items(), key=itemgetter(1))
+
+    def get(self, item: Hashable, default: int = 0) -> int:
+        """Совместимость со старым dict-счетчиком: оценка за все время"""
+        return self.estimate(item) or default
+
+    def __bool__(self) -> bool:
+        return any(len(sketch) for sketch in self._all.values())
+
+
+class UniqueCounter(_WindowedSketch):
+    """Число уникальных элементов за окна времени на основе HyperLogLog"""
+
+    def __init__(self, p: int = 12, windows=None):
+        self.p = p
+        super().__init__(windows)
+
+    def _new_sketch(self) -> HyperLogLog:
+        return HyperLogLog(self.p)
+
+    def add(self, item: Hashable, now: Optional[float] = None):
+        now = time.time() if now is None else now
+        with self._lock:
+            for _, sketch in self._current_slots(now):
+                sketch.add(item)
+
+    def count(self, window: str = 'all', now: Optional[float] = None) -> int:
+        now = time.time() if now is None else now
+        with self._lock:
+            slots = self._live_slots(window, now)
+            if len(slots) == 1:
+                return slots[0].count()
+            merged = HyperLogLog(self.p)
+            for sketch in slots:
+                merged.merge(sketch)
+        return merged.count()
@@ -0,0 +1,100 @@
+"""
+История тарифа по датам действия: интервалы значений полей кодов из патчей базы
+"""
+
+import logging
+from bisect import bisect_left, bisect_right, insort
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# Поля записи VEDDatabase, по которым ведется история
+HISTORY_FIELDS = ('пошлина', 'сертификация', 'описание')
+
+_MISSING = object()
+_AFTER_ANY_CODE = '\uffff'  # (дата, код) после всех кодов той же даты
+
+DateLike = Union[date, datetime, str]
+
+
+def parse_date(value: DateLike) -> date:
+    """Дата из date/datetime или строки ГГГГ-ММ-ДД / ДД.ММ.ГГГГ; ValueError при ошибке"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    text = str(value).strip()
+    for pattern in ('%Y-%m-%d', '%d.%m.%Y'):
+        try:
+            return datetime.strptime(text, pattern).date()
+        except ValueError:
+            continue
+    raise ValueError(f"Некорректная дата: {value!r}")
+
+
+class TariffHistory:
+    """Интервальный индекс значений полей кодов по датам действия
+
+    Хранятся только изменения: значение кода на дату — двоичный поиск по
+    датам кода, коды с изменениями за период — по общему журналу поля.
+    None — код не действует (до добавления или после удаления).
+    """
+
+    def __init__(self):
+        # (код, поле) -> (даты начала по возрастанию, значения)
+        self._intervals: Dict[Tuple[str, str], Tuple[List[date], List[Any]]] = {}
+        # поле -> отсортированный журнал изменений (дата, код)
+        self._changes: Dict[str, List[Tuple[date, str]]] = {}
+
+    def record(self, code: str, field: str, effective: DateLike, old_value: Any, new_value: Any):
+        """Изменение поля кода с даты effective
+
+        old_value нужен только для первого изменения кода: он становится
+        значением до этой даты. Патчи могут приходить не в порядке дат:
+        интервал вставляется на место по дате, значение действует до
+        следующего по дате изменения. Повторная запись на ту же дату
+        заменяет значение.
+        """
+        effective = parse_date(effective)
+        starts, values = self._intervals.setdefault((code, field), ([date.min], [old_value]))
+        index = bisect_left(starts, effective)
+        if index < len(starts) and starts[index] == effective:
+            values[index] = new_value
+        else:
+            starts.insert(index, effective)
+            values.insert(index, new_value)
+            insort(self._changes.setdefault(field, []), (effective, code))
+
+    def value_on(self, code: str, field: str, when: DateLike, current: Any = _MISSING) -> Any:
+        """Значение поля на дату; current — значение из базы для кодов без истории"""
+        entry = self._intervals.get((code, field))
+        if entry is None:
+            return None if current is _MISSING else current
+        starts, values = entry
+        return values[bisect_right(starts, parse_date(when)) - 1]
+
+    def has_history(self, code: str) -> bool:
+        return any((code, field) in self._intervals for field in HISTORY_FIELDS)
+
+    def changed_between(self, start: DateLike, end: DateLike, field: str = 'пошлина') -> List[str]:
+        """Коды, у которых поле менялось с датой вступления в (start, end]"""
+        changes = self._changes.get(field, [])
+        low = bisect_right(changes, (parse_date(start), _AFTER_ANY_CODE))
+        high = bisect_right(changes, (parse_date(end), _AFTER_ANY_CODE))
+        return sorted({code for _, code in changes[low:high]})
+
+    def timeline(self, code: str, field: str = 'пошлина') -> List[Tuple[Optional[date], Any]]:
+        """Интервалы поля кода: (дата начала или None для исходного значения, значение)"""
+        entry = self._intervals.get((code, field))
+        if entry is None:
+            return []
+        starts, values = entry
+        return [(None if start == date.min else start, value) for start, value in zip(starts, values)]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'codes': len({code for code, _ in self._intervals}),
+            'intervals': sum(len(starts) for starts, _ in self._intervals.values()),
+            'changes': sum(len(changes) for changes in self._changes.values()),
+        }
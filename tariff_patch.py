@@ -0,0 +1,128 @@
+"""
+Патчи базы ТН ВЭД: поправки тарифа без перезаписи tnved_database.json
+"""
+
+import json
+import logging
+import os
+import sys
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+from tariff_history import parse_date
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATCH_DIR = 'patches'
+
+OPERATIONS = ('add', 'modify', 'delete')
+ITEM_FIELDS = ('name', 'description', 'group', 'duties', 'certification')
+
+
+class PatchError(ValueError):
+    """Некорректный патч или патч не к той версии базы"""
+
+
+@dataclass
+class PatchOperation:
+    """Операция патча"""
+    op: str                                           # 'add', 'modify', 'delete'
+    code: str
+    item: Dict[str, Any] = field(default_factory=dict)  # add: запись целиком, modify: измененные поля
+
+
+@dataclass
+class TariffPatch:
+    """Патч базы"""
+    version: str
+    operations: List[PatchOperation]
+    base_version: Optional[str] = None
+    source: str = ''
+    effective_date: Optional[date] = None  # None — дата применения
+
+
+def parse_patch(raw: Dict, source: str = '') -> TariffPatch:
+    """Патч из разобранного JSON; PatchError при ошибке формата"""
+    if not isinstance(raw, dict) or not raw.get('version'):
+        raise PatchError(f"Патч {source}: не указана версия")
+
+    operations = []
+    for number, entry in enumerate(raw.get('operations') or [], 1):
+        op = entry.get('op') if isinstance(entry, dict) else None
+        if op not in OPERATIONS:
+            raise PatchError(f"Патч {source}: операция #{number}: неизвестный тип {op!r}")
+
+        if op == 'add':
+            item = entry.get('item')
+            if not isinstance(item, dict):
+                raise PatchError(f"Патч {source}: операция #{number}: нет записи item")
+            code = str(item.get('code', '')).strip()
+            item = {key: item[key] for key in ITEM_FIELDS if key in item}
+        elif op == 'modify':
+            code = str(entry.get('code', '')).strip()
+            item = entry.get('fields')
+            if not isinstance(item, dict) or not item:
+                raise PatchError(f"Патч {source}: операция #{number}: нет изменяемых полей fields")
+            unknown = set(item) - set(ITEM_FIELDS)
+            if unknown:
+                raise PatchError(f"Патч {source}: операция #{number}: неизвестные поля {sorted(unknown)}")
+        else:
+            code = str(entry.get('code', '')).strip()
+            item = {}
+
+        if not code:
+            raise PatchError(f"Патч {source}: операция #{number}: не указан код")
+        operations.append(PatchOperation(op, code, item))
+
+    effective_date = None
+    if raw.get('effective_date'):
+        try:
+            effective_date = parse_date(raw['effective_date'])
+        except ValueError as e:
+            raise PatchError(f"Патч {source}: {e}")
+
+    return TariffPatch(str(raw['version']), operations, raw.get('base_version'), source, effective_date)
+
+
+def load_patch(path: str) -> TariffPatch:
+    """Патч из файла"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            raw = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        raise PatchError(f"Ошибка чтения патча {path}: {e}")
+    return parse_patch(raw, os.path.basename(path))
+
+
+def patch_files(patch_dir: str = DEFAULT_PATCH_DIR) -> List[str]:
+    """Файлы патчей каталога в порядке применения (по имени)"""
+    if not os.path.isdir(patch_dir):
+        return []
+    return [os.path.join(patch_dir, name) for name in sorted(os.listdir(patch_dir)) if name.endswith('.json')]
+
+
+def apply_patch_dir(ved_db, patch_dir: str = DEFAULT_PATCH_DIR) -> int:
+    """Применение всех патчей каталога; возвращает число примененных"""
+    applied = 0
+    for path in patch_files(patch_dir):
+        try:
+            ved_db.apply_patch(load_patch(path))
+            applied += 1
+        except PatchError as e:
+            logger.error(f"Патч {path} не применен: {e}")
+            break
+    return applied
+
+
+if __name__ == "__main__":
+    from ved_database import VEDDatabase
+    logging.basicConfig(level=logging.INFO)
+
+    if len(sys.argv) < 3 or sys.argv[1] != 'apply':
+        print("Использование: python tariff_patch.py apply <patch.json> [tnved_database.json]")
+        sys.exit(1)
+
+    db = VEDDatabase(sys.argv[3] if len(sys.argv) > 3 else 'tnved_database.json')
+    summary = db.apply_patch(load_patch(sys.argv[2]))
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
@@ -0,0 +1,53 @@
+"""
+Общие фикстуры тестов: маленькая база ТН ВЭД во временном каталоге
+"""
+
+import json
+
+import pytest
+
+PRODUCTS = [
+    {"code": "0203110000", "name": "Свинина", "description": "Туши и полутуши свиные свежие или охлажденные",
+     "group": "02", "duties": {"base": "15%"}, "certification": {"type": "СЭС"}},
+    {"code": "0302110000", "name": "-", "description": "Рыба свежая или охлажденная:",
+     "group": "03", "duties": {"base": "-"}, "certification": {"type": "Не указана"}},
+    {"code": "0302710000", "name": "-", "description": "– – тилапия (Oreochromis spp.)",
+     "group": "03", "duties": {"base": "-"}, "certification": {"type": "Не указана"}},
+    {"code": "8471300000", "name": "Ноутбуки", "description": "Машины вычислительные портативные массой не более 10 кг",
+     "group": "84", "duties": {"base": "0%", "china": "5%"}, "certification": {"type": "ТР ТС 004, ТР ТС 020"}},
+    {"code": "8517120000", "name": "Телефоны сотовые", "description": "Телефонные аппараты для сотовых сетей",
+     "group": "85", "duties": {"base": "10%", "china": "-"}, "certification": {"type": "ТР ТС 020"}},
+    {"code": "8528720000", "name": "Телевизоры", "description": "Аппаратура приемная для телевизионной связи",
+     "group": "85", "duties": {"base": "0%"}, "certification": {"type": "Не указана"}},
+]
+
+CERTIFICATION = {
+    "metadata": {"version": "1.0.0"},
+    "requirements": {
+        "ТР ТС 004": "Технический регламент о безопасности низковольтного оборудования",
+        "ТР ТС 020": "Технический регламент об электромагнитной совместимости",
+        "СЭС": "Санитарно-эпидемиологическое заключение",
+    },
+}
+
+
+@pytest.fixture
+def database_file(tmp_path):
+    path = tmp_path / 'tnved_database.json'
+    path.write_text(json.dumps(PRODUCTS, ensure_ascii=False), encoding='utf-8')
+    return str(path)
+
+
+@pytest.fixture
+def certification_file(tmp_path):
+    path = tmp_path / 'certification.json'
+    path.write_text(json.dumps(CERTIFICATION, ensure_ascii=False), encoding='utf-8')
+    return str(path)
+
+
+@pytest.fixture
+def ved_db(database_file, certification_file):
+    from product_cards import card_cache
+    from ved_database import VEDDatabase
+    yield VEDDatabase(database_file, certification_file)
+    card_cache.invalidate()
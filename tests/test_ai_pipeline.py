@@ -0,0 +1,81 @@
+import asyncio
+
+from ai_pipeline import AsyncAnalysisClient, StubAnalysisBackend, build_analysis_prompt, template_hash
+
+
+def fallback():
+    return 'локальный анализ'
+
+
+def test_identical_requests_share_one_backend_call():
+    backend = StubAnalysisBackend(latency=0.05)
+    client = AsyncAnalysisClient(backend, timeout=1.0)
+
+    async def run():
+        return await asyncio.gather(*(client.analyze('8471300000', 'prompt', fallback) for _ in range(5)))
+
+    results = asyncio.run(run())
+    assert backend.calls == 1
+    assert sum(result.coalesced for result in results) == 4
+    assert {result.source for result in results} == {'backend'}
+
+
+def test_timeout_falls_back_to_local_analysis():
+    client = AsyncAnalysisClient(StubAnalysisBackend(latency=1.0), timeout=0.05)
+    result = asyncio.run(client.analyze('key', 'prompt', fallback))
+    assert (result.text, result.source) == ('локальный анализ', 'fallback')
+    assert client.stats['timeouts'] == 1
+
+
+def test_follower_keeps_its_own_budget():
+    client = AsyncAnalysisClient(StubAnalysisBackend(latency=0.5), timeout=2.0)
+
+    async def run():
+        leader = asyncio.ensure_future(client.analyze('key', 'prompt', fallback))
+        await asyncio.sleep(0)
+        follower = await client.analyze('key', 'prompt', fallback, timeout=0.05)
+        return follower, await leader
+
+    follower, leader = asyncio.run(run())
+    assert follower.coalesced and follower.source == 'fallback'
+    assert follower.latency < 0.4
+    assert leader.source == 'backend'
+
+
+def test_follower_falls_back_when_leader_is_cancelled_or_fails():
+    client = AsyncAnalysisClient(StubAnalysisBackend(latency=0.2, error_rate=1.0), timeout=1.0)
+
+    def broken_fallback():
+        raise RuntimeError("шаблон недоступен")
+
+    async def run():
+        cancelled = asyncio.ensure_future(client.analyze('cancel', 'prompt', fallback))
+        failed = asyncio.ensure_future(client.analyze('fail', 'prompt', broken_fallback))
+        await asyncio.sleep(0)
+        followers = [asyncio.ensure_future(client.analyze(key, 'prompt', fallback)) for key in ('cancel', 'fail')]
+        await asyncio.sleep(0.05)
+        cancelled.cancel()
+        results = await asyncio.gather(*followers)
+        assert cancelled.cancelled() and isinstance(failed.exception(), RuntimeError)
+        return results
+
+    results = asyncio.run(run())
+    assert [(result.source, result.coalesced) for result in results] == [('fallback', True)] * 2
+    assert client.stats['errors'] == 2  # ошибка бэкенда ведущего и его проброшенное исключение
+
+
+def test_concurrency_cap():
+    client = AsyncAnalysisClient(StubAnalysisBackend(latency=0.1), timeout=0.15, max_concurrency=1)
+
+    async def run():
+        return await asyncio.gather(*(client.analyze(str(i), 'prompt', fallback) for i in range(3)))
+
+    sources = [result.source for result in asyncio.run(run())]
+    assert sources.count('backend') == 1
+
+
+def test_analyze_sync_and_prompt():
+    client = AsyncAnalysisClient(StubAnalysisBackend(latency=0.0), timeout=1.0)
+    assert client.analyze_sync('key', 'prompt', fallback).source == 'backend'
+    assert '8471300000' in build_analysis_prompt({'код': '8471300000'})
+    assert template_hash(user_query='a') != template_hash(user_query='b')
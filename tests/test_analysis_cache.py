@@ -0,0 +1,83 @@
+import sqlite3
+import time
+
+import pytest
+
+from ai_pipeline import ANALYSIS_PROMPT_TEMPLATE, AsyncAnalysisClient, StubAnalysisBackend, template_hash
+from analysis_cache import AnalysisCache, warm_up
+from enhanced_ved_system import GensparktVEDIntegration
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = AnalysisCache(str(tmp_path / 'analyses.sqlite'), max_entries=3)
+    yield cache
+    cache.close()
+
+
+def stored_access_times(path):
+    conn = sqlite3.connect(path)
+    try:
+        return dict(conn.execute("SELECT code, accessed_at FROM analyses"))
+    finally:
+        conn.close()
+
+
+def test_get_and_put(cache):
+    assert cache.get('8471300000', 'v1', 't') is None
+    cache.put('8471300000', 'v1', 't', 'анализ')
+    cache.put('8471300000', 'v1', 't', 'анализ 2')
+    assert cache.get('8471300000', 'v1', 't') == 'анализ 2'
+    assert cache.get('8471300000', 'v2', 't') is None
+    assert cache.stats == {'entries': 1, 'hits': 1, 'misses': 2}
+
+
+def test_hits_batch_access_time_updates(cache):
+    cache.put('a', 'v', 't', 'x')
+    before = stored_access_times(cache.db_file)['a']
+    time.sleep(0.01)
+    cache.get('a', 'v', 't')
+    assert stored_access_times(cache.db_file)['a'] == before
+    cache.put('b', 'v', 't', 'y')
+    assert stored_access_times(cache.db_file)['a'] > before
+
+
+def test_evicts_least_recently_read(cache):
+    for code in 'abc':
+        cache.put(code, 'v', 't', code)
+        time.sleep(0.01)
+    cache.get('a', 'v', 't')
+    cache.put('d', 'v', 't', 'd')
+    assert len(cache) == 3
+    assert cache.get('b', 'v', 't') is None
+    assert cache.get('a', 'v', 't') == 'a'
+
+
+def test_count_survives_reopen_and_purge(tmp_path):
+    path = str(tmp_path / 'analyses.sqlite')
+    cache = AnalysisCache(path)
+    cache.put('a', 'v', 't', 'x')
+    cache.close()
+
+    reopened = AnalysisCache(path)
+    assert len(reopened) == 1
+    reopened.close()
+    reopened = AnalysisCache(path, ttl=-1)
+    assert len(reopened) == 0
+    reopened.close()
+
+
+def test_warm_up_counts_built_analyses():
+    assert warm_up(['a', 'b', 'c'], lambda code: None if code == 'b' else code) == 2
+
+
+def test_integration_caches_only_backend_analyses(cache):
+    template = template_hash(ANALYSIS_PROMPT_TEMPLATE, 'пошлина?')
+    official = {'code': '8471300000', 'name': 'Ноутбуки'}
+
+    GensparktVEDIntegration(None, analysis_cache=cache).analyze_with_context(official, 'пошлина?', 'v1')
+    assert cache.get('8471300000', 'v1', template) is None
+
+    client = AsyncAnalysisClient(StubAnalysisBackend(latency=0.0), timeout=1.0)
+    analysis = GensparktVEDIntegration(None, client, cache).analyze_with_context(official, 'пошлина?', 'v1')
+    assert cache.get('8471300000', 'v1', template) == analysis.genspark_analysis
@@ -0,0 +1,59 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from api import BodyCache, create_api_router
+from tariff_patch import parse_patch
+
+
+@pytest.fixture
+def client(ved_db):
+    app = FastAPI()
+    app.include_router(create_api_router(ved_db, BodyCache()))
+    return TestClient(app)
+
+
+def test_code_response_and_not_modified(client):
+    response = client.get('/api/code/8471300000')
+    assert response.status_code == 200
+    assert response.json()['code'] == '8471300000'
+    assert [req['id'] for req in response.json()['requirements']] == ['ТР ТС 004', 'ТР ТС 020']
+
+    etag = response.headers['ETag']
+    assert client.get('/api/code/8471300000', headers={'If-None-Match': etag}).status_code == 304
+    assert client.get('/api/code/8471300000', headers={'If-None-Match': f'W/{etag}'}).status_code == 304
+    assert client.get('/api/code/8471300000', headers={'If-None-Match': '"other", ' + etag}).status_code == 304
+    assert client.get('/api/code/8471300000', headers={'If-None-Match': '"other"'}).status_code == 200
+
+
+def test_unknown_or_deleted_code_is_404_even_with_matching_etag(client, ved_db):
+    assert client.get('/api/code/9999999999', headers={'If-None-Match': '*'}).status_code == 404
+
+    etag = client.get('/api/code/8528720000').headers['ETag']
+    ved_db.apply_patch(parse_patch({'version': 'p1', 'operations': [{'op': 'delete', 'code': '8528720000'}]}))
+    assert client.get('/api/code/8528720000', headers={'If-None-Match': etag}).status_code == 404
+
+
+def test_pages_follow_cursor(client):
+    first = client.get('/api/prefix/85', params={'limit': 1}).json()
+    assert [item['code'] for item in first['items']] == ['8517120000']
+    second = client.get('/api/prefix/85', params={'limit': 1, 'cursor': first['next_cursor']}).json()
+    assert [item['code'] for item in second['items']] == ['8528720000']
+    assert second['next_cursor'] is None
+
+
+def test_invalid_cursor_is_400_even_with_matching_etag(client, ved_db):
+    first = client.get('/api/search', params={'q': 'те', 'limit': 1}).json()
+    params = {'q': 'те', 'limit': 1, 'cursor': first['next_cursor']}
+    etag = client.get('/api/search', params=params).headers['ETag']
+
+    ved_db._cursor_queries.clear()  # запрос курсора вытеснен
+    response = client.get('/api/search', params=params, headers={'If-None-Match': etag})
+    assert response.status_code == 400
+    assert client.get('/api/search', params={'q': 'x', 'cursor': 'мусор'}).status_code == 400
+
+
+def test_validation_errors(client):
+    assert client.get('/api/search', params={'q': 'x'}).status_code == 400
+    assert client.get('/api/prefix/84ab').status_code == 400
+    assert client.get('/api/export', params={'format': 'xml'}).status_code == 400
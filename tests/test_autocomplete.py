@@ -0,0 +1,52 @@
+from autocomplete import AutocompleteIndex, normalize_tokens, popularity_counts
+from tariff_patch import parse_patch
+
+
+def codes(suggestions):
+    return [code for code, _ in suggestions]
+
+
+def test_normalize_tokens():
+    assert normalize_tokens('Ёмкости, 10 кг!') == ['емкости', '10', 'кг']
+
+
+def test_code_prefix_suggestions_in_code_order(ved_db):
+    index = AutocompleteIndex(ved_db)
+    assert codes(index.suggest('85')) == ['8517120000', '8528720000']
+    assert codes(index.suggest('8471 30')) == ['8471300000']
+    assert index.suggest('9999') == []
+    assert index.suggest('  ') == []
+
+
+def test_word_prefix_suggestions(ved_db):
+    index = AutocompleteIndex(ved_db)
+    assert codes(index.suggest('ноут')) == ['8471300000']
+    assert codes(index.suggest('тилап')) == ['0302710000']
+    assert codes(index.suggest('Тел')) == ['8517120000', '8528720000']
+
+
+def test_multiword_query_requires_all_complete_words(ved_db):
+    index = AutocompleteIndex(ved_db)
+    assert codes(index.suggest('туши свин')) == ['0203110000']
+    assert codes(index.suggest('аппараты тел')) == ['8517120000']
+    assert index.suggest('свинина тила') == []
+
+
+def test_popularity_reorders_suggestions(ved_db):
+    index = AutocompleteIndex(ved_db)
+    assert codes(index.suggest('85'))[0] == '8517120000'
+    index.refresh_popularity(popularity_counts([('8528720000', 5), ('8517120000', 1)]))
+    assert codes(index.suggest('85')) == ['8528720000', '8517120000']
+    assert codes(index.suggest('85', limit=1)) == ['8528720000']
+
+
+def test_rebuild_picks_up_patched_codes(ved_db):
+    index = AutocompleteIndex(ved_db, k=2)
+    ved_db.apply_patch(parse_patch({'version': 'p1', 'operations': [
+        {'op': 'delete', 'code': '8528720000'},
+        {'op': 'add', 'item': {'code': '8528730000', 'name': 'Мониторы', 'description': 'Мониторы',
+                               'group': '85', 'duties': {'base': '0%'}}},
+    ]}))
+    index.rebuild()
+    assert codes(index.suggest('8528')) == ['8528730000']
+    assert codes(index.suggest('монит')) == ['8528730000']
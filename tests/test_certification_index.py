@@ -0,0 +1,71 @@
+import json
+import os
+
+from certification_index import CertificationIndex, extract_requirement_ids, normalize_requirement_id
+
+PRODUCTS = [
+    ('8471300000', 'Не указана'),
+    ('8517120000', 'ТР ТС 020/2011'),
+    ('0203110000', 'Не указана'),
+]
+
+
+def write(path, assignments):
+    path.write_text(json.dumps({
+        'metadata': {'version': '1'},
+        'requirements': {'ТР ТС 020': 'ЭМС', 'ТР ТС 021': 'Пищевая продукция'},
+        'assignments': assignments,
+    }, ensure_ascii=False), encoding='utf-8')
+    return str(path)
+
+
+def test_normalize_requirement_ids():
+    assert normalize_requirement_id('тр-тс 020/2011') == 'ТР ТС 020'
+    assert normalize_requirement_id('СЭС') == 'СЭС'
+    assert normalize_requirement_id('Не указана') is None
+    assert extract_requirement_ids('ТР ТС 004, ТР ЕАЭС 037') == {'ТР ТС 004', 'ТР ЕАЭС 037'}
+
+
+def test_index_joins_text_and_assignments(tmp_path):
+    index = CertificationIndex(write(tmp_path / 'cert.json', {'ТР ТС 020': ['8471'], 'ТР ТС 021': ['02']}),
+                               PRODUCTS)
+    assert [req.id for req in index.requirements_for('8471300000')] == ['ТР ТС 020']
+    assert index.codes_for('ТР ТС 020') == ['8471300000', '8517120000']
+    assert index.codes_for('тр тс 020', chapter='85') == ['8517120000']
+    assert index.codes_for('ТР ТС 021') == ['0203110000']
+
+
+def test_update_product_applies_assignments(tmp_path):
+    index = CertificationIndex(write(tmp_path / 'cert.json', {'ТР ТС 020': ['8471']}), PRODUCTS)
+    index.update_product('8471410000', 'Не указана')
+    assert '8471410000' in index.codes_for('ТР ТС 020')
+    index.update_product('8517120000', None)
+    assert index.codes_for('ТР ТС 020', '85') == []
+
+
+def test_reloaded_returns_new_index_only_on_change(tmp_path):
+    path = write(tmp_path / 'cert.json', {})
+    index = CertificationIndex(path, PRODUCTS)
+    assert index.reloaded() is None
+
+    write(tmp_path / 'cert.json', {'ТР ТС 021': ['02']})
+    os.utime(path, (1, 1))
+    fresh = index.reloaded()
+    assert fresh is not None and fresh is not index
+    assert fresh.codes_for('ТР ТС 021') == ['0203110000']
+    assert index.codes_for('ТР ТС 021') == []
+
+
+def test_broken_file_keeps_previous_index(tmp_path):
+    path = write(tmp_path / 'cert.json', {})
+    index = CertificationIndex(path, PRODUCTS)
+    (tmp_path / 'cert.json').write_text('{', encoding='utf-8')
+    os.utime(path, (1, 1))
+    assert index.reloaded() is None
+
+
+def test_shipped_certification_has_no_unsourced_assignments():
+    with open('certification.json', encoding='utf-8') as f:
+        raw = json.load(f)
+    assert raw['assignments'] == {}
+    assert set(raw['requirements']) == {'ТР ТС 004', 'ТР ТС 020', 'СЭС'}
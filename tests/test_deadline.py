@@ -0,0 +1,49 @@
+import time
+
+from deadline import NO_DEADLINE, Deadline, DeadlineStats
+
+
+def test_remaining_excludes_send_reserve():
+    deadline = Deadline(10.0, reserve=1.0, stats=DeadlineStats())
+    assert 8.9 < deadline.remaining() <= 9.0
+    assert not deadline.expired()
+    assert not deadline.low()
+    assert deadline.low(fraction=0.95)
+
+
+def test_expired_budget_and_overrun_stats():
+    stats = DeadlineStats()
+    deadline = Deadline(0.02, reserve=0.0, stats=stats)
+    with deadline.stage('search'):
+        time.sleep(0.03)
+    assert deadline.expired() and deadline.low()
+    deadline.degrade('search', 'просмотр прерван')
+    assert deadline.finish() > 0
+
+    snapshot = stats.snapshot()
+    assert snapshot['requests'] == {'count': 1, 'over_budget': 1, 'degraded': 1}
+    stage = snapshot['stages']['search']
+    assert stage['count'] == 1 and stage['overruns'] == 1 and stage['max_over_ms'] > 0
+    assert stage['degraded'] == {'просмотр прерван': 1}
+
+
+def test_stage_within_budget_is_not_an_overrun():
+    stats = DeadlineStats()
+    deadline = Deadline(10.0, reserve=0.0, stats=stats)
+    with deadline.stage('format'):
+        pass
+    assert deadline.finish() < 0
+    assert stats.snapshot()['stages']['format']['overruns'] == 0
+    assert stats.snapshot()['requests']['over_budget'] == 0
+
+
+def test_no_deadline_never_expires_and_is_not_counted():
+    stats = NO_DEADLINE.stats.snapshot()
+    with NO_DEADLINE.stage('search'):
+        pass
+    NO_DEADLINE.degrade('search', 'короче')
+    assert not NO_DEADLINE.limited
+    assert not NO_DEADLINE.expired() and not NO_DEADLINE.low()
+    assert NO_DEADLINE.finish() == 0.0
+    assert NO_DEADLINE.degraded == {}
+    assert NO_DEADLINE.stats.snapshot() == stats
@@ -0,0 +1,55 @@
+import pytest
+
+from duty_table import AD_VALOREM, COMBINED, NOT_SET, SPECIFIC, DutyTable, format_duty, parse_duty
+
+ROWS = [
+    ('8471300000', '84', {'base': '0%', 'china': '5%'}),
+    ('8517120000', '85', {'base': '10%', 'china': '-'}),
+    ('8528720000', '85', {'base': '0'}),
+    ('0302710000', '03', {'base': '-'}),
+]
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('5%', (AD_VALOREM, 5.0, None, None)),
+    (7, (AD_VALOREM, 7.0, None, None)),
+    ('0,3 евро/кг', (SPECIFIC, None, 0.3, 'евро/кг')),
+    ('10%, но не менее 0,3 евро за 1 кг', (COMBINED, 10.0, 0.3, 'евро за 1 кг')),
+    ('-', (NOT_SET, None, None, None)),
+    (None, (NOT_SET, None, None, None)),
+])
+def test_parse_duty(value, expected):
+    assert parse_duty(value) == expected
+
+
+def test_format_duty():
+    assert format_duty('5') == '5%'
+    assert format_duty('-') == 'не установлена'
+
+
+def test_select_skips_unset_rates():
+    table = DutyTable(ROWS)
+    assert table.select('base', '==', 0) == ['8471300000', '8528720000']
+    assert table.select('base', '!=', 0) == ['8517120000']
+    assert table.select('base', '==', 0, chapter='85') == ['8528720000']
+    assert table.select('china', '!=', 0) == ['8471300000']
+    assert table.select('missing', '!=', 0) == []
+
+
+def test_compare_requires_both_rates():
+    table = DutyTable(ROWS)
+    assert table.compare('china', 'base', '>') == ['8471300000']
+    assert table.compare('china', 'base', '!=') == ['8471300000']
+
+
+def test_upsert_and_remove():
+    table = DutyTable(ROWS)
+    table.upsert('8471300001', '84', {'base': '3%', 'eu': '1%'})
+    assert table.rate('8471300001') == 3.0
+    assert table.rate('8471300001', 'eu') == 1.0
+    assert table.rate('8471300000', 'eu') is None
+    table.upsert('8517120000', '85', None)
+    assert table.rate('8517120000') == 10.0
+    table.remove('8471300000')
+    assert table.select('base', '==', 0) == ['8528720000']
+    assert '0302710000' in table.not_set('base')
@@ -0,0 +1,83 @@
+import json
+
+import pytest
+
+from evaluation import (EvalItem, calibration, codes_in_text, diff_results, evaluate_path, is_match,
+                        load_dataset, name_search_path)
+
+
+def test_is_match_accepts_prefix_labels():
+    assert is_match('1806321000', ['1806'])
+    assert is_match('8471300000', ['8517', '8471300000'])
+    assert not is_match('1805000000', ['1806'])
+
+
+def test_codes_in_text_keeps_order_without_repeats():
+    text = "Код `8471300000`, также 8517120000 и снова 8471300000; 12345678901 не код"
+    assert codes_in_text(text) == ['8471300000', '8517120000']
+    assert codes_in_text(None) == []
+
+
+def test_load_dataset(tmp_path):
+    path = tmp_path / 'dataset.jsonl'
+    path.write_text('{"id": "a", "query": "ноутбук", "expected": "8471"}\n\n'
+                    '{"query": "шоколад", "expected": ["1806"], "material": "какао"}\n', encoding='utf-8')
+    items = load_dataset(str(path))
+    assert [item.id for item in items] == ['a', '3']
+    assert items[0].expected == ['8471'] and items[1].material == 'какао'
+
+    path.write_text('{"query": "без ответа"}\n', encoding='utf-8')
+    with pytest.raises(ValueError):
+        load_dataset(str(path))
+
+
+def test_calibration_perfect_and_overconfident():
+    assert calibration([]) is None
+    perfect = calibration([(1.0, True), (0.0, False)])
+    assert perfect['ece'] == 0.0 and perfect['brier'] == 0.0
+
+    overconfident = calibration([(0.9, False)] * 4)
+    assert overconfident['ece'] == 0.9
+    assert overconfident['bins'] == [{'range': [0.9, 1.0], 'count': 4, 'confidence': 0.9, 'accuracy': 0.0}]
+
+
+def test_evaluate_path_metrics_and_errors():
+    items = [EvalItem('1', 'ноутбук', ['8471']), EvalItem('2', 'телефон', ['8517']), EvalItem('3', 'сбой', ['0101'])]
+    answers = {'ноутбук': (['8471300000'], 0.8), 'телефон': (['8528720000', '8517120000'], 0.6)}
+
+    def predict(item):
+        return answers[item.query]
+
+    metrics = evaluate_path(predict, items, k=5)['metrics']
+    assert metrics['items'] == 3
+    assert metrics['top1'] == round(1 / 3, 4)
+    assert metrics['topk'] == round(2 / 3, 4)
+    assert metrics['answered'] == round(2 / 3, 4)
+    assert metrics['calibration']['brier'] == round(((0.8 - 1) ** 2 + 0.6 ** 2) / 2, 4)
+
+
+def test_name_search_path_uses_database_pages(ved_db):
+    predict = name_search_path(2, ved_db)
+    assert predict(EvalItem('1', 'ноутбук', ['8471'])) == (['8471300000'], None)
+
+
+def test_diff_results_reports_fixed_and_broken():
+    def result(top1_by_id, predicted_by_id, top1_metric):
+        return {'paths': {'name_search': {
+            'metrics': {'top1': top1_metric, 'topk': 1.0, 'answered': 1.0, 'items_per_second': 10.0,
+                        'p50_ms': 1.0, 'p95_ms': 2.0, 'calibration': None},
+            'items': {item_id: {'top1': top1, 'predicted': predicted_by_id[item_id]}
+                      for item_id, top1 in top1_by_id.items()},
+        }}}
+
+    old = result({'a': False, 'b': True, 'c': False}, {'a': ['1'], 'b': ['2'], 'c': ['3']}, 0.33)
+    new = result({'a': True, 'b': False, 'c': False}, {'a': ['4'], 'b': ['5'], 'c': ['6']}, 0.33)
+    new['paths']['smart_search'] = new['paths']['name_search']
+
+    diff = diff_results(old, new)
+    entry = diff['name_search']
+    assert (entry['fixed'], entry['broken'], entry['changed']) == (['a'], ['b'], ['c'])
+    assert entry['metrics']['top1']['delta'] == 0
+    assert entry['metrics']['ece'] == {'old': None, 'new': None, 'delta': None}
+    assert diff['smart_search'] == {'missing_in': 'old'}
+    json.dumps(diff)
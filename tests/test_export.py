@@ -0,0 +1,58 @@
+import csv
+import gzip
+import io
+import json
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from api import EXPORT_COLUMNS, create_api_router, export_chunks, gzip_chunks
+from tariff_patch import parse_patch
+
+ITEMS = [{'code': f"84713000{number:02d}", 'name': f"Товар {number}", 'description': 'Описание, с запятой',
+          'group': '84', 'duties': {'base': '5%'}, 'certification': ['ТР ТС 004', 'ТР ТС 020']}
+         for number in range(7)]
+
+
+def test_csv_chunks_are_batched_with_single_header():
+    chunks = list(export_chunks(ITEMS, 'csv', batch=3))
+    assert len(chunks) == 3
+    rows = list(csv.reader(io.StringIO(b''.join(chunks).decode('utf-8'))))
+    assert rows[0] == list(EXPORT_COLUMNS)
+    assert len(rows) == len(ITEMS) + 1
+    assert rows[1][2] == 'Описание, с запятой'
+    assert json.loads(rows[1][4]) == {'base': '5%'}
+    assert rows[1][5] == 'ТР ТС 004; ТР ТС 020'
+
+
+def test_jsonl_chunks():
+    lines = b''.join(export_chunks(ITEMS, 'jsonl', batch=2)).decode('utf-8').splitlines()
+    assert [json.loads(line)['code'] for line in lines] == [item['code'] for item in ITEMS]
+    assert list(export_chunks([], 'jsonl')) == []
+
+
+def test_gzip_chunks_round_trip():
+    chunks = list(export_chunks(ITEMS, 'jsonl', batch=1))
+    assert gzip.decompress(b''.join(gzip_chunks(iter(chunks)))) == b''.join(chunks)
+
+
+def test_export_reads_one_version_while_patch_applies(ved_db):
+    version, rows = ved_db.iter_export(prefix='85')
+    first = next(rows)
+    ved_db.apply_patch(parse_patch({'version': 'p1', 'operations': [
+        {'op': 'delete', 'code': '8528720000'},
+        {'op': 'add', 'item': {'code': '8529000000', 'name': 'Части', 'group': '85'}},
+    ]}))
+    assert [first['код']] + [item['код'] for item in rows] == ['8517120000', '8528720000']
+    assert version != ved_db.snapshot_version()
+
+
+def test_export_endpoint_streams_gzip(ved_db):
+    app = FastAPI()
+    app.include_router(create_api_router(ved_db))
+    response = TestClient(app).get('/api/export', params={'format': 'jsonl', 'group': '85', 'gzip': 1})
+    assert response.status_code == 200
+    assert response.headers['X-Data-Version'] == str(ved_db.snapshot_version())
+    assert response.headers['Content-Disposition'].endswith('.jsonl.gz"')
+    lines = gzip.decompress(response.content).decode('utf-8').splitlines()
+    assert [json.loads(line)['code'] for line in lines] == ['8517120000', '8528720000']
@@ -0,0 +1,51 @@
+from hierarchy import build_full_descriptions, split_level
+
+FISH = [
+    ('0302000000', 'Рыба свежая или охлажденная:'),
+    ('0302110000', '– – форель (Salmo trutta,'),
+    ('0302111000', '– – – вида Oncorhynchus apache или'),
+    ('0302118000', '– – – прочая'),
+    ('0302510000', 'рыба семейств Bregmacerotidae'),
+    ('0302519000', 'рыба семейств Bregmacerotidae'),
+    ('0302599000', '– – – прочая'),
+    ('0302710000', '– – тилапия (Oreochromis spp.)'),
+    ('0302350000', '– – тунец синий:'),
+    ('0302351100', '– – – – для промышленного'),
+    ('0302351900', '– – – – прочий'),
+]
+
+
+def full(items):
+    return dict(zip((code for code, _ in items), build_full_descriptions(items)))
+
+
+def test_split_level():
+    assert split_level('– – – прочая') == (3, 'прочая')
+    assert split_level('Живая рыба:') == (0, 'Живая рыба:')
+
+
+def test_parents_anchored_on_code_prefix():
+    paths = full(FISH)
+    assert paths['0302710000'] == 'Рыба свежая или охлажденная: тилапия (Oreochromis spp.)'
+    assert paths['0302111000'] == 'Рыба свежая или охлажденная: форель (Salmo trutta: вида Oncorhynchus apache или'
+    assert paths['0302351100'] == 'Рыба свежая или охлажденная: тунец синий: для промышленного'
+    assert paths['0302599000'] == 'Рыба свежая или охлажденная: прочая'
+    assert paths['0302519000'] == 'Рыба свежая или охлажденная: рыба семейств Bregmacerotidae'
+
+
+def test_dash_depth_within_subheading():
+    items = [
+        ('8471000000', 'Машины вычислительные:'),
+        ('8471300000', '– машины портативные'),
+        ('8471301000', '– – – с клавиатурой:'),
+        ('8471301100', '– – – – массой до 1 кг'),
+        ('8471301900', '– – – прочие'),
+    ]
+    paths = full(items)
+    assert paths['8471301100'] == 'Машины вычислительные: машины портативные: с клавиатурой: массой до 1 кг'
+    assert paths['8471301900'] == 'Машины вычислительные: машины портативные: прочие'
+
+
+def test_result_in_input_order_and_code_only_text_skipped():
+    items = [('0207147001', '0207 14 700 1'), ('0207000000', 'Мясо птицы:')]
+    assert build_full_descriptions(items) == ['Мясо птицы:', 'Мясо птицы:']
@@ -0,0 +1,60 @@
+import json
+import logging
+import queue
+
+from logging_setup import (RateLimitFilter, SamplingFilter, StructuredFormatter,
+                           _NonFormattingQueueHandler)
+
+
+def make_record(level=logging.INFO, msg='сообщение', args=(), lineno=10):
+    return logging.LogRecord('test', level, 'module.py', lineno, msg, args, None)
+
+
+def test_sampling_filter_keeps_non_debug_records():
+    sampling = SamplingFilter(0.0)
+    assert sampling.filter(make_record(logging.INFO))
+    assert not sampling.filter(make_record(logging.DEBUG))
+    assert SamplingFilter(1.0).filter(make_record(logging.DEBUG))
+
+
+def test_rate_limit_filter_counts_suppressed_records():
+    rate_limit = RateLimitFilter(interval=60.0, burst=2)
+    passed = [rate_limit.filter(make_record(logging.ERROR)) for _ in range(5)]
+    assert passed == [True, True, False, False, False]
+    assert rate_limit.filter(make_record(logging.ERROR, lineno=11))
+
+    rate_limit.interval = 0.0
+    record = make_record(logging.ERROR)
+    assert rate_limit.filter(record)
+    assert record.suppressed == 3
+
+
+def test_structured_formatter_includes_extra_fields():
+    record = make_record(msg='заняло %s', args=('5мс',))
+    record.user_id = 42
+    payload = json.loads(StructuredFormatter().format(record))
+    assert payload['msg'] == 'заняло 5мс'
+    assert payload['user_id'] == 42
+    assert payload['level'] == 'INFO'
+
+
+def test_queue_handler_merges_args_without_formatting():
+    handler = _NonFormattingQueueHandler(queue.Queue())
+    handler.setFormatter(StructuredFormatter())
+    record = handler.prepare(make_record(msg='код %s', args=('8471300000',)))
+    assert record.msg == 'код 8471300000'
+    assert record.args is None
+
+
+def test_filtered_debug_call_does_not_render_arguments():
+    class Expensive:
+        rendered = 0
+
+        def __str__(self):
+            Expensive.rendered += 1
+            return 'expensive'
+
+    logger = logging.getLogger('test_lazy')
+    logger.setLevel(logging.INFO)
+    logger.debug("значение %s", Expensive())
+    assert Expensive.rendered == 0
@@ -0,0 +1,38 @@
+import numpy as np
+
+from memory_debug import deep_sizeof, format_bytes, format_report, memory_report, structure_sizes
+
+
+def test_deep_sizeof_counts_nested_objects_and_arrays():
+    nested = {'codes': ['8471300000' * 10 for _ in range(10)]}
+    assert deep_sizeof(nested) > deep_sizeof({'codes': []})
+
+    array = np.zeros(1000, dtype=np.float64)
+    assert deep_sizeof(array) >= array.nbytes
+
+
+def test_shared_objects_are_counted_in_first_structure():
+    rows = [{'код': str(code), 'описание': 'x' * 100} for code in range(100)]
+    by_code = {row['код']: row for row in rows}
+    sizes = structure_sizes({'data': rows, 'by_code': by_code, 'missing': None})
+
+    assert set(sizes) == {'data', 'by_code'}
+    assert sizes['by_code'] < sizes['data']
+    assert structure_sizes({'by_code': by_code})['by_code'] > sizes['by_code']
+
+
+def test_memory_report_formats_for_bot():
+    report = memory_report({'data': [1, 2, 3]}, {'read': 0.5, 'total': 1.25, 'loaded_at': '10:00'})
+    assert report['structures']['data'] > 0
+    assert 'tracemalloc' not in report
+
+    text = format_report(report)
+    assert '• data:' in text
+    assert 'всего 1.250с' in text
+
+
+def test_format_bytes_units():
+    assert format_bytes(None) == 'н/д'
+    assert format_bytes(512) == '512 Б'
+    assert format_bytes(2048) == '2 КБ'
+    assert format_bytes(3 * 1024 ** 3) == '3.0 ГБ'
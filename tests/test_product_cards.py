@@ -0,0 +1,56 @@
+from product_cards import CardCache
+
+
+def test_card_rendered_once_per_version_and_code():
+    cache = CardCache()
+    calls = []
+
+    def render():
+        calls.append(1)
+        return "🔹 Карточка"
+
+    assert cache.get_or_render('db', 'v1', '8471300000', render) == "🔹 Карточка"
+    assert cache.get_or_render('db', 'v1', '8471300000', render) == "🔹 Карточка"
+    assert len(calls) == 1
+    cache.get_or_render('db', 'v2', '8471300000', render)
+    assert len(calls) == 2
+    assert cache.stats == {"hits": 1, "misses": 2}
+
+
+def test_no_version_bypasses_cache():
+    cache = CardCache()
+    cache.get_or_render('db', None, '8471300000', lambda: 'x')
+    assert len(cache) == 0
+
+
+def test_lru_eviction_and_invalidation():
+    cache = CardCache(max_size=2)
+    for code in ('1', '2', '3'):
+        cache.get_or_render('db', 'v', code, lambda: code)
+    assert [key[2] for key, _ in cache.export_entries()] == ['2', '3']
+
+    assert cache.invalidate_many(['3', '4']) == 1
+    assert cache.invalidate() == 1
+    assert len(cache) == 0
+
+
+def test_load_entries_keeps_fresh_cards():
+    saved = CardCache()
+    saved.get_or_render('db', 'v', '1', lambda: 'старая')
+    cache = CardCache()
+    cache.get_or_render('db', 'v', '1', lambda: 'новая')
+    cache.load_entries(saved.export_entries())
+    assert cache.get_or_render('db', 'v', '1', lambda: 'другая') == 'новая'
+
+
+def test_code_index_follows_evictions_and_invalidation():
+    cache = CardCache(max_size=3)
+    for kind, code in (('db', '1'), ('router', '1'), ('db', '2'), ('db', '3')):
+        cache.get_or_render(kind, 'v', code, lambda: code)
+    assert cache._keys_by_code == {'1': {('router', 'v', '1')}, '2': {('db', 'v', '2')}, '3': {('db', 'v', '3')}}
+
+    assert cache.invalidate('1') == 1
+    assert cache.invalidate_many(['2', '2', '9']) == 1
+    assert set(cache._keys_by_code) == {'3'}
+    assert cache.invalidate() == 1
+    assert cache._keys_by_code == {}
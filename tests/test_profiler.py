@@ -0,0 +1,66 @@
+import json
+import os
+import time
+
+from profiler import _NULL, Profiler
+
+
+def test_disabled_profiler_returns_shared_null_context():
+    profiler = Profiler()
+    assert profiler.request('webhook') is _NULL
+    assert profiler.stage('search') is _NULL
+
+
+def test_stages_are_timed_only_inside_sampled_requests(tmp_path):
+    profiler = Profiler(str(tmp_path), interval=0.001)
+    assert profiler.start(duration=None)
+    assert not profiler.start()
+    try:
+        assert profiler.stage('search') is _NULL  # вне запроса
+        with profiler.request('webhook'):
+            with profiler.stage('search'):
+                time.sleep(0.01)
+    finally:
+        path = profiler.stop()
+
+    assert path is not None and os.path.exists(path)
+    with open(path.replace('.collapsed', '.stages.json'), encoding='utf-8') as f:
+        stages = json.load(f)['stages']
+    assert set(stages) == {'webhook', 'search'}
+    assert stages['search']['count'] == 1
+    assert stages['webhook']['max_ms'] >= stages['search']['max_ms'] >= 10
+
+
+def test_sample_rate_zero_skips_requests(tmp_path):
+    profiler = Profiler(str(tmp_path))
+    profiler.start(duration=None, sample_rate=0.0)
+    try:
+        assert profiler.request('webhook') is _NULL
+    finally:
+        profiler.stop()
+
+
+def test_sampler_collects_stacks_of_running_requests(tmp_path):
+    profiler = Profiler(str(tmp_path), interval=0.001)
+    profiler.start(duration=None)
+    try:
+        with profiler.request('webhook'):
+            with profiler.stage('search'):
+                deadline = time.time() + 0.2
+                while time.time() < deadline and not profiler._stacks:
+                    sum(range(1000))
+    finally:
+        path = profiler.stop()
+
+    with open(path, encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    assert lines and all(line.startswith('webhook;search;') for line in lines)
+
+
+def test_profiler_stops_after_duration(tmp_path):
+    profiler = Profiler(str(tmp_path), interval=0.001)
+    profiler.start(duration=0.05)
+    # Поток сэмплера сам выключает профилирование и записывает файлы
+    profiler._sampler.join(2)
+    assert not profiler.active
+    assert list(tmp_path.glob('profile-*.stages.json'))
@@ -0,0 +1,72 @@
+from query_log import QueryLog, anonymize_user, normalize_query
+
+
+def read_lines(path):
+    with open(path, encoding='utf-8') as f:
+        return [line.rstrip('\n').split('\t') for line in f]
+
+
+def test_normalize_query():
+    assert normalize_query('  Ноутбук   ASUS ') == 'ноутбук asus'
+    assert normalize_query(None) == ''
+    assert len(normalize_query('x' * 500)) == 100
+
+
+def test_anonymize_user_depends_on_salt():
+    assert anonymize_user(None, b'salt') == '-'
+    assert anonymize_user(42, b'salt') == anonymize_user('42', b'salt')
+    assert anonymize_user(42, b'salt') != anonymize_user(42, b'other')
+    assert '42' not in anonymize_user(42, b'salt')
+
+
+def test_append_writes_anonymized_normalized_lines(tmp_path):
+    path = str(tmp_path / 'query_log.tsv')
+    log = QueryLog(path, salt='salt')
+    log.append('Ноутбук  ASUS', user_id=42)
+    log.append('   ')
+    log.close()
+    log.close()
+
+    [(timestamp, user, query)] = read_lines(path)
+    assert timestamp.isdigit()
+    assert user == anonymize_user(42, b'salt')
+    assert query == 'ноутбук asus'
+
+
+def test_top_queries_span_rotated_files(tmp_path):
+    path = str(tmp_path / 'query_log.tsv')
+    log = QueryLog(path, max_bytes=200, backups=3)
+    for query in ['ноутбук'] * 5 + ['телефон'] * 3 + ['свинина']:
+        log.append(query, user_id=1)
+    log.close()
+
+    assert len(log.files()) > 1
+    assert log.top_queries(2) == ['ноутбук', 'телефон']
+
+
+def test_warm_up_reports_hit_rate(tmp_path):
+    path = str(tmp_path / 'query_log.tsv')
+    log = QueryLog(path)
+    for query in ('ноутбук', 'ноутбук', 'телефон'):
+        log.append(query)
+    log.close()
+
+    replayed = []
+    stats = log.warm_up(replayed.extend, limit=1)
+    assert replayed == ['ноутбук']
+    assert stats['state'] == 'done' and stats['queries'] == 1
+    assert stats['hit_rate'] is None
+
+    log.append('ноутбук')
+    log.append('свинина')
+    assert log.warmup_stats()['hit_rate'] == 0.5
+
+
+def test_warm_up_survives_replay_errors(tmp_path):
+    log = QueryLog(str(tmp_path / 'query_log.tsv'))
+    log.close()
+
+    def replay(queries):
+        raise RuntimeError("поиск недоступен")
+
+    assert log.warm_up(replay)['state'] == 'done'
@@ -0,0 +1,58 @@
+from rendering import (CARD_SEPARATOR, TELEGRAM_LIMIT, chunk_messages, escape_markdown, normalize_product,
+                       rate_emoji, render_database_card, render_router_card)
+
+
+def test_normalize_product_accepts_both_schemas():
+    russian = normalize_product({'код': '8471300000', 'название': 'Ноутбуки', 'описание': 'кратко',
+                                 'полное_описание': 'Машины_вычислительные', 'группа': '84',
+                                 'пошлина': 'base: 0%', 'сертификация': 'Не указана'})
+    english = normalize_product({'code': '8471300000', 'name': 'Ноутбуки', 'description': 'Машины_вычислительные',
+                                 'group': '84', 'duties': {'base': 0}, 'certification': {'type': 'ТР ТС 004'}})
+
+    assert russian.description == english.description == 'Машины\\_вычислительные'
+    assert russian.duty_text == 'base: 0%' and russian.duties == {}
+    assert russian.certification == []
+    assert english.duties == {'base': 0}
+    assert english.certification == ['ТР ТС 004']
+
+
+def test_escape_markdown():
+    assert escape_markdown('a_b*c`d[e') == 'a\\_b\\*c\\`d\\[e'
+    assert rate_emoji(None) == '❔' and rate_emoji(0) == '🆓' and rate_emoji(30) == '🔴'
+
+
+def test_cards_contain_product_fields():
+    view = normalize_product({'code': '8517120000', 'name': 'Телефоны', 'group': '85', 'duties': {'base': '10%'}})
+    router = render_router_card(view)
+    assert '`8517120000`' in router
+    assert 'анализ 8517120000' in router
+    assert '✅ *Ограничения:* отсутствуют' in router
+
+    database = render_database_card(view, certification='ТР ТС 020')
+    assert 'base: 10%' in database
+    assert 'ТР ТС 020' in database
+
+
+def test_chunk_messages_splits_on_card_boundaries():
+    cards = [f"карточка {number} " + 'x' * 1000 for number in range(10)]
+    messages = list(chunk_messages(iter(cards), header='Заголовок\n\n', footer='\n\nконец'))
+
+    assert all(len(message) <= TELEGRAM_LIMIT for message in messages)
+    assert messages[0].startswith('Заголовок')
+    assert messages[-1].endswith('конец')
+    joined = CARD_SEPARATOR.join(message for message in messages)
+    assert all(card in joined for card in cards)
+    assert sum(message.count('карточка') for message in messages) == len(cards)
+
+
+def test_chunk_messages_splits_long_card_by_lines():
+    card = "\n".join('строка ' + 'y' * 200 for _ in range(50))
+    messages = list(chunk_messages([card]))
+    assert len(messages) > 1
+    assert all(len(message) <= TELEGRAM_LIMIT for message in messages)
+    assert "\n".join(messages) == card
+
+
+def test_chunk_messages_single_short_message():
+    assert list(chunk_messages(['a', 'b'], header='h:', separator='|', footer='.')) == ['h:a|b.']
+    assert list(chunk_messages([])) == []
@@ -0,0 +1,97 @@
+import os
+import signal
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from sharded_search import ShardedSearch, assign_chapters
+from tariff_patch import parse_patch
+
+ROWS = [(position, f"{position % 7:02d}", f"строка {position}" + (" ноутбук" if position % 3 == 0 else ""))
+        for position in range(300)]
+
+
+def linear(query, k, start=0):
+    return [position for position, _, text in ROWS if position >= start and query in text][:k]
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = ShardedSearch(2, str(tmp_path), timeout=2.0)
+    engine.build(ROWS, 'v1')
+    yield engine
+    engine.close()
+
+
+def test_assign_chapters_balances_sizes():
+    assert assign_chapters({'84': 10, '85': 8, '01': 3, '02': 2}, 2) == [['84', '02'], ['85', '01']]
+
+
+def test_search_matches_linear_scan(engine):
+    assert engine.search('ноутбук', 5) == linear('ноутбук', 5)
+    assert engine.search('ноутбук', 5, start=100) == linear('ноутбук', 5, 100)
+    assert engine.search('строка 29', 20) == linear('строка 29', 20)
+    assert engine.search_keywords(['ноутбук', 'строка 1'], 2) == [(2, 12), (2, 15)]
+
+
+def test_worker_exchange_ignores_locale_encoding(tmp_path, monkeypatch):
+    monkeypatch.setenv('PYTHONIOENCODING', 'cp1252')
+    engine = ShardedSearch(2, str(tmp_path), timeout=2.0)
+    try:
+        engine.build(ROWS, 'v1')
+        assert engine.search('ноутбук', 5) == linear('ноутбук', 5)
+    finally:
+        engine.close()
+
+
+def test_concurrent_queries_do_not_mix_responses(engine):
+    starts = list(range(0, 300, 3)) * 4
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(lambda start: engine.search('ноутбук', 4, start), starts))
+    assert results == [linear('ноутбук', 4, start) for start in starts]
+    assert engine.stats['errors'] == engine.stats['timeouts'] == 0
+
+
+def test_hung_worker_times_out_and_recovers(engine):
+    engine.timeout = 0.2
+    worker = engine._workers[0].process
+    os.kill(worker.pid, signal.SIGSTOP)
+    try:
+        assert engine.search('ноутбук', 5) is None
+    finally:
+        os.kill(worker.pid, signal.SIGCONT)
+    assert engine.stats['timeouts'] == 1
+    engine.timeout = 2.0
+    assert engine.search('ноутбук', 5) == linear('ноутбук', 5)
+
+
+def test_update_rewrites_only_touched_shards(engine):
+    shard_of_chapter_00 = engine._assignment['00']
+    assert engine.update([(0, '00', ''), (300, '00', 'строка 300 ноутбук')], 'v2') == 1
+    assert engine.stats['updated_shards'] == 1 and engine.version == 'v2'
+    expected = [position for position in linear('ноутбук', 200) if position != 0] + [300]
+    assert engine.search('ноутбук', 200) == expected
+    assert engine._assignment['00'] == shard_of_chapter_00
+
+
+def test_dead_worker_stops_sharded_search(engine):
+    engine._workers[1].process.kill()
+    engine._workers[1].process.wait()
+    assert engine.search('ноутбук', 5) is None
+    assert not engine.active
+    assert engine.stats['errors'] == 1
+
+
+def test_database_falls_back_to_linear_scan(ved_db):
+    sharded = ved_db.enable_sharded_search(2)
+    try:
+        assert [item['код'] for item in ved_db.search_by_name('телефон')] == ['8517120000']
+        ved_db.apply_patch(parse_patch({'version': 'p1', 'operations': [{'op': 'delete', 'code': '8517120000'}]}))
+        assert sharded.stats['updated_shards'] == 1 and sharded.version == ved_db._cursor_version()
+        assert ved_db.search_by_name('телефон') == []
+        for worker in sharded._workers:
+            worker.process.kill()
+        assert ved_db.search_by_name('телефон') == []
+        assert not sharded.active
+    finally:
+        sharded.close()
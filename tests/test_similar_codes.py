@@ -0,0 +1,32 @@
+from similar_codes import SimilarCodesIndex, build_index, product_text
+
+TEXTS = {
+    '8471300000': 'машины вычислительные портативные ноутбуки',
+    '8471410000': 'машины вычислительные прочие',
+    '0203110000': 'свинина туши и полутуши свиные',
+    '0203120000': 'свинина окорока лопатки свиные',
+}
+
+
+def build(tmp_path):
+    return SimilarCodesIndex(build_index(out_file=str(tmp_path / 'similar.npz'), k=2, texts=TEXTS))
+
+
+def test_product_text_skips_placeholder_name():
+    assert product_text({'name': '-', 'description': 'Живая рыба:'}) == 'Живая рыба:'
+    assert product_text({'name': 'Ноутбуки', 'description': 'машины'}, 'полное') == 'Ноутбуки полное'
+
+
+def test_precomputed_neighbours(tmp_path):
+    index = build(tmp_path)
+    assert index.similar('8471300000', 1)[0][0] == '8471410000'
+    assert index.similar('0203120000', 1)[0][0] == '0203110000'
+    assert all(code != '8471300000' for code, _ in index.similar('8471300000'))
+    assert index.similar('9999999999') == []
+
+
+def test_query_by_free_text(tmp_path):
+    index = build(tmp_path)
+    [neighbours] = index.query(['свиные окорока'], k=1)
+    assert neighbours[0][0] == '0203120000'
+    assert index.text('0203110000') == TEXTS['0203110000']
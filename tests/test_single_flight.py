@@ -0,0 +1,68 @@
+import threading
+import time
+
+from enhanced_ved_system import EnhancedVEDDatabase, SingleFlight
+
+
+def run_concurrently(count, target):
+    results = [None] * count
+
+    def worker(i):
+        results[i] = target()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.1)
+        return 'результат'
+
+    assert run_concurrently(5, lambda: flight.do('ключ', slow)) == ['результат'] * 5
+    assert len(calls) == 1
+    assert flight.stats['shared'] == 4
+
+
+def test_leader_rechecks_cache_before_executing():
+    flight = SingleFlight()
+    assert flight.do('ключ', lambda: 'поиск', recheck=lambda: 'из кэша') == 'из кэша'
+    assert flight.stats['executed'] == 0 and flight.stats['rechecked'] == 1
+
+
+def test_follower_stops_waiting_after_timeout():
+    flight = SingleFlight(timeout=0.05)
+    started = threading.Event()
+
+    def stuck():
+        started.set()
+        time.sleep(0.5)
+        return 'ведущий'
+
+    leader = threading.Thread(target=flight.do, args=('ключ', stuck))
+    leader.start()
+    started.wait()
+    began = time.perf_counter()
+    assert flight.do('ключ', lambda: 'свой') == 'свой'
+    assert time.perf_counter() - began < 0.4
+    assert flight.stats['timeouts'] == 1
+    leader.join()
+
+
+def test_smart_search_uses_cache(tmp_path):
+    (tmp_path / 'tnved_database.json').write_text(
+        '{"codes": [{"code": "8471300000", "name": "Ноутбук"}]}', encoding='utf-8')
+    database = EnhancedVEDDatabase(tmp_path)
+    first = database.smart_search('8471300000')
+    assert first.product['code'] == '8471300000' and first.confidence == 1.0
+    assert database.smart_search('8471300000') == first
+    stats = database.get_search_stats()
+    assert stats['searches_executed'] == 1 and stats['cache_hits'] == 1
@@ -0,0 +1,78 @@
+import pickle
+import random
+
+from sketches import HyperLogLog, PopularityTracker, SpaceSaving, UniqueCounter
+
+HOUR = 3600
+
+
+def test_space_saving_exact_below_capacity():
+    sketch = SpaceSaving(capacity=10)
+    for item in 'aaabbc':
+        sketch.add(item)
+    assert sketch.top(2) == [('a', 3), ('b', 2)]
+    assert sketch.estimate('c') == 1
+    assert sketch.estimate('z') == 0
+
+
+def test_space_saving_reports_evictions():
+    sketch = SpaceSaving(capacity=2)
+    assert sketch.add('a') is None
+    assert sketch.add('b') is None
+    assert sketch.add('c') == ('a', 1)
+    assert sketch.estimate('c') == 2
+    assert len(sketch) == 2
+
+
+def test_space_saving_keeps_heavy_hitters():
+    rng = random.Random(1)
+    sketch = SpaceSaving(capacity=50)
+    stream = ['hot'] * 500 + [f"rare{rng.randrange(2000)}" for _ in range(5000)]
+    rng.shuffle(stream)
+    for item in stream:
+        sketch.add(item)
+    assert sketch.top(1)[0][0] == 'hot'
+
+
+def test_hyperloglog_error_within_bounds():
+    counter = HyperLogLog(p=12)
+    for user in range(20000):
+        counter.add(user)
+    assert abs(counter.count() - 20000) / 20000 < 0.05
+
+
+def test_windowed_top_matches_merged_slots():
+    tracker = PopularityTracker(capacity=3)
+    now = 10 * HOUR
+    stream = ['a', 'b', 'a', 'c', 'd', 'a', 'e', 'b', 'b', 'f', 'a']
+    for offset, item in enumerate(stream):
+        tracker.add(item, now + offset * 400)
+    at = now + len(stream) * 400
+
+    slots = tracker._live_slots('hour', at)
+    expected = {}
+    for sketch in slots:
+        for item, count in sketch.items().items():
+            expected[item] = expected.get(item, 0) + count
+    assert dict(tracker.top(10, 'hour', at)) == expected
+    assert tracker.estimate('a', 'hour', at) == expected.get('a', 0)
+
+
+def test_window_forgets_old_slots_without_writes():
+    tracker = PopularityTracker()
+    tracker.add('8471300000', 0)
+    assert tracker.top(1, 'hour', 60) == [('8471300000', 1)]
+    assert tracker.top(1, 'hour', 2 * HOUR) == []
+    assert tracker.top(1, 'all', 2 * HOUR) == [('8471300000', 1)]
+
+
+def test_trackers_survive_pickle():
+    tracker = PopularityTracker()
+    users = UniqueCounter()
+    for user in range(10):
+        tracker.add('код', 100)
+        users.add(user, 100)
+    tracker, users = pickle.loads(pickle.dumps((tracker, users)))
+    tracker.add('код', 200)
+    assert tracker.top(1, 'hour', 200) == [('код', 11)]
+    assert users.count('hour', 200) == 10
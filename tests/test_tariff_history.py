@@ -0,0 +1,68 @@
+from datetime import date
+
+import pytest
+
+from tariff_history import TariffHistory, parse_date
+from tariff_patch import parse_patch
+from ved_sqlite import SQLiteVEDDatabase, import_json
+
+
+def test_parse_date_formats():
+    assert parse_date('2026-03-01') == parse_date('01.03.2026') == date(2026, 3, 1)
+    with pytest.raises(ValueError):
+        parse_date('март')
+
+
+def test_value_on_and_changed_between():
+    history = TariffHistory()
+    history.record('8471300000', 'пошлина', '2026-01-01', '0%', '5%')
+    history.record('8471300000', 'пошлина', '2026-03-01', '5%', '3%')
+    history.record('8517120000', 'пошлина', '2026-02-01', '10%', '8%')
+
+    assert history.value_on('8471300000', 'пошлина', '2025-12-31') == '0%'
+    assert history.value_on('8471300000', 'пошлина', '2026-02-15') == '5%'
+    assert history.value_on('8471300000', 'пошлина', '2026-03-01') == '3%'
+    assert history.value_on('0203110000', 'пошлина', '2026-03-01', current='15%') == '15%'
+    assert history.changed_between('2026-01-01', '2026-03-01') == ['8471300000', '8517120000']
+    assert history.changed_between('2025-12-31', '2026-01-01') == ['8471300000']
+
+
+def test_out_of_order_records_are_kept_in_date_order():
+    history = TariffHistory()
+    history.record('8471300000', 'пошлина', '2026-03-01', '0%', '3%')
+    history.record('8471300000', 'пошлина', '2026-01-01', '3%', '5%')
+    history.record('8471300000', 'пошлина', '2026-01-01', '5%', '6%')
+
+    assert history.timeline('8471300000') == [(None, '0%'), (date(2026, 1, 1), '6%'), (date(2026, 3, 1), '3%')]
+    assert history.value_on('8471300000', 'пошлина', '2026-02-01') == '6%'
+    assert history.changed_between('2025-01-01', '2026-12-31') == ['8471300000']
+    assert history.stats() == {'codes': 1, 'intervals': 3, 'changes': 2}
+
+
+def test_product_on_after_patches(ved_db):
+    ved_db.apply_patch(parse_patch({'version': 'p1', 'effective_date': '2026-01-01', 'operations': [
+        {'op': 'modify', 'code': '8517120000', 'fields': {'duties': {'base': '5%'}}},
+        {'op': 'delete', 'code': '8528720000'},
+    ]}))
+
+    before = ved_db.product_on('8517120000', '31.12.2025')
+    after = ved_db.product_on('8517120000', '2026-01-01')
+    assert before['пошлина'] != after['пошлина'] == ved_db.find_by_code('8517120000')['пошлина']
+    assert ved_db.product_on('8528720000', '2025-06-01')['код'] == '8528720000'
+    assert ved_db.product_on('8528720000', '2026-06-01') is None
+    assert ved_db.product_on('8471300000', '2020-01-01') == ved_db.find_by_code('8471300000')
+    assert ved_db.codes_changed_between('2025-12-31', '2026-01-01') == ['8517120000', '8528720000']
+
+
+def test_product_on_sqlite_returns_current_record(database_file, certification_file, tmp_path):
+    db = SQLiteVEDDatabase(import_json(database_file, str(tmp_path / 'tnved.sqlite')), certification_file)
+    assert db.product_on('8471300000', '2026-01-01') == db.find_by_code('8471300000')
+    assert db.product_on('9999999999', '2026-01-01') is None
+
+
+def test_router_shows_sqlite_code_on_date(database_file, certification_file, tmp_path):
+    from ved_router import handle_code_on_date
+    db = SQLiteVEDDatabase(import_json(database_file, str(tmp_path / 'tnved.sqlite')), certification_file)
+    answer = handle_code_on_date('8471300000', '01.01.2026', db)
+    assert answer.startswith('📅 *Редакция на 01.01.2026*')
+    assert '8471300000' in answer
@@ -0,0 +1,84 @@
+import pytest
+
+from tariff_patch import PatchError, parse_patch
+import ved_database
+
+
+def make_patch(*operations, **extra):
+    return parse_patch({'version': 'p1', 'effective_date': '2026-10-01', 'operations': list(operations), **extra})
+
+
+def test_patch_adds_modifies_and_deletes_codes(ved_db):
+    summary = ved_db.apply_patch(make_patch(
+        {'op': 'add', 'item': {'code': '8471300001', 'name': 'Планшеты', 'description': 'Планшетные компьютеры',
+                               'group': '84', 'duties': {'base': '5%'}, 'certification': {'type': 'ТР ТС 020'}}},
+        {'op': 'modify', 'code': '8471300000', 'fields': {'duties': {'base': '3%'}}},
+        {'op': 'delete', 'code': '8528720000'},
+    ))
+
+    assert summary['operations'] == 3
+    assert ved_db.find_by_code('8471300001')['название'] == 'Планшеты'
+    assert ved_db.duty_table.rate('8471300000') == 3.0
+    assert ved_db.find_by_code('8528720000') is None
+    assert ved_db.duty_table.rate('8528720000') is None
+    assert '8471300001' in ved_db.get_codes_by_certification('ТР ТС 020')
+    assert [item['код'] for item in ved_db.search_by_name('планшет')] == ['8471300001']
+    assert ved_db.patch_version == 'p1'
+
+
+def test_failed_operation_leaves_database_unchanged(ved_db, monkeypatch):
+    data = ved_db.data
+    by_code = dict(ved_db._by_code)
+    search_text = list(ved_db._search_text)
+    snapshot_version = ved_db.snapshot_version()
+
+    def broken_descriptions(items):
+        raise RuntimeError("сбой посреди патча")
+
+    monkeypatch.setattr(ved_database, 'build_full_descriptions', broken_descriptions)
+    with pytest.raises(RuntimeError):
+        ved_db.apply_patch(make_patch(
+            {'op': 'modify', 'code': '8471300000', 'fields': {'duties': {'base': '3%'},
+                                                              'certification': {'type': 'СЭС'}}},
+            {'op': 'delete', 'code': '8517120000'},
+        ))
+
+    assert ved_db.data is data
+    assert ved_db._by_code == by_code
+    assert ved_db._search_text == search_text
+    assert ved_db.duty_table.rate('8471300000') == 0.0
+    assert ved_db.find_by_code('8471300000')['пошлина'] == by_code['8471300000']['пошлина']
+    assert '8471300000' not in ved_db.get_codes_by_certification('СЭС')
+    assert not ved_db.history.has_history('8471300000')
+    assert ved_db.snapshot_version() == snapshot_version
+    assert ved_db.patch_version is None
+
+
+def test_validation_rejects_inconsistent_patches(ved_db):
+    with pytest.raises(PatchError):
+        ved_db.apply_patch(make_patch({'op': 'delete', 'code': '0000000000'}))
+    with pytest.raises(PatchError):
+        ved_db.apply_patch(make_patch({'op': 'add', 'item': {'code': '8471300000'}}))
+    with pytest.raises(PatchError):
+        ved_db.apply_patch(make_patch({'op': 'delete', 'code': '8471300000'}, base_version='другая'))
+    with pytest.raises(PatchError):
+        parse_patch({'version': 'p1', 'operations': [{'op': 'rename', 'code': '8471300000'}]})
+    assert ved_db.patch_version is None
+
+
+def test_snapshot_keeps_version_taken_before_patch(ved_db):
+    snapshot = ved_db.snapshot()
+    ved_db.apply_patch(make_patch({'op': 'delete', 'code': '8471300000'}))
+    assert '8471300000' in [item['код'] for item in snapshot.iter_products()]
+    assert ved_db.find_by_code('8471300000') is None
+
+
+def test_patch_without_snapshot_updates_in_place(ved_db):
+    data = ved_db.data
+    ved_db.apply_patch(make_patch({'op': 'modify', 'code': '8517120000', 'fields': {'duties': {'base': '5%'}}}))
+    assert ved_db.data is data
+
+    ved_db.snapshot()
+    ved_db.apply_patch(make_patch({'op': 'delete', 'code': '8517120000'}, version='p2'))
+    assert ved_db.data is not data
+    assert ved_db.find_by_code('8517120000') is None
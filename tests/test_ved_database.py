@@ -0,0 +1,98 @@
+import json
+import os
+
+import pytest
+
+from certification_index import CertificationIndex
+from tariff_patch import parse_patch
+from ved_database import VEDDatabase
+
+
+def test_product_card_cached_until_patch(ved_db):
+    product = ved_db.find_by_code('8471300000')
+    card = ved_db.format_product_info(product)
+    assert '8471300000' in card
+    assert ved_db.format_product_info(product) == card
+
+    ved_db.apply_patch(parse_patch({
+        'version': 'p1',
+        'operations': [{'op': 'modify', 'code': '8471300000', 'fields': {'name': 'Ноутбуки игровые'}}],
+    }))
+    assert 'игровые' in ved_db.format_product_info(ved_db.find_by_code('8471300000'))
+
+
+def test_pages_follow_cursors_without_repeats(ved_db):
+    page = ved_db.get_page('a', page_size=4)
+    assert len(page.items) == 4 and page.next_cursor
+    rest = ved_db.get_page(cursor=page.next_cursor, page_size=4)
+    assert rest.shown == 4 and rest.next_cursor is None
+    codes = [item['код'] for item in page.items + rest.items]
+    assert len(codes) == len(set(codes)) == ved_db.get_product_count()
+
+
+def test_prefix_and_group_pages(ved_db):
+    assert [item['код'] for item in ved_db.get_page('p', '85').items] == ['8517120000', '8528720000']
+    assert [item['код'] for item in ved_db.get_page('g', '03').items] == ['0302110000', '0302710000']
+
+
+def test_invalid_or_stale_cursor_raises(ved_db):
+    with pytest.raises(ValueError):
+        ved_db.get_page(cursor='not-a-cursor')
+
+    cursor = ved_db.get_page('a', page_size=1).next_cursor
+    ved_db.apply_patch(parse_patch({
+        'version': 'p1', 'operations': [{'op': 'delete', 'code': '8528720000'}],
+    }))
+    with pytest.raises(ValueError, match='обновилась'):
+        ved_db.get_page(cursor=cursor)
+
+
+def test_reload_certification_swaps_index(ved_db, certification_file):
+    index = ved_db.certification
+    assert not ved_db.reload_certification()
+    with open(certification_file, 'r', encoding='utf-8') as f:
+        raw = json.load(f)
+    raw['assignments'] = {'ТР ТС 021': ['02']}
+    with open(certification_file, 'w', encoding='utf-8') as f:
+        json.dump(raw, f, ensure_ascii=False)
+    os.utime(certification_file, (1, 1))
+
+    assert ved_db.reload_certification()
+    assert ved_db.certification is not index
+    assert ved_db.get_codes_by_certification('ТР ТС 021') == ['0203110000']
+
+
+def test_certification_file_read_once_per_load(database_file, certification_file, monkeypatch):
+    reads = []
+    original = CertificationIndex._read
+    monkeypatch.setattr(CertificationIndex, '_read', lambda self: reads.append(1) or original(self))
+    VEDDatabase(database_file, certification_file)
+    assert len(reads) == 1
+
+
+def test_reload_publishes_indexes_together(ved_db, database_file, monkeypatch):
+    with open(database_file, encoding='utf-8') as f:
+        products = json.load(f)
+    products.append({"code": "8529000000", "name": "Части аппаратуры", "description": "Части",
+                     "group": "85", "duties": {"base": "7%"}, "certification": {"type": "ТР ТС 020"}})
+    with open(database_file, 'w', encoding='utf-8') as f:
+        json.dump(products, f, ensure_ascii=False)
+
+    old_version = ved_db.version
+    seen_during_build = []
+
+    class ObservedIndex(CertificationIndex):
+        def __init__(self, *args, **kwargs):
+            seen_during_build.append((ved_db.version, ved_db.find_by_code('8529000000'),
+                                      len(ved_db.data) == len(ved_db._search_text)))
+            super().__init__(*args, **kwargs)
+
+    monkeypatch.setattr('ved_database.CertificationIndex', ObservedIndex)
+    ved_db.load_database()
+
+    assert seen_during_build == [(old_version, None, True)]
+    assert ved_db.version != old_version
+    assert len(ved_db.data) == len(ved_db._search_text) == len(ved_db._code_order)
+    assert ved_db.find_by_code('8529000000')['название'] == 'Части аппаратуры'
+    assert ved_db.duty_table.rate('8529000000') == 7.0
+    assert '8529000000' in ved_db.get_codes_by_certification('ТР ТС 020')
@@ -0,0 +1,50 @@
+import pytest
+
+from tariff_patch import PatchError, parse_patch
+from ved_sqlite import SQLiteVEDDatabase, import_json, schema_is_current
+
+
+@pytest.fixture
+def sqlite_db(database_file, certification_file, tmp_path):
+    db_file = import_json(database_file, str(tmp_path / 'tnved.sqlite'))
+    return SQLiteVEDDatabase(db_file, certification_file)
+
+
+def codes(items):
+    return [item['код'] for item in items]
+
+
+def test_import_writes_current_schema(sqlite_db):
+    assert schema_is_current(sqlite_db.db_file)
+    assert not schema_is_current(sqlite_db.db_file + '.missing')
+
+
+def test_same_answers_as_memory_backend(sqlite_db, ved_db):
+    assert sqlite_db.version == ved_db.version
+    assert sqlite_db.get_product_count() == ved_db.get_product_count()
+    assert sqlite_db.find_by_code('8471300000') == ved_db.find_by_code('8471300000')
+    assert sqlite_db.find_by_code('9999999999') is None
+    for query in ('ноутбук', 'тилапия', 'свин', 'ох'):
+        assert codes(sqlite_db.search_by_name(query)) == codes(ved_db.search_by_name(query))
+    assert codes(sqlite_db.get_products_by_prefix('85')) == codes(ved_db.get_products_by_prefix('85'))
+    assert codes(sqlite_db.get_products_by_group('03')) == codes(ved_db.get_products_by_group('03'))
+
+
+def test_pages_and_export(sqlite_db):
+    page = sqlite_db.get_page('a', page_size=4)
+    rest = sqlite_db.get_page(cursor=page.next_cursor, page_size=4)
+    assert len(page.items) + len(rest.items) == sqlite_db.get_product_count()
+
+    version, rows = sqlite_db.iter_export(prefix='85')
+    assert version == sqlite_db.version
+    assert codes(rows) == ['8517120000', '8528720000']
+
+
+def test_duties_and_certification_loaded(sqlite_db):
+    assert sqlite_db.duty_table.rate('8517120000') == 10.0
+    assert [req['id'] for req in sqlite_db.get_certification_requirements('8517120000')] == ['ТР ТС 020']
+
+
+def test_patch_rejected(sqlite_db):
+    with pytest.raises(PatchError):
+        sqlite_db.apply_patch(parse_patch({'version': 'p1', 'operations': []}))
@@ -0,0 +1,66 @@
+import os
+
+import warm_state
+from warm_state import WarmState
+
+
+def make_state(path, version='v1'):
+    store = {}
+    state = WarmState(str(path), version=lambda: version)
+    state.register('cache', lambda: {'a': 1}, store.update)
+    return state, store
+
+
+def test_save_and_restore_with_matching_version(tmp_path):
+    path = tmp_path / 'warm_state.pickle'
+    state, _ = make_state(path)
+    assert state.save()
+    assert state.stats['saved'] == 1 and state.stats['bytes'] > 0
+    assert [name for name in os.listdir(tmp_path)] == ['warm_state.pickle']
+
+    restored_state, store = make_state(path)
+    assert restored_state.restore() == ['cache']
+    assert store == {'a': 1}
+
+
+def test_version_mismatch_skips_part(tmp_path):
+    path = tmp_path / 'warm_state.pickle'
+    make_state(path, 'v1')[0].save()
+    state, store = make_state(path, 'v2')
+    assert state.restore() == []
+    assert state.stats['skipped'] == ['cache']
+    assert store == {}
+
+
+def test_missing_or_corrupt_file(tmp_path):
+    path = tmp_path / 'warm_state.pickle'
+    state, _ = make_state(path)
+    assert state.restore() == []
+    path.write_bytes(b'not a pickle')
+    assert state.restore() == []
+
+
+def test_save_fsyncs_directory_after_replace(tmp_path, monkeypatch):
+    calls = []
+    real_replace, real_fsync_directory = os.replace, warm_state._fsync_directory
+    monkeypatch.setattr(os, 'replace', lambda *args: (calls.append('replace'), real_replace(*args)))
+    monkeypatch.setattr(warm_state, '_fsync_directory',
+                        lambda directory: (calls.append(directory), real_fsync_directory(directory)))
+
+    make_state(tmp_path / 'warm_state.pickle')[0].save()
+    assert calls == ['replace', str(tmp_path)]
+
+
+def test_failed_dump_keeps_other_parts_and_previous_file(tmp_path, monkeypatch):
+    path = tmp_path / 'warm_state.pickle'
+    state, _ = make_state(path)
+    state.register('broken', lambda: 1 / 0, lambda value: None)
+    assert state.save()
+    assert state.stats['saved'] == 1
+
+    def failing_replace(src, dst):
+        raise OSError("диск заполнен")
+
+    monkeypatch.setattr(os, 'replace', failing_replace)
+    assert not state.save()
+    assert os.listdir(tmp_path) == ['warm_state.pickle']
@@ -1,65 +1,174 @@
 import json
+import base64
+import bisect
+import hashlib
 import logging
-from typing import List, Dict, Optional, Any
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from itertools import islice
+from typing import List, Dict, Optional, Any, Callable, Iterator, Tuple
+
+from product_cards import card_cache
+from duty_table import DutyTable, parse_duty, format_duty, NOT_SET
+from certification_index import CertificationIndex
+from hierarchy import build_full_descriptions
+from tariff_patch import PatchError, TariffPatch
+from rendering import escape_markdown, normalize_product, render_database_card
+from sharded_search import ShardedSearch
+from tariff_history import HISTORY_FIELDS, DateLike, TariffHistory, parse_date
+from deadline import NO_DEADLINE, Deadline
 
-# Настройка логирования
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+@dataclass
+class SearchPage:
+    """Страница выдачи"""
+    items: List[Dict]
+    query: str
+    shown: int  # сколько записей было показано до этой страницы
+    next_cursor: Optional[str]  # None, если страница последняя
+
+@dataclass
+class _PatchPlan:
+    """Изменения патча, подготовленные без изменения базы"""
+    base: int  # позиция первой добавляемой записи (длина data)
+    rows: Dict[int, Dict] = field(default_factory=dict)  # новые и замененные записи
+    added: List[int] = field(default_factory=list)
+    deleted: set = field(default_factory=set)
+    positions: Dict[str, List[int]] = field(default_factory=dict)  # позиции кодов операций
+    search_text: Dict[int, str] = field(default_factory=dict)
+    by_code: Dict[str, Optional[Dict]] = field(default_factory=dict)  # None — код удален
+    duties: List[Tuple[str, Optional[Tuple[str, Optional[Dict]]]]] = field(default_factory=list)
+    certification: List[Tuple[str, Optional[str]]] = field(default_factory=list)
+    changed: set = field(default_factory=set)
+    before: Dict[str, Dict] = field(default_factory=dict)  # поля истории до и после патча
+    after: Dict[str, Dict] = field(default_factory=dict)
+
+@dataclass
+class DatabaseSnapshot:
+    """Записи одной версии базы: список и удаленные позиции не меняются после снятия"""
+    version: Optional[str]
+    rows: List[Dict]
+    deleted: set
+    
+    def iter_products(self, group: Optional[str] = None, prefix: Optional[str] = None) -> Iterator[Dict]:
+        """Записи среза (группа — точное совпадение, префикс — начало кода)"""
+        group = (group or '').strip()
+        prefix = (prefix or '').strip()
+        deleted = self.deleted
+        for position, item in enumerate(self.rows):
+            if position in deleted:
+                continue
+            if group and item.get('группа') != group:
+                continue
+            if prefix and not item.get('код', '').startswith(prefix):
+                continue
+            yield item
+
 class VEDDatabase:
-    def __init__(self, json_file: str = 'tnved_database.json'):
+    def __init__(self, json_file: str = 'tnved_database.json',
+                 certification_file: str = 'certification.json'):
         """Инициализация базы данных ТН ВЭД"""
         self.json_file = json_file
+        self.certification_file = certification_file
         self.data = []
+        self.version = None
+        self._by_code: Dict[str, Dict] = {}
+        self._search_text: List[str] = []
+        self._code_order: List[Tuple[str, int]] = []
+        self.duty_table = DutyTable([])
+        self.certification: Optional[CertificationIndex] = None  # строится в load_database
+        self.load_phases: Dict = {}
+        # Необязательный шардированный поиск (enable_sharded_search)
+        self.sharded_search: Optional[ShardedSearch] = None
+        # Патч и снятие среза (snapshot) не пересекаются
+        self._patch_lock = threading.Lock()
+        self._reset_patches()
+        # Запросы, на которые ссылаются курсоры (курсор хранит только короткий id)
+        self._cursor_queries: "OrderedDict[str, str]" = OrderedDict()
         self.load_database()
     
-    def _format_duties(self, duties: dict) -> str:
+    @staticmethod
+    def _format_duties(duties: dict) -> str:
         """Форматирование пошлин"""
         if not duties or not isinstance(duties, dict):
             return "Не указана"
         
         formatted = []
         for country, rate in duties.items():
-            if rate and rate != 0:
-                formatted.append(f"{country}: {rate}%")
+            if parse_duty(rate)[0] != NOT_SET:
+                formatted.append(f"{country}: {format_duty(rate)}")
         
         return ", ".join(formatted) if formatted else "Не указана"
 
-    def _format_certification(self, cert: dict) -> str:
+    @staticmethod
+    def _format_certification(cert: dict) -> str:
         """Форматирование сертификации"""
         if not cert or not isinstance(cert, dict):
             return "Не указана"
         
         return str(cert.get('type', 'Не указана'))
     
+    @staticmethod
+    def convert_item(item: Any) -> Optional[Dict]:
+        """Запись исходного JSON -> товар базы (None, если нет кода или названия)"""
+        try:
+            if isinstance(item, dict):
+                # Получаем код из разных возможных полей
+                code = str(item.get('code', item.get('код', item.get('id', '')))).strip()
+                name = str(item.get('name', item.get('название', ''))).strip()
+                description = str(item.get('description', item.get('описание', name))).strip()
+                group = str(item.get('group', item.get('группа', item.get('id', '')))).strip()
+                
+                converted_item = {
+                    'код': code,
+                    'название': name,
+                    'описание': description,
+                    'группа': group,
+                    'пошлина': VEDDatabase._format_duties(item.get('duties', {})),
+                    'сертификация': VEDDatabase._format_certification(item.get('certification', {}))
+                }
+                
+                # Добавляем если есть код И название
+                if converted_item['код'] and converted_item['название']:
+                    logger.debug("Добавлен товар: %s - %s", code, name)
+                    return converted_item
+        except Exception as e:
+            logger.error(f"Ошибка обработки товара: {e}")
+        return None
+    
+    @staticmethod
+    def add_full_descriptions(items: List[Dict]):
+        """Полное иерархическое описание каждой записи ('полное_описание', см. hierarchy.py)"""
+        full = build_full_descriptions((item['код'], item['описание']) for item in items)
+        for item, text in zip(items, full):
+            item['полное_описание'] = text
+    
+    @staticmethod
+    def search_line(item: Dict) -> str:
+        """Текст записи для поиска по названию и описанию"""
+        description = item.get('полное_описание') or item.get('описание', '')
+        return f"{item.get('название', '')}\n{description}".lower()
+    
     def load_database(self):
         """Загрузка базы данных из JSON файла"""
         try:
-            with open(self.json_file, 'r', encoding='utf-8') as f:
-                raw_data = json.load(f)
+            started = time.perf_counter()
+            with open(self.json_file, 'rb') as f:
+                raw_bytes = f.read()
+            read_done = time.perf_counter()
+            raw_data = json.loads(raw_bytes.decode('utf-8'))
+            parse_done = time.perf_counter()
             
-            self.data = []
+            # Версия базы — хэш содержимого файла; ключ для кэшей карточек
+            version = hashlib.sha1(raw_bytes).hexdigest()[:12]
+            data = []
+            duty_rows = []
             logger.info(f"Тип загруженных данных: {type(raw_data)}")
             
-            # Рекурсивный поиск массива товаров
-            def find_products_array(data, path=""):
-                if isinstance(data, list):
-                    # Проверяем не пустой ли список и есть ли товары
-                    if data and isinstance(data[0], dict):
-                        # Проверяем есть ли поля товара
-                        first_item = data[0]
-                        if any(key in first_item for key in ['code', 'код', 'name', 'название', 'id']):
-                            logger.info(f"Найден массив товаров по пути: {path}")
-                            return data
-                    return None
-                elif isinstance(data, dict):
-                    for key, value in data.items():
-                        result = find_products_array(value, f"{path}.{key}" if path else key)
-                        if result:
-                            return result
-                    return None
-                return None
-            
             # Ищем массив товаров
             products_array = find_products_array(raw_data)
             
@@ -67,46 +176,413 @@ class VEDDatabase:
                 logger.info(f"Найдено товаров для обработки: {len(products_array)}")
                 # Конвертируем товары
                 for item in products_array:
-                    try:
-                        if isinstance(item, dict):
-                            # Получаем код из разных возможных полей
-                            code = str(item.get('code', item.get('код', item.get('id', '')))).strip()
-                            name = str(item.get('name', item.get('название', ''))).strip()
-                            description = str(item.get('description', item.get('описание', name))).strip()
-                            group = str(item.get('group', item.get('группа', item.get('id', '')))).strip()
-                            
-                            converted_item = {
-                                'код': code,
-                                'название': name,
-                                'описание': description,
-                                'группа': group,
-                                'пошлина': self._format_duties(item.get('duties', {})),
-                                'сертификация': self._format_certification(item.get('certification', {}))
-                            }
-                            
-                            # Добавляем если есть код И название
-                            if converted_item['код'] and converted_item['название']:
-                                self.data.append(converted_item)
-                                logger.info(f"Добавлен товар: {code} - {name}")
-                    except Exception as e:
-                        logger.error(f"Ошибка обработки товара: {e}")
-                        continue
+                    converted_item = self.convert_item(item)
+                    if converted_item:
+                        data.append(converted_item)
+                        duty_rows.append((converted_item['код'], converted_item['группа'], item.get('duties', {})))
             else:
                 logger.warning("Массив товаров не найден в JSON")
+            convert_done = time.perf_counter()
                 
-            logger.info(f"Загружено {len(self.data)} кодов ТН ВЭД")
+            self.add_full_descriptions(data)
+            by_code, search_text, code_order = self._build_indexes(data)
+            # Ставки разбираются один раз в типизированную таблицу
+            duty_table = DutyTable(duty_rows)
+            certification = CertificationIndex(
+                self.certification_file,
+                ((item['код'], item['сертификация']) for item in data)
+            )
+            # Новая версия со всеми индексами публикуется одним блоком:
+            # читатели не видят новых записей со старыми индексами
+            with self._patch_lock:
+                self.version = version
+                self.data = data
+                self._by_code, self._search_text, self._code_order = by_code, search_text, code_order
+                self.duty_table = duty_table
+                self.certification = certification
+                self._reset_patches()
+            index_done = time.perf_counter()
+            # Фазы последней загрузки (для /debug/memory)
+            self.load_phases = {
+                'read': round(read_done - started, 4),
+                'parse': round(parse_done - read_done, 4),
+                'convert': round(convert_done - parse_done, 4),
+                'index': round(index_done - convert_done, 4),
+                'total': round(index_done - started, 4),
+                'file_bytes': len(raw_bytes),
+                'rows': len(self.data),
+                'loaded_at': datetime.now().isoformat(timespec='seconds'),
+            }
+            logger.info(f"Загружено {len(self.data)} кодов ТН ВЭД (версия {self.version}) "
+                        f"за {self.load_phases['total']:.2f}с")
             if self.data:
                 logger.info(f"Первый товар: {self.data[0]['код']} - {self.data[0]['название'][:50]}")
                 
         except FileNotFoundError:
             logger.error(f"Файл {self.json_file} не найден")
-            self.data = []
+            self._clear()
         except json.JSONDecodeError as e:
             logger.error(f"Ошибка парсинга JSON: {e}")
-            self.data = []
+            self._clear()
         except Exception as e:
             logger.error(f"Ошибка загрузки базы: {e}")
+            self._clear()
+    
+    def _clear(self):
+        """Пустая база (при ошибке загрузки)"""
+        certification = CertificationIndex(self.certification_file)
+        with self._patch_lock:
             self.data = []
+            self._by_code = {}
+            self._search_text = []
+            self._code_order = []
+            self.duty_table = DutyTable([])
+            self.certification = certification
+            self._reset_patches()
+    
+    def _reset_patches(self):
+        """Состояние патчей: после полной (пере)загрузки патчей нет"""
+        self.patch_version: Optional[str] = None
+        self.version_log: List[Dict] = []
+        self._code_versions: Dict[str, str] = {}
+        self._deleted: set = set()  # позиции удаленных записей (записи остаются в data)
+        self._data_shared = False  # на data и _deleted держится срез: патч их копирует
+        self.history = TariffHistory()  # значения по датам вступления патчей в силу
+    
+    def reload_certification(self) -> bool:
+        """Перечитать certification.json без перезагрузки базы ТН ВЭД; True — индекс заменен
+
+        Новый индекс строится рядом и подменяет прежний одной ссылкой:
+        читатели видят прежний или новый индекс целиком.
+        """
+        with self._patch_lock:
+            index = self.certification.reloaded()
+            if index is None:
+                return False
+            self.certification = index
+            return True
+    
+    def get_certification_requirements(self, code: str) -> List[Dict]:
+        """Требования сертификации для кода"""
+        return [{'id': req.id, 'title': req.title} for req in self.certification.requirements_for(code)]
+    
+    def get_codes_by_certification(self, requirement: str, chapter: Optional[str] = None) -> List[str]:
+        """Коды, которым нужно требование (например, "ТР ТС 020" в главе "85")"""
+        return self.certification.codes_for(requirement, chapter)
+    
+    # Патчи базы (tariff_patch.py)
+    _PATCH_FIELDS = {'name': 'название', 'description': 'описание', 'group': 'группа'}
+    
+    def code_version(self, code: str) -> Optional[str]:
+        """Версия данных кода: версия базы или базы с последним изменившим код патчем
+
+        Ключ кэшей карточек и анализов: патч устаревает только записи своих кодов.
+        """
+        patch_version = self._code_versions.get(code)
+        return f"{self.version}+{patch_version}" if patch_version else self.version
+    
+    def snapshot_version(self) -> Optional[str]:
+        """Версия базы целиком с учетом примененных патчей (ETag выдачи REST API)"""
+        if not self.version_log:
+            return self.version
+        return f"{self.version}+{len(self.version_log)}.{self.patch_version}"
+    
+    def _positions_for(self, code: str, prefix: bool = False) -> List[int]:
+        """Позиции в data записей кода (или всех кодов с префиксом), O(log n + k)"""
+        order = self._code_order
+        index = bisect.bisect_left(order, (code, -1))
+        positions = []
+        while index < len(order) and (order[index][0].startswith(code) if prefix else order[index][0] == code):
+            positions.append(order[index][1])
+            index += 1
+        return positions
+    
+    def apply_patch(self, patch: TariffPatch) -> Dict:
+        """Применение патча без перезагрузки базы
+
+        Обновляются индексы кодов, префиксов, текста, ставок и сертификации,
+        полные описания в затронутых товарных позициях и карточки измененных
+        кодов. PatchError — патч не к этой версии базы или не согласован с ней.
+
+        Сначала по патчу строится план изменений (новые записи и правки
+        индексов), база при этом не меняется: ошибка на этом шаге оставляет
+        ее прежней. Затем правки применяются к индексам на месте, за время,
+        пропорциональное размеру патча. Список записей копируется, только
+        если на него держится срез (snapshot): срезы остаются прежней версии.
+        """
+        with self._patch_lock:
+            return self._apply_patch(patch)
+    
+    def _apply_patch(self, patch: TariffPatch) -> Dict:
+        started = time.perf_counter()
+        current = self.patch_version or self.version
+        if patch.base_version and patch.base_version != current:
+            raise PatchError(f"Патч {patch.version} рассчитан на версию {patch.base_version}, текущая {current}")
+        
+        # Проверка до изменений: коды существуют (или нет) с учетом предыдущих операций патча
+        present: Dict[str, bool] = {}
+        added: Dict[int, Dict] = {}
+        for number, operation in enumerate(patch.operations):
+            exists = present.get(operation.code, operation.code in self._by_code)
+            if operation.op == 'add':
+                if exists:
+                    raise PatchError(f"Код {operation.code} уже есть в базе")
+                converted = self.convert_item({'code': operation.code, 'name': '-', **operation.item})
+                if converted is None:
+                    raise PatchError(f"Некорректная запись {operation.code}")
+                added[number] = converted
+            elif not exists:
+                raise PatchError(f"Кода {operation.code} нет в базе")
+            present[operation.code] = operation.op != 'delete'
+        
+        plan = self._plan_patch(patch, added)
+        effective = patch.effective_date or datetime.now().date()
+        self._apply_plan(plan, patch.version, effective)
+        
+        invalidated = card_cache.invalidate_many(plan.changed)
+        self.patch_version = patch.version
+        summary = {
+            'version': patch.version,
+            'base_version': current,
+            'source': patch.source,
+            'effective_date': effective.isoformat(),
+            'applied_at': datetime.now().isoformat(timespec='seconds'),
+            'operations': len(patch.operations),
+            'changed_codes': len(plan.changed),
+            'invalidated_cards': invalidated,
+            'seconds': round(time.perf_counter() - started, 6),
+        }
+        self.version_log.append(summary)
+        if self.sharded_search is not None:
+            self._update_shards(plan)
+        logger.info(f"Патч {patch.version} применен: операций {len(patch.operations)}, "
+                    f"изменено кодов {len(plan.changed)} за {summary['seconds'] * 1000:.1f}мс")
+        return summary
+    
+    def _plan_patch(self, patch: TariffPatch, added: Dict[int, Dict]) -> "_PatchPlan":
+        """План изменений патча поверх текущих индексов (база не меняется)"""
+        plan = _PatchPlan(len(self.data))
+        touched = {operation.code for operation in patch.operations}
+        plan.before = {code: self._history_fields(code) for code in touched}
+        
+        headings = set()
+        for number, operation in enumerate(patch.operations):
+            code = operation.code
+            plan.changed.add(code)
+            if operation.op == 'add':
+                item = added[number]
+                position = plan.base + len(plan.added)
+                plan.added.append(position)
+                plan.rows[position] = item
+                plan.positions[code] = [position]
+                plan.duties.append((code, (item['группа'], operation.item.get('duties', {}))))
+                plan.certification.append((code, item['сертификация']))
+                headings.add(code[:4])
+            elif operation.op == 'modify':
+                self._plan_modify(plan, code, operation.item)
+                if 'description' in operation.item:
+                    headings.add(code[:4])
+            else:
+                plan.deleted.update(self._plan_positions(plan, code))
+                plan.positions[code] = []
+                plan.duties.append((code, None))
+                plan.certification.append((code, None))
+                headings.add(code[:4])
+        
+        # Полные описания зависят от соседних записей той же товарной позиции
+        for heading in headings:
+            positions = sorted(
+                [(self.data[position]['код'], position)
+                 for position in self._positions_for(heading, prefix=True) if position not in plan.deleted]
+                + [(plan.rows[position]['код'], position) for position in plan.added
+                   if position not in plan.deleted and plan.rows[position]['код'].startswith(heading)]
+            )
+            items = [self._plan_row(plan, position) for _, position in positions]
+            for (code, position), item, text in zip(positions, items, build_full_descriptions(
+                    (item['код'], item['описание']) for item in items)):
+                if item.get('полное_описание') != text:
+                    self._plan_own_row(plan, position)['полное_описание'] = text
+                    plan.changed.add(code)
+        
+        for position, item in plan.rows.items():
+            plan.search_text[position] = '' if position in plan.deleted else self.search_line(item)
+        for position in plan.deleted:
+            plan.search_text[position] = ''
+        for code in plan.changed:
+            positions = self._plan_positions(plan, code)
+            plan.by_code[code] = self._plan_row(plan, positions[0]) if positions else None
+        for code in touched:
+            item = plan.by_code[code]
+            plan.after[code] = {field_name: item.get(field_name) if item else None for field_name in HISTORY_FIELDS}
+        return plan
+    
+    def _plan_modify(self, plan: "_PatchPlan", code: str, fields: Dict):
+        positions = self._plan_positions(plan, code)
+        for position in positions:
+            item = self._plan_own_row(plan, position)
+            for field_name, key in self._PATCH_FIELDS.items():
+                if field_name in fields:
+                    item[key] = str(fields[field_name]).strip()
+            if 'duties' in fields:
+                item['пошлина'] = self._format_duties(fields['duties'])
+            if 'certification' in fields:
+                item['сертификация'] = self._format_certification(fields['certification'])
+        canonical = self._plan_row(plan, positions[0])
+        if 'duties' in fields or 'group' in fields:
+            plan.duties.append((code, (canonical['группа'], fields.get('duties'))))
+        if 'certification' in fields:
+            plan.certification.append((code, canonical['сертификация']))
+    
+    def _plan_positions(self, plan: "_PatchPlan", code: str) -> List[int]:
+        """Позиции записей кода с учетом уже запланированных операций"""
+        positions = plan.positions.get(code)
+        return self._positions_for(code) if positions is None else positions
+    
+    def _plan_row(self, plan: "_PatchPlan", position: int) -> Dict:
+        item = plan.rows.get(position)
+        return self.data[position] if item is None else item
+    
+    def _plan_own_row(self, plan: "_PatchPlan", position: int) -> Dict:
+        """Копия записи в плане вместо изменения на месте (запись могла попасть в срез)"""
+        item = plan.rows.get(position)
+        if item is None:
+            item = plan.rows[position] = dict(self.data[position])
+        return item
+    
+    def _apply_plan(self, plan: "_PatchPlan", version: str, effective):
+        """Применение плана к индексам на месте (под _patch_lock)"""
+        if self._data_shared:
+            # На список держится срез: копия при записи, срез остается прежним
+            self.data = list(self.data)
+            self._deleted = set(self._deleted)
+            self._data_shared = False
+        data = self.data
+        search_text = self._search_text
+        for position in sorted(plan.rows):
+            if position >= plan.base:
+                data.append(plan.rows[position])
+                search_text.append(plan.search_text[position])
+            else:
+                data[position] = plan.rows[position]
+        for position, line in plan.search_text.items():
+            if position < plan.base:
+                search_text[position] = line
+        
+        order = self._code_order
+        for position in plan.deleted:
+            if position < plan.base:
+                del order[bisect.bisect_left(order, (data[position]['код'], position))]
+        for position in plan.added:
+            if position not in plan.deleted:
+                bisect.insort(order, (data[position]['код'], position))
+        self._deleted.update(plan.deleted)
+        
+        for code, item in plan.by_code.items():
+            if item is None:
+                self._by_code.pop(code, None)
+            else:
+                self._by_code[code] = item
+            self._code_versions[code] = version
+        for code, duty in plan.duties:
+            if duty is None:
+                self.duty_table.remove(code)
+            else:
+                self.duty_table.upsert(code, *duty)
+        for code, text in plan.certification:
+            self.certification.update_product(code, text)
+        for code, after in plan.after.items():
+            for field_name in HISTORY_FIELDS:
+                if plan.before[code][field_name] != after[field_name]:
+                    self.history.record(code, field_name, effective, plan.before[code][field_name], after[field_name])
+    
+    def snapshot(self) -> "DatabaseSnapshot":
+        """Срез текущей версии для длинных чтений (экспорт), O(1)"""
+        with self._patch_lock:
+            self._data_shared = True
+            return DatabaseSnapshot(self.snapshot_version(), self.data, self._deleted)
+    
+    def iter_export(self, group: Optional[str] = None,
+                    prefix: Optional[str] = None) -> Tuple[Optional[str], Iterator[Dict]]:
+        """(версия, записи одной версии базы) с фильтром по группе и префиксу кода
+
+        Записи читаются из среза лениво: патч или перезагрузка во время
+        чтения в выгрузку не попадают.
+        """
+        snapshot = self.snapshot()
+        return snapshot.version, snapshot.iter_products(group, prefix)
+    
+    def _history_fields(self, code: str) -> Dict[str, Optional[str]]:
+        """Поля истории текущей записи кода (None — кода нет)"""
+        item = self._by_code.get(code)
+        return {field_name: item.get(field_name) if item else None for field_name in HISTORY_FIELDS}
+    
+    def product_on(self, code: str, when: DateLike) -> Optional[Dict]:
+        """Запись кода в редакции, действовавшей на дату (None — код не действовал)
+
+        Для кодов без истории изменений это текущая запись.
+        """
+        code = str(code).strip()
+        current = self.find_by_code(code)
+        if not self.history.has_history(code):
+            return current
+        
+        when = parse_date(when)
+        fields = {field_name: self.history.value_on(code, field_name, when,
+                                                    current.get(field_name) if current else None)
+                  for field_name in HISTORY_FIELDS}
+        if all(value is None for value in fields.values()):
+            return None
+        item = dict(current) if current else {'код': code, 'название': '-', 'группа': code[:2]}
+        item.update(fields)
+        if item['описание'] != (current or {}).get('описание'):
+            item['полное_описание'] = item['описание']
+        return item
+    
+    def codes_changed_between(self, start: DateLike, end: DateLike, field_name: str = 'пошлина') -> List[str]:
+        """Коды, у которых поле (по умолчанию ставка) менялось с датой вступления в (start, end]"""
+        return self.history.changed_between(start, end, field_name)
+    
+    @classmethod
+    def _build_indexes(cls, data: List[Dict]) -> Tuple[Dict[str, Dict], List[str], List[Tuple[str, int]]]:
+        """Индекс код -> товар, строки для текстового поиска и порядок кодов для префиксов
+
+        При дублях кода в индекс попадает первая запись, как при линейном поиске.
+        """
+        index = {}
+        search_text = []
+        for item in data:
+            index.setdefault(str(item.get('код', '')).strip(), item)
+            search_text.append(cls.search_line(item))
+        code_order = sorted((item['код'], position) for position, item in enumerate(data))
+        return index, search_text, code_order
+    
+    def enable_sharded_search(self, shards: Optional[int] = None) -> ShardedSearch:
+        """Поиск по названию через процессы-шарды по главам (см. sharded_search.py)"""
+        if self.sharded_search is None:
+            self.sharded_search = ShardedSearch(shards)
+        self._build_shards()
+        return self.sharded_search
+    
+    def _build_shards(self):
+        try:
+            self.sharded_search.build(
+                ((position, item.get('группа') or item['код'][:2], self._search_text[position])
+                 for position, item in self.iter_all_products()),
+                self._cursor_version()
+            )
+        except Exception as e:
+            logger.error(f"Ошибка построения шардов поиска: {e}")
+    
+    def _update_shards(self, plan: "_PatchPlan"):
+        """Перестройка только шардов глав, записи которых изменил патч"""
+        try:
+            self.sharded_search.update(
+                ((position, self.data[position].get('группа') or self.data[position]['код'][:2], text)
+                 for position, text in sorted(plan.search_text.items())),
+                self._cursor_version()
+            )
+        except Exception as e:
+            logger.error(f"Ошибка обновления шардов поиска: {e}")
     
     def find_by_code(self, code: str) -> Optional[Dict]:
         """Поиск товара по коду ТН ВЭД (точное совпадение)"""
@@ -116,15 +592,12 @@ class VEDDatabase:
         # Очистка кода от пробелов и приведение к строке
         search_code = str(code).strip()
         
-        try:
-            for item in self.data:
-                if isinstance(item, dict) and str(item.get('код', '')).strip() == search_code:
-                    logger.info(f"Найден товар по коду: {search_code}")
-                    return item
-        except Exception as e:
-            logger.error(f"Ошибка поиска по коду {code}: {e}")
+        item = self._by_code.get(search_code)
+        if item is not None:
+            logger.debug("Найден товар по коду: %s", search_code)
+            return item
         
-        logger.warning(f"Товар с кодом {search_code} не найден")
+        logger.debug("Товар с кодом %s не найден", search_code)
         return None
     
     def search_by_name(self, name: str, limit: int = 10) -> List[Dict]:
@@ -132,33 +605,197 @@ class VEDDatabase:
         if not name or len(name.strip()) < 2:
             return []
         
+        results = [item for _, item in islice(self.iter_search(name), limit)]
+        logger.debug("Найдено %d товаров по запросу: %s", len(results), name)
+        return results
+    
+    # Как часто последовательный просмотр проверяет stop
+    _STOP_CHECK_EVERY = 1024
+    
+    def iter_search(self, name: str, start: int = 0,
+                    stop: Optional[Callable[[], bool]] = None) -> Iterator[Tuple[int, Dict]]:
+        """Ленивый поиск по названию и описанию: пары (позиция в базе, товар)
+
+        Сканирование начинается с позиции start, поэтому продолжение выдачи
+        не пересматривает уже показанные записи. stop — проверка бюджета
+        времени: когда она истинна, просмотр прерывается последней парой
+        (позиция продолжения, None).
+        """
+        if not name or len(name.strip()) < 2:
+            return
+        
         search_name = name.strip().lower()
-        results = []
+        data = self.data
+        sharded = self.sharded_search
+        if sharded is not None and sharded.version == self._cursor_version():
+            # Пачками растущего размера: первая страница не ждет полного просмотра
+            batch = 64
+            while True:
+                positions = sharded.search(search_name, batch, start)
+                if positions is None:
+                    break  # шарды недоступны — последовательный просмотр с той же позиции
+                for position in positions:
+                    yield position, data[position]
+                if len(positions) < batch:
+                    return
+                start = positions[-1] + 1
+                batch *= 4
+                if stop is not None and stop():
+                    yield start, None
+                    return
         
+        search_text = self._search_text
+        end = min(len(search_text), len(data))  # патч мог опубликоваться между чтениями
+        check = self._STOP_CHECK_EVERY if stop is not None else end + 1
+        for position in range(start, end):
+            if search_name in search_text[position]:
+                yield position, data[position]
+            if position % check == check - 1 and stop() and position + 1 < end:
+                yield position + 1, None
+                return
+    
+    def iter_products_by_group(self, group: str, start: int = 0) -> Iterator[Tuple[int, Dict]]:
+        """Ленивый перебор товаров группы: пары (позиция в базе, товар)"""
+        if not group:
+            return
+        
+        search_group = group.strip().lower()
+        data = self.data
+        deleted = self._deleted
+        for position in range(start, len(data)):
+            item = data[position]
+            if search_group in str(item.get('группа', '')).lower() and position not in deleted:
+                yield position, item
+    
+    def iter_products_by_prefix(self, prefix: str, start: int = 0) -> Iterator[Tuple[int, Dict]]:
+        """Товары, код которых начинается с prefix, в порядке кодов
+
+        Позиция — номер записи в отсортированном порядке кодов; начало
+        диапазона находится двоичным поиском.
+        """
+        prefix = (prefix or '').strip()
+        code_order = self._code_order
+        position = max(start, bisect.bisect_left(code_order, (prefix, -1)))
+        while position < len(code_order):
+            code, data_position = code_order[position]
+            if not code.startswith(prefix):
+                break
+            yield position, self.data[data_position]
+            position += 1
+    
+    def get_products_by_prefix(self, prefix: str, limit: Optional[int] = None) -> List[Dict]:
+        """Товары по префиксу кода (например, "8471" или "85")"""
+        return [item for _, item in islice(self.iter_products_by_prefix(prefix), limit)]
+    
+    def iter_all_products(self, start: int = 0) -> Iterator[Tuple[int, Dict]]:
+        """Ленивый перебор всех товаров: пары (позиция в базе, товар)"""
+        data = self.data
+        deleted = self._deleted
+        for position in range(start, len(data)):
+            if position not in deleted:
+                yield position, data[position]
+    
+    # Постраничная выдача с курсорами
+    _PAGE_SOURCES = {'s': 'iter_search', 'g': 'iter_products_by_group',
+                     'p': 'iter_products_by_prefix', 'a': 'iter_all_products'}
+    _MAX_CURSOR_QUERIES = 10000
+    
+    def _encode_cursor(self, kind: str, query: str, position: int, shown: int) -> str:
+        """Непрозрачный курсор: вид выдачи, версия базы, позиция, число показанных, id запроса
+
+        Курсор короткий (укладывается в 64 байта callback_data Telegram),
+        сам запрос хранится на сервере под коротким id.
+        """
+        query_id = hashlib.sha1(query.encode('utf-8')).hexdigest()[:10]
+        self._cursor_queries[query_id] = query
+        self._cursor_queries.move_to_end(query_id)
+        if len(self._cursor_queries) > self._MAX_CURSOR_QUERIES:
+            self._cursor_queries.popitem(last=False)
+        
+        raw = f"{kind}|{self._cursor_version()}|{position}|{shown}|{query_id}"
+        return base64.urlsafe_b64encode(raw.encode('ascii')).decode('ascii').rstrip('=')
+    
+    def _cursor_version(self) -> str:
+        """Версия для курсоров: патч сдвигает позиции, поэтому курсоры до патча недействительны"""
+        return f"{(self.version or '')[:8]}.{len(self.version_log)}"
+    
+    def _decode_cursor(self, cursor: str) -> Tuple[str, str, int, int]:
+        """Разбор курсора; ValueError, если курсор поврежден или устарел"""
         try:
-            for item in self.data:
-                if isinstance(item, dict):
-                    item_name = str(item.get('название', '')).lower()
-                    item_desc = str(item.get('описание', '')).lower()
-                    
-                    # Поиск в названии или описании
-                    if search_name in item_name or search_name in item_desc:
-                        results.append(item)
-                        if len(results) >= limit:
-                            break
-        except Exception as e:
-            logger.error(f"Ошибка поиска по названию {name}: {e}")
+            padded = cursor + '=' * (-len(cursor) % 4)
+            kind, version, position, shown, query_id = \
+                base64.urlsafe_b64decode(padded).decode('ascii').split('|')
+            position, shown = int(position), int(shown)
+        except Exception:
+            raise ValueError("Некорректный курсор")
         
-        logger.info(f"Найдено {len(results)} товаров по запросу: {name}")
-        return results
+        if kind not in self._PAGE_SOURCES:
+            raise ValueError("Некорректный курсор")
+        if version != self._cursor_version():
+            raise ValueError("База данных обновилась, повторите поиск")
+        query = self._cursor_queries.get(query_id)
+        if query is None:
+            raise ValueError("Курсор устарел, повторите поиск")
+        return kind, query, position, shown
+    
+    def validate_cursor(self, cursor: str):
+        """ValueError, если курсор поврежден или устарел (проверка без чтения страницы)"""
+        self._decode_cursor(cursor)
+    
+    def export_cursor_queries(self) -> List[Tuple[str, str]]:
+        """Запросы выданных курсоров (для warm_state: кнопки "Далее" переживают перезапуск)"""
+        return list(self._cursor_queries.items())
+    
+    def load_cursor_queries(self, entries: List[Tuple[str, str]]):
+        for query_id, query in entries:
+            self._cursor_queries.setdefault(query_id, query)
+        while len(self._cursor_queries) > self._MAX_CURSOR_QUERIES:
+            self._cursor_queries.popitem(last=False)
+    
+    def get_page(self, kind: str = 's', query: str = '', cursor: Optional[str] = None,
+                 page_size: int = 10, deadline: Deadline = NO_DEADLINE) -> SearchPage:
+        """Страница выдачи
+
+        kind: 's' — поиск по названию, 'g' — товары группы, 'p' — по префиксу кода,
+        'a' — все товары.
+        С курсором kind и query берутся из курсора, сканирование продолжается
+        с сохраненной позиции. Если бюджет deadline истек до конца просмотра,
+        страница короче, а курсор продолжает просмотр с места остановки.
+        """
+        start, shown = 0, 0
+        if cursor:
+            kind, query, start, shown = self._decode_cursor(cursor)
+        
+        source = getattr(self, self._PAGE_SOURCES[kind])
+        if kind == 'a':
+            iterator = source(start=start)
+        elif kind == 's' and deadline.limited:
+            iterator = source(query, start=start, stop=deadline.expired)
+        else:
+            iterator = source(query, start=start)
+        # Берем на одну запись больше, чтобы знать, есть ли следующая страница
+        page = list(islice(iterator, page_size + 1))
+        resume = page.pop()[0] if page and page[-1][1] is None else None
+        
+        next_cursor = None
+        if len(page) > page_size:
+            next_cursor = self._encode_cursor(kind, query, page[page_size][0], shown + page_size)
+            page = page[:page_size]
+        elif resume is not None:
+            next_cursor = self._encode_cursor(kind, query, resume, shown + len(page))
+            deadline.degrade('search', 'просмотр прерван')
+        
+        return SearchPage([item for _, item in page], query, shown, next_cursor)
     
     def get_all_products(self) -> List[Dict]:
         """Получить все товары"""
+        if self._deleted:
+            return [item for _, item in self.iter_all_products()]
         return self.data
     
     def get_product_count(self) -> int:
         """Получить количество товаров в базе"""
-        return len(self.data)
+        return len(self.data) - len(self._deleted)
     
     # Методы совместимости со старым API
     def get_product_by_code(self, code: str) -> Optional[Dict]:
@@ -176,49 +813,40 @@ class VEDDatabase:
     def get_random_products(self, count: int = 5) -> List[Dict]:
         """Получить случайные товары"""
         import random
-        valid_products = [item for item in self.data if isinstance(item, dict)]
+        valid_products = [item for _, item in self.iter_all_products() if isinstance(item, dict)]
         if len(valid_products) <= count:
             return valid_products
         return random.sample(valid_products, count)
     
     def get_products_by_group(self, group: str) -> List[Dict]:
         """Получить товары по группе"""
-        if not group:
-            return []
-        
-        results = []
-        search_group = group.strip().lower()
-        
-        try:
-            for item in self.data:
-                if isinstance(item, dict):
-                    item_group = str(item.get('группа', '')).lower()
-                    if search_group in item_group:
-                        results.append(item)
-        except Exception as e:
-            logger.error(f"Ошибка поиска по группе {group}: {e}")
-        
-        return results
+        return [item for _, item in self.iter_products_by_group(group)]
     
     def format_product_info(self, product: Dict) -> str:
         """Форматирование информации о товаре для отображения"""
         if not product or not isinstance(product, dict):
             return "Товар не найден"
         
+        code = str(product.get('код', ''))
+        # Кэшируем только каноническую запись кода: у дублей кода карточки разные
+        if not self._is_canonical(code, product):
+            return self._render_product_info(product)
+        # Версия карточки учитывает и версию требований сертификации
+        return card_cache.get_or_render(
+            'ved_database', (self.code_version(code), self.certification.version), code,
+            lambda: self._render_product_info(product)
+        )
+    
+    def _is_canonical(self, code: str, product: Dict) -> bool:
+        """Это та запись, которую возвращает find_by_code(code)"""
+        return self._by_code.get(code) is product
+    
+    def _render_product_info(self, product: Dict) -> str:
+        """Отрисовка карточки товара (результат кэшируется)"""
         try:
-            code = product.get('код', 'Не указан')
-            name = product.get('название', 'Не указано')
-            description = product.get('описание', 'Не указано')
-            group = product.get('группа', 'Не указана')
-            duty = product.get('пошлина', 'Не указана')
-            cert = product.get('сертификация', 'Не указана')
-            
-            return f"""📦 **Код ТН ВЭД:** {code}
-📝 **Название:** {name}
-📋 **Описание:** {description}
-📂 **Группа:** {group}
-💰 **Пошлина:** {duty}
-✅ **Сертификация:** {cert}"""
+            requirements = self.certification.requirements_for(str(product.get('код', '')))
+            cert = "; ".join(f"{req.id} ({req.title})" for req in requirements) if requirements else None
+            return render_database_card(normalize_product(product), cert)
         except Exception as e:
             logger.error(f"Ошибка форматирования товара: {e}")
             return "Ошибка форматирования данных"
@@ -238,12 +866,61 @@ class VEDDatabase:
                 name = product.get('название', 'Не указано')[:60]
                 if len(product.get('название', '')) > 60:
                     name += "..."
-                formatted += f"{i}. **{code}** - {name}\n"
+                formatted += f"{i}. **{code}** - {escape_markdown(name)}\n"
         
         if len(results) > 10:
             formatted += f"\n... и еще {len(results) - 10} товаров"
         
         return formatted
+    
+    def format_search_page(self, items: List[Dict], query: str = "", shown: int = 0,
+                           has_more: bool = False) -> str:
+        """Форматирование одной страницы выдачи (нумерация продолжается с shown + 1)"""
+        if not items:
+            return f"❌ Товары по запросу '{query}' не найдены в базе данных"
+        
+        if shown == 0:
+            formatted = f"🔍 Результаты по запросу '{query}':\n\n"
+        else:
+            formatted = f"🔍 Результаты по запросу '{query}' (продолжение):\n\n"
+        
+        lines = []
+        for i, product in enumerate(items, shown + 1):
+            code = product.get('код', 'Не указан')
+            text = product.get('название', '')
+            if not text or text == '-':
+                # Из полного описания показываем конец: собственный уровень кода
+                text = product.get('полное_описание') or product.get('описание', 'Не указано')
+                if len(text) > 60:
+                    text = "..." + text[-60:]
+            elif len(text) > 60:
+                text = text[:60] + "..."
+            lines.append(f"{i}. **{code}** - {escape_markdown(text)}")
+        formatted += "\n".join(lines)
+        
+        if has_more:
+            formatted += "\n\n➡️ Есть еще результаты"
+        
+        return formatted
+
+def find_products_array(data, path=""):
+    """Рекурсивный поиск массива товаров в загруженном JSON"""
+    if isinstance(data, list):
+        # Проверяем не пустой ли список и есть ли товары
+        if data and isinstance(data[0], dict):
+            # Проверяем есть ли поля товара
+            first_item = data[0]
+            if any(key in first_item for key in ['code', 'код', 'name', 'название', 'id']):
+                logger.info(f"Найден массив товаров по пути: {path}")
+                return data
+        return None
+    elif isinstance(data, dict):
+        for key, value in data.items():
+            result = find_products_array(value, f"{path}.{key}" if path else key)
+            if result:
+                return result
+        return None
+    return None
 
 # Глобальный экземпляр для использования в других модулях
 ved_db = VEDDatabase()
@@ -2,8 +2,18 @@ import json
 import os
 import re
 import logging
+import threading
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from product_cards import card_cache
+from sketches import PopularityTracker
+from duty_table import ad_valorem_rate
+from ai_pipeline import AsyncAnalysisClient, build_analysis_prompt, template_hash
+from analysis_cache import AnalysisCache, warm_up
+from deadline import MIN_AI_SECONDS, NO_DEADLINE, Deadline
+from query_log import QueryLog, normalize_query
+from rendering import chunk_messages, normalize_product, render_router_card
 
 # Настройка логирования
 logger = logging.getLogger('VED_ROUTER')
@@ -14,107 +24,77 @@ request_stats = {
     'code_searches': 0,
     'name_searches': 0,
     'ai_requests': 0,
-    'popular_codes': {}
+    # Счетчики фиксированного размера (Space-Saving) с окнами час/сутки/все время
+    'popular_codes': PopularityTracker(),
+    'popular_queries': PopularityTracker()
 }
 
-def format_product_info(product: Dict) -> str:
-    """Красивое форматирование информации о товаре"""
+# Прогрев (warm_up_queries) проходит обычный путь запроса, но не попадает в статистику и журнал
+_replay = threading.local()
+
+def _count(key: str):
+    """Увеличение счетчика статистики (кроме запросов прогрева)"""
+    if not getattr(_replay, 'active', False):
+        request_stats[key] += 1
+
+def _track(key: str, value: str):
+    """Учет значения в счетчике популярности (кроме запросов прогрева)"""
+    if not getattr(_replay, 'active', False):
+        request_stats[key].add(value)
+
+def format_product_info(product: Dict, version: Optional[str] = None) -> str:
+    """Красивое форматирование информации о товаре
+
+    Статическая часть карточки кэшируется по (version, код); счетчик
+    запросов подставляется при каждом вызове. Без version кэш не используется.
+    """
     try:
-        code = product.get('code', 'Неизвестно')
-        name = product.get('name', 'Название не найдено')
-        description = product.get('description', '')
-        group = product.get('group', '')
-        duties = product.get('duties', {})
-        certification = product.get('certification', [])
-        restrictions = product.get('restrictions', [])
-        
-        # Основная информация
-        result = f"🏷️ *{name}*\n"
-        result += f"📋 Код ТН ВЭД: `{code}`\n"
-        if description:
-            result += f"📝 {description}\n"
-        result += f"🔍 Группа: {group}\n\n"
-        
-        # Пошлины с эмодзи для быстрого понимания
-        result += f"💰 *Пошлины:*\n"
-        base_rate = duties.get('base', 0)
-        result += f"• Базовая ставка: {base_rate}% {get_rate_emoji(base_rate)}\n"
-        
-        china_rate = duties.get('china', 0)
-        result += f"• Китай: {china_rate}% {get_rate_emoji(china_rate)}\n"
-        
-        eu_rate = duties.get('eu', 0)
-        result += f"• ЕС: {eu_rate}% {get_rate_emoji(eu_rate)}\n"
-        
-        usa_rate = duties.get('usa', 0)
-        result += f"• США: {usa_rate}% {get_rate_emoji(usa_rate)}\n"
-        
-        result += f"• Беларусь: {duties.get('belarus', 0)}% 🆓\n"
-        result += f"• Казахстан: {duties.get('kazakhstan', 0)}% 🆓\n\n"
-        
-        # Сертификация
-        if certification:
-            result += f"📜 *Сертификация:*\n"
-            for cert in certification:
-                result += f"• {cert} {get_cert_emoji(cert)}\n"
-            result += "\n"
-        
-        # Ограничения
-        if restrictions:
-            result += f"⚠️ *Ограничения:*\n"
-            for restriction in restrictions:
-                result += f"• {restriction}\n"
-            result += "\n"
-        else:
-            result += f"✅ *Ограничения:* отсутствуют\n\n"
-        
-        # Дополнительная информация
-        result += f"🤖 Хотите AI-анализ? Напишите: `анализ {code}`\n"
-        result += f"📊 Статистика: код запрашивался {request_stats['popular_codes'].get(code, 0)} раз"
-        
-        return result
+        code = str(product.get('code') or product.get('код') or '')
+        card = card_cache.get_or_render(
+            'ved_router', version, code, lambda: _render_product_card(product)
+        )
+        return card + f"📊 Статистика: код запрашивался {request_stats['popular_codes'].estimate(code or 'Неизвестно')} раз"
         
     except Exception as e:
         logger.error(f"Ошибка форматирования: {e}")
         return f"❌ Ошибка обработки информации о товаре"
 
-def get_rate_emoji(rate: float) -> str:
-    """Возвращает эмодзи в зависимости от ставки пошлины"""
-    if rate == 0:
-        return "🆓"
-    elif rate <= 5:
-        return "💚"
-    elif rate <= 15:
-        return "💛"
-    elif rate <= 25:
-        return "🧡"
-    else:
-        return "🔴"
-
-def get_cert_emoji(cert: str) -> str:
-    """Возвращает эмодзи для типа сертификации"""
-    cert_lower = cert.lower()
-    if "тр тс" in cert_lower:
-        return "🛡️"
-    elif "сэс" in cert_lower:
-        return "🩺"
-    elif "ветеринарное" in cert_lower:
-        return "🐾"
-    elif "фитосанитарное" in cert_lower:
-        return "🌱"
-    else:
-        return "📋"
+def data_version(ved_db, code: str) -> Optional[str]:
+    """Версия данных кода для ключей кэшей (с учетом патчей базы, если они поддерживаются)"""
+    if hasattr(ved_db, 'code_version'):
+        return ved_db.code_version(code)
+    return getattr(ved_db, 'version', None)
 
-def improved_search(query: str, ved_db) -> Optional[str]:
+def _render_product_card(product: Dict) -> str:
+    """Статическая часть карточки товара (без счетчика запросов)"""
+    return render_router_card(normalize_product(product))
+
+def improved_search(query: str, ved_db, deadline: Deadline = NO_DEADLINE) -> Optional[str]:
     """Улучшенный поиск с нечеткими совпадениями"""
+    messages = _improved_search(query, ved_db, deadline)[0]
+    return "\n\n".join(messages) if messages else None
+
+def _improved_search(query: str, ved_db,
+                     deadline: Deadline = NO_DEADLINE) -> Tuple[Optional[List[str]], Optional[str]]:
+    """Улучшенный поиск: (сообщения ответа, курсор следующей страницы выдачи по названию)"""
     try:
         query_lower = query.lower().strip()
         
+        # Код в редакции на дату: "8471300000 на 01.03.2026"
+        dated_match = re.search(r'\b(\d{10})\s+(?:на|on)\s+(' + DATE_PATTERN + r')', query_lower)
+        if dated_match:
+            return [handle_code_on_date(dated_match.group(1), dated_match.group(2), ved_db)], None
+        
+        # Изменения ставок за период: "изменения 01.01.2026 01.03.2026"
+        changes_match = re.search(r'изменени\w*\s+(' + DATE_PATTERN + r')\s+(?:-\s*)?(' + DATE_PATTERN + r')', query_lower)
+        if changes_match:
+            return [handle_rate_changes(changes_match.group(1), changes_match.group(2), ved_db)], None
+        
         # Поиск по коду ТН ВЭД
         tnved_pattern = r'\b\d{10}\b'
         tnved_match = re.search(tnved_pattern, query)
         if tnved_match:
-            return handle_code_search(tnved_match.group(), ved_db)
+            return [handle_code_search(tnved_match.group(), ved_db, deadline)], None
         
         # Расширенный словарь ключевых слов
         keywords = {
@@ -150,29 +130,68 @@ def improved_search(query: str, ved_db) -> Optional[str]:
         # Поиск по ключевым словам
         for keyword, codes in keywords.items():
             if keyword in query_lower:
-                return handle_multiple_codes(codes, ved_db, keyword)
+                return handle_multiple_codes(codes, ved_db, keyword, deadline), None
         
-        # Поиск по частичному совпадению в названии
-        search_result = ved_db.search_product(query)
-        if search_result and search_result.get('product'):
-            return format_product_info(search_result['product'])
+        # Поиск по частичному совпадению в названии (первая страница выдачи)
+        if hasattr(ved_db, 'get_page'):
+            text, next_cursor = handle_name_search(query, ved_db, deadline=deadline)
+            return ([text] if text else None), next_cursor
         
-        return None
+        return None, None
         
     except Exception as e:
         logger.error(f"Ошибка поиска: {e}")
-        return None
+        return None, None
+
+def handle_name_search(query: str, ved_db, cursor: Optional[str] = None, page_size: int = 10,
+                       deadline: Deadline = NO_DEADLINE) -> Tuple[Optional[str], Optional[str]]:
+    """Страница выдачи по названию: (ответ, курсор следующей страницы)
+
+    Без курсора — первая страница запроса; с курсором — продолжение
+    с сохраненной позиции без повторного поиска. При малом остатке
+    бюджета страница вдвое короче.
+    """
+    if deadline.low():
+        page_size = max(1, page_size // 2)
+        deadline.degrade('search', 'короткая страница')
+    try:
+        with deadline.stage('search'):
+            page = ved_db.get_page('s', query, cursor=cursor, page_size=page_size, deadline=deadline)
+    except ValueError as e:
+        return f"⚠️ {e}", None
+    
+    if not page.items:
+        if page.next_cursor:
+            return "⏱️ Поиск не успел найти совпадения. Нажмите «Далее», чтобы продолжить.", page.next_cursor
+        return None, None
+    
+    if cursor is None:
+        _count('name_searches')
+    with deadline.stage('format'):
+        text = ved_db.format_search_page(page.items, page.query, page.shown, page.next_cursor is not None)
+    return text, page.next_cursor
+
+def handle_search_page(cursor: str, ved_db, deadline: Deadline = NO_DEADLINE) -> Tuple[str, Optional[str]]:
+    """Следующая страница выдачи по курсору из inline-кнопки"""
+    try:
+        text, next_cursor = handle_name_search('', ved_db, cursor=cursor, deadline=deadline)
+        return text or "❌ Больше результатов нет", next_cursor
+    except Exception as e:
+        logger.error(f"Ошибка перехода по страницам: {e}")
+        return "❌ Ошибка при загрузке следующей страницы", None
 
-def handle_code_search(code: str, ved_db) -> str:
+def handle_code_search(code: str, ved_db, deadline: Deadline = NO_DEADLINE) -> str:
     """Обработка поиска по коду"""
     try:
         # Обновляем статистику
-        request_stats['code_searches'] += 1
-        request_stats['popular_codes'][code] = request_stats['popular_codes'].get(code, 0) + 1
+        _count('code_searches')
+        _track('popular_codes', code)
         
-        product = ved_db.get_product_by_code(code)
+        with deadline.stage('search'):
+            product = ved_db.get_product_by_code(code)
         if product:
-            return format_product_info(product)
+            with deadline.stage('format'):
+                return format_product_info(product, data_version(ved_db, code))
         else:
             return f"❌ Код ТН ВЭД `{code}` не найден в базе данных.\n\n💡 *Возможные причины:*\n• Код введен неверно\n• Товар не включен в текущую базу\n• Используйте поиск по названию товара"
             
@@ -180,29 +199,89 @@ def handle_code_search(code: str, ved_db) -> str:
         logger.error(f"Ошибка поиска по коду {code}: {e}")
         return f"❌ Ошибка при поиске кода {code}"
 
-def handle_multiple_codes(codes: List[str], ved_db, keyword: str) -> str:
-    """Обработка множественных результатов поиска"""
+DATE_PATTERN = r'\d{1,2}\.\d{1,2}\.\d{4}|\d{4}-\d{2}-\d{2}'
+
+def handle_code_on_date(code: str, when: str, ved_db) -> str:
+    """Карточка кода в редакции, действовавшей на дату (история патчей базы)"""
     try:
-        results = []
-        found_count = 0
-        
-        for code in codes:
-            product = ved_db.get_product_by_code(code)
-            if product:
-                results.append(format_product_info(product))
-                found_count += 1
-        
-        if results:
-            header = f"🔍 Найдено {found_count} товар(ов) по запросу \"{keyword}\":\n\n"
-            return header + "\n\n" + "─" * 50 + "\n\n".join(results)
-        else:
-            return f"❌ Товары по запросу \"{keyword}\" не найдены в базе данных"
+        if not hasattr(ved_db, 'product_on'):
+            return handle_code_search(code, ved_db)
+        
+        _count('code_searches')
+        _track('popular_codes', code)
+        product = ved_db.product_on(code, when)
+        if not product:
+            return f"❌ Код ТН ВЭД `{code}` не действовал на {when}"
+        # Историческая редакция не кэшируется: ключ карточки — текущая версия кода
+        return f"📅 *Редакция на {when}*\n\n" + format_product_info(product)
+        
+    except ValueError as e:
+        return f"⚠️ {e}"
+    except Exception as e:
+        logger.error(f"Ошибка поиска кода {code} на дату {when}: {e}")
+        return f"❌ Ошибка при поиске кода {code}"
+
+def handle_rate_changes(start: str, end: str, ved_db, limit: int = 50) -> str:
+    """Коды, ставки которых менялись с датой вступления в (start, end]"""
+    try:
+        if not hasattr(ved_db, 'codes_changed_between'):
+            return "ℹ️ История ставок недоступна для этого хранилища"
+        
+        codes = ved_db.codes_changed_between(start, end)
+        if not codes:
+            return f"ℹ️ Ставки не менялись с {start} по {end}"
+        
+        lines = [f"📅 *Изменения ставок с {start} по {end}:* {len(codes)}", ""]
+        for code in codes[:limit]:
+            old = ved_db.product_on(code, start)
+            new = ved_db.product_on(code, end)
+            lines.append(f"• `{code}`: {(old or {}).get('пошлина', '—')} → {(new or {}).get('пошлина', '—')}")
+        if len(codes) > limit:
+            lines.append(f"... и еще {len(codes) - limit}")
+        return "\n".join(lines)
+        
+    except ValueError as e:
+        return f"⚠️ {e}"
+    except Exception as e:
+        logger.error(f"Ошибка поиска изменений ставок: {e}")
+        return "❌ Ошибка при поиске изменений ставок"
+
+def handle_multiple_codes(codes: List[str], ved_db, keyword: str,
+                          deadline: Deadline = NO_DEADLINE) -> List[str]:
+    """Обработка множественных результатов поиска
+
+    Карточки раскладываются по сообщениям Telegram (не длиннее 4096
+    символов, разрез по границам карточек). Если бюджет истек,
+    отрисовываются только успевшие карточки (хотя бы одна).
+    """
+    try:
+        with deadline.stage('search'):
+            found = []
+            for code in codes:
+                product = ved_db.get_product_by_code(code)
+                if product:
+                    found.append((code, product))
+        
+        if not found:
+            return [f"❌ Товары по запросу \"{keyword}\" не найдены в базе данных"]
+        
+        header = f"🔍 Найдено {len(found)} товар(ов) по запросу \"{keyword}\":\n\n"
+        footer = ""
+        with deadline.stage('format'):
+            cards = []
+            for code, product in found:
+                if cards and deadline.expired():
+                    footer = f"\n\n⏱️ Показано {len(cards)} из {len(found)}: уточните запрос"
+                    deadline.degrade('format', 'не все карточки')
+                    break
+                cards.append(format_product_info(product, data_version(ved_db, code)))
+            return list(chunk_messages(cards, header=header, footer=footer))
             
     except Exception as e:
         logger.error(f"Ошибка обработки множественных кодов: {e}")
-        return f"❌ Ошибка при поиске товаров для \"{keyword}\""
+        return [f"❌ Ошибка при поиске товаров для \"{keyword}\""]
 
-def handle_ai_analysis(text: str, ved_db) -> Optional[str]:
+def handle_ai_analysis(text: str, ved_db, deadline: Deadline = NO_DEADLINE) -> Optional[str]:
     """Обработка запроса на AI-анализ"""
     try:
         text_lower = text.lower()
@@ -221,15 +300,15 @@ def handle_ai_analysis(text: str, ved_db) -> Optional[str]:
                 code = match.group(1)
                 
                 # Обновляем статистику
-                request_stats['ai_requests'] += 1
+                _count('ai_requests')
                 
                 # Получаем информацию о товаре
                 product = ved_db.get_product_by_code(code)
                 if not product:
                     return f"❌ Код ТН ВЭД `{code}` не найден для AI-анализа"
                 
-                # Формируем AI-анализ (пока заглушка)
-                analysis = generate_ai_analysis(product)
+                with deadline.stage('analysis'):
+                    analysis = run_ai_analysis(product, data_version(ved_db, code), deadline)
                 return f"🧠 *AI-анализ для {code}:*\n\n{analysis}"
         
         return None
@@ -238,20 +317,112 @@ def handle_ai_analysis(text: str, ved_db) -> Optional[str]:
         logger.error(f"Ошибка AI-анализа: {e}")
         return None
 
+# Клиент внешней модели; None — только локальный анализ
+ai_client: Optional[AsyncAnalysisClient] = None
+# Постоянный кэш анализов; None — без кэша
+analysis_cache: Optional[AnalysisCache] = None
+
+# Версия локального анализа: увеличить при изменении generate_ai_analysis
+LOCAL_ANALYSIS_TEMPLATE = "local-1"
+
+def configure_ai_client(client: Optional[AsyncAnalysisClient]):
+    """Подключение клиента AI-анализа (см. ai_pipeline.create_client_from_env)"""
+    global ai_client
+    ai_client = client
+
+def configure_analysis_cache(cache: Optional[AnalysisCache]):
+    """Подключение постоянного кэша анализов"""
+    global analysis_cache
+    analysis_cache = cache
+
+def run_ai_analysis(product: Dict, version: Optional[str] = None, deadline: Deadline = NO_DEADLINE) -> str:
+    """AI-анализ товара: кэш, затем внешняя модель с таймаутом или локальный анализ
+
+    Модели дается не больше остатка бюджета deadline; если остаток меньше
+    MIN_AI_SECONDS, сразу используется локальный анализ.
+    """
+    code = product.get('code') or product.get('код', '')
+    template = template_hash() if ai_client is not None else LOCAL_ANALYSIS_TEMPLATE
+    use_cache = analysis_cache is not None and bool(version) and bool(code)
+    if use_cache:
+        cached = analysis_cache.get(code, version, template)
+        if cached is not None:
+            return cached
+
+    budget = min(ai_client.timeout, deadline.remaining()) if ai_client is not None else 0.0
+    if ai_client is None:
+        text, source = generate_ai_analysis(product), 'local'
+    elif budget < MIN_AI_SECONDS:
+        deadline.degrade('analysis', 'локальный анализ')
+        text, source = generate_ai_analysis(product), 'fallback'
+    else:
+        result = ai_client.analyze_sync(
+            key=f"{version}:{code}",
+            prompt=build_analysis_prompt(product),
+            fallback=lambda: generate_ai_analysis(product),
+            timeout=budget
+        )
+        logger.debug("AI-анализ %s: %s, %.2fс, объединен: %s", code, result.source, result.latency, result.coalesced)
+        text, source = result.text, result.source
+
+    # Локальная замена при таймауте модели не кэшируется: следующий запрос попробует модель снова
+    if use_cache and source != 'fallback':
+        analysis_cache.put(code, version, template, text)
+    return text
+
+# Журнал запросов для прогрева после перезапуска; None — без журнала
+query_log: Optional[QueryLog] = None
+
+def configure_query_log(log: Optional[QueryLog]):
+    global query_log
+    query_log = log
+
+def warm_up_queries(queries: Iterable[str], ved_db) -> int:
+    """Прогон запросов через поиск и отрисовку (кэши карточек, страницы выдачи); число запросов"""
+    _replay.active = True
+    replayed = 0
+    try:
+        for query in queries:
+            route_message_chunks(query, ved_db)
+            replayed += 1
+    finally:
+        _replay.active = False
+    return replayed
+
+def analysis_stats() -> Dict:
+    """Статистика клиента модели и кэша анализов"""
+    result = {}
+    if ai_client is not None:
+        result["ai_pipeline"] = dict(ai_client.stats)
+    if analysis_cache is not None:
+        result["analysis_cache"] = analysis_cache.stats
+    return result
+
+def warm_up_analyses(ved_db, limit: int = 50) -> int:
+    """Прогрев кэша анализов для самых популярных кодов"""
+    if analysis_cache is None:
+        return 0
+    def analyze(code: str) -> Optional[str]:
+        product = ved_db.get_product_by_code(code)
+        return run_ai_analysis(product, data_version(ved_db, code)) if product else None
+
+    return warm_up((code for code, _ in request_stats['popular_codes'].top(limit)), analyze)
+
 def generate_ai_analysis(product: Dict) -> str:
     """Генерация AI-анализа товара"""
     try:
-        code = product.get('code')
-        name = product.get('name')
-        duties = product.get('duties', {})
-        certification = product.get('certification', [])
-        restrictions = product.get('restrictions', [])
+        view = normalize_product(product)
+        name = view.name if view.name not in ('', '-') else view.description
+        certification = view.certification
+        restrictions = view.restrictions
         
         analysis = f"📊 *Анализ товара:* {name}\n\n"
         
-        # Анализ пошлин
-        base_rate = duties.get('base', 0)
-        if base_rate == 0:
+        # Анализ пошлин (ставка может быть не установлена: "-"; в русской схеме ставок по странам нет)
+        base_rate = ad_valorem_rate(view.duties['base']) if 'base' in view.duties else None
+        if base_rate is None:
+            analysis += "❔ *Пошлины:* Адвалорная ставка в базе не указана - уточните ставку по тарифу.\n\n"
+        elif base_rate == 0:
             analysis += "💚 *Пошлины:* Отличная новость! Базовая ставка 0% - товар не облагается пошлиной.\n\n"
         elif base_rate <= 5:
             analysis += "💛 *Пошлины:* Низкая ставка - выгодно для импорта.\n\n"
@@ -300,52 +471,73 @@ def get_statistics() -> str:
         
         if request_stats['popular_codes']:
             stats += "🏆 *Популярные коды:*\n"
-            sorted_codes = sorted(request_stats['popular_codes'].items(), 
-                                key=lambda x: x[1], reverse=True)[:5]
-            for code, count in sorted_codes:
+            for code, count in request_stats['popular_codes'].top(5):
                 stats += f"• {code}: {count} запросов\n"
         
+        if request_stats['popular_queries']:
+            stats += "\n🔎 *Популярные запросы за сутки:*\n"
+            for query, count in request_stats['popular_queries'].top(5, 'day'):
+                stats += f"• {query}: {count}\n"
+        
         return stats
         
     except Exception as e:
         logger.error(f"Ошибка получения статистики: {e}")
         return "❌ Ошибка получения статистики"
 
-def route_message(text: str, ved_db=None) -> str:
+def route_message(text: str, ved_db=None, deadline: Deadline = NO_DEADLINE) -> str:
     """Главная функция маршрутизации сообщений"""
+    return route_message_paged(text, ved_db, deadline)[0]
+
+def route_message_paged(text: str, ved_db=None, deadline: Deadline = NO_DEADLINE) -> Tuple[str, Optional[str]]:
+    """Маршрутизация сообщения: (ответ, курсор следующей страницы или None)"""
+    messages, next_cursor = route_message_chunks(text, ved_db, deadline=deadline)
+    return "\n\n".join(messages), next_cursor
+
+def route_message_chunks(text: str, ved_db=None, user_id=None,
+                         deadline: Deadline = NO_DEADLINE) -> Tuple[List[str], Optional[str]]:
+    """Маршрутизация сообщения: (сообщения ответа по лимиту Telegram, курсор следующей страницы или None)
+
+    user_id попадает в журнал запросов только в обезличенном виде;
+    deadline — бюджет времени запроса (см. deadline.py).
+    """
     try:
         if not ved_db:
-            return "🧠 Запрос обработан: " + text + "\n\nДля получения информации укажите код ТН ВЭД или название товара."
+            return ["🧠 Запрос обработан: " + text + "\n\nДля получения информации укажите код ТН ВЭД или название товара."], None
         
         # Обновляем общую статистику
-        request_stats['total_requests'] += 1
+        _count('total_requests')
         
         text = text.strip()
+        normalized = normalize_query(text)
+        _track('popular_queries', normalized)
+        if query_log is not None and not getattr(_replay, 'active', False):
+            query_log.append(normalized, user_id)
         
         # Специальные команды
         if text.lower() in ['статистика', 'stats', '/stats']:
-            return get_statistics()
+            return [get_statistics()], None
         
         if text.lower() in ['помощь', 'help', '/help']:
-            return get_help_message()
+            return [get_help_message()], None
         
         # Попытка AI-анализа
-        ai_result = handle_ai_analysis(text, ved_db)
+        ai_result = handle_ai_analysis(text, ved_db, deadline)
         if ai_result:
-            return ai_result
+            return [ai_result], None
         
         # Обычный поиск
-        search_result = improved_search(text, ved_db)
+        search_result, next_cursor = _improved_search(text, ved_db, deadline)
         if search_result:
-            return search_result
+            return search_result, next_cursor
         
         # Если ничего не найдено
-        request_stats['name_searches'] += 1
-        return get_not_found_message(text)
+        _count('name_searches')
+        return [get_not_found_message(text)], None
         
     except Exception as e:
         logger.error(f"Ошибка маршрутизации: {e}")
-        return f"❌ Произошла ошибка при обработке запроса: {str(e)}"
+        return [f"❌ Произошла ошибка при обработке запроса: {str(e)}"], None
 
 def get_help_message() -> str:
     """Сообщение помощи"""
@@ -355,6 +547,8 @@ def get_help_message() -> str:
 • Введите код ТН ВЭД (10 цифр): `8471300000`
 • Введите название товара: `ноутбук`
 • Запросите AI-анализ: `анализ 8471300000`
+• Ставки на дату: `8471300000 на 01.03.2026`
+• Изменения ставок за период: `изменения 01.01.2026 01.03.2026`
 • Посмотрите статистику: `статистика`
 
 🔍 *Примеры запросов:*
@@ -0,0 +1,369 @@
+"""
+SQLite/FTS5-хранилище базы ТН ВЭД с API VEDDatabase
+"""
+
+import hashlib
+import json
+import logging
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from ved_database import VEDDatabase, find_products_array
+from duty_table import DutyTable
+from certification_index import CertificationIndex
+from tariff_patch import PatchError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SQLITE_FILE = 'tnved_database.sqlite'
+
+# Версия схемы файла: файлы старой схемы нужно импортировать заново
+SCHEMA_VERSION = '2'
+
+_COLUMNS = "code, name, description, full_description, grp, duty, certification"
+_SCHEMA = """
+CREATE TABLE products (
+    position INTEGER PRIMARY KEY,   -- порядок записи в исходном JSON
+    code TEXT NOT NULL,
+    code_rank INTEGER NOT NULL,     -- номер записи в порядке (code, position)
+    name TEXT NOT NULL,
+    description TEXT NOT NULL,
+    full_description TEXT NOT NULL, -- полный иерархический путь (hierarchy.py)
+    grp TEXT NOT NULL,
+    duty TEXT NOT NULL,
+    certification TEXT NOT NULL,
+    duties_json TEXT NOT NULL,
+    search_text TEXT NOT NULL
+);
+CREATE INDEX idx_products_code ON products(code, position);
+CREATE UNIQUE INDEX idx_products_code_rank ON products(code_rank);
+CREATE INDEX idx_products_grp ON products(grp, position);
+CREATE VIRTUAL TABLE products_fts USING fts5(
+    search_text, content='products', content_rowid='position', tokenize='trigram'
+);
+CREATE TABLE metadata (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+
+def import_json(json_file: str = 'tnved_database.json', db_file: str = DEFAULT_SQLITE_FILE) -> str:
+    """Импорт tnved_database.json в SQLite; файл собирается рядом и атомарно подменяется"""
+    started = time.time()
+    with open(json_file, 'rb') as f:
+        raw_bytes = f.read()
+    products_array = find_products_array(json.loads(raw_bytes.decode('utf-8'))) or []
+
+    rows = []
+    for item in products_array:
+        converted = VEDDatabase.convert_item(item)
+        if converted:
+            rows.append((converted, json.dumps(item.get('duties', {}), ensure_ascii=False)))
+
+    VEDDatabase.add_full_descriptions([item for item, _ in rows])
+    ranks = sorted(range(len(rows)), key=lambda i: (rows[i][0]['код'], i))
+    code_rank = [0] * len(rows)
+    for rank, position in enumerate(ranks):
+        code_rank[position] = rank
+
+    tmp_file = f"{db_file}.tmp"
+    if os.path.exists(tmp_file):
+        os.remove(tmp_file)
+    conn = sqlite3.connect(tmp_file)
+    try:
+        conn.executescript(_SCHEMA)
+        conn.executemany(
+            "INSERT INTO products VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                (position, item['код'], code_rank[position], item['название'], item['описание'],
+                 item['полное_описание'], item['группа'], item['пошлина'], item['сертификация'],
+                 duties_json, VEDDatabase.search_line(item))
+                for position, (item, duties_json) in enumerate(rows)
+            )
+        )
+        conn.execute("INSERT INTO products_fts(products_fts) VALUES ('rebuild')")
+        conn.execute("INSERT INTO metadata VALUES ('version', ?)",
+                     (hashlib.sha1(raw_bytes).hexdigest()[:12],))
+        conn.execute("INSERT INTO metadata VALUES ('source', ?)", (os.path.abspath(json_file),))
+        conn.execute("INSERT INTO metadata VALUES ('schema', ?)", (SCHEMA_VERSION,))
+        conn.commit()
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+    os.replace(tmp_file, db_file)
+
+    logger.info(f"Импортировано {len(rows)} записей в {db_file} за {time.time() - started:.1f}с")
+    return db_file
+
+
+def schema_is_current(db_file: str) -> bool:
+    """Файл существует и собран текущей версией схемы"""
+    if not os.path.exists(db_file):
+        return False
+    try:
+        conn = sqlite3.connect(f"file:{os.path.abspath(db_file)}?mode=ro", uri=True)
+        try:
+            row = conn.execute("SELECT value FROM metadata WHERE key = 'schema'").fetchone()
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return False
+    return row is not None and row[0] == SCHEMA_VERSION
+
+
+class SQLiteVEDDatabase(VEDDatabase):
+    """База ТН ВЭД в файле SQLite с тем же API, что и VEDDatabase"""
+
+    def __init__(self, db_file: str = DEFAULT_SQLITE_FILE,
+                 certification_file: str = 'certification.json',
+                 mmap_size: int = 256 * 1024 * 1024):
+        self.db_file = db_file
+        self.mmap_size = mmap_size
+        self._local = threading.local()
+        super().__init__(json_file=db_file, certification_file=certification_file)
+
+    def _connection(self) -> sqlite3.Connection:
+        """Соединение текущего потока (только чтение, общий с другими процессами кэш ОС)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{os.path.abspath(self.db_file)}?mode=ro", uri=True,
+                                   check_same_thread=False)
+            conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+            conn.execute("PRAGMA query_only = 1")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _row_to_item(row: Tuple) -> Dict:
+        code, name, description, full_description, group, duty, certification = row
+        return {
+            'код': code,
+            'название': name,
+            'описание': description,
+            'полное_описание': full_description,
+            'группа': group,
+            'пошлина': duty,
+            'сертификация': certification
+        }
+
+    def apply_patch(self, patch):
+        """Файл открыт только на чтение: патч применяется к JSON, затем импорт заново"""
+        raise PatchError(f"SQLite-хранилище не принимает патчи на месте ({patch.version}): "
+                         "примените патч к базе в памяти или выполните импорт заново")
+    
+    def load_database(self):
+        """Открытие файла SQLite; в память читаются только ставки и сертификация"""
+        try:
+            started = time.perf_counter()
+            if not os.path.exists(self.db_file):
+                raise FileNotFoundError(self.db_file)
+            self._local = threading.local()
+            conn = self._connection()
+            if not schema_is_current(self.db_file):
+                raise ValueError(f"Схема {self.db_file} устарела, выполните: python ved_sqlite.py import")
+            self.version = conn.execute("SELECT value FROM metadata WHERE key = 'version'").fetchone()[0]
+            opened = time.perf_counter()
+
+            self.duty_table = DutyTable(
+                (code, group, json.loads(duties_json))
+                for code, group, duties_json in conn.execute(
+                    "SELECT code, grp, duties_json FROM products ORDER BY position")
+            )
+            self.certification = CertificationIndex(
+                self.certification_file,
+                conn.execute("SELECT code, certification FROM products ORDER BY position")
+            )
+            # Фазы загрузки: чтение и разбор JSON заменены открытием файла
+            index_done = time.perf_counter()
+            self.load_phases = {
+                'open': round(opened - started, 4),
+                'index': round(index_done - opened, 4),
+                'total': round(index_done - started, 4),
+                'file_bytes': os.path.getsize(self.db_file),
+                'rows': self.get_product_count(),
+                'loaded_at': datetime.now().isoformat(timespec='seconds'),
+            }
+            logger.info(f"SQLite база {self.db_file}: {self.get_product_count()} кодов (версия {self.version})")
+        except FileNotFoundError:
+            logger.error(f"Файл {self.db_file} не найден (см. python ved_sqlite.py import)")
+            self._clear()
+        except Exception as e:
+            logger.error(f"Ошибка открытия SQLite базы: {e}")
+            self._clear()
+
+    def find_by_code(self, code: str) -> Optional[Dict]:
+        """Поиск товара по коду ТН ВЭД (точное совпадение)"""
+        if not code or self.version is None:
+            return None
+        row = self._connection().execute(
+            f"SELECT {_COLUMNS} FROM products WHERE code = ? ORDER BY position LIMIT 1",
+            (str(code).strip(),)
+        ).fetchone()
+        return self._row_to_item(row) if row else None
+
+    def _is_canonical(self, code: str, product: Dict) -> bool:
+        return self.find_by_code(code) == product
+
+    def iter_search(self, name: str, start: int = 0,
+                    stop: Optional[Callable[[], bool]] = None) -> Iterator[Tuple[int, Dict]]:
+        """Поиск подстроки через FTS5 trigram; короткие запросы — сканированием
+
+        stop не проверяется: запрос выполняет SQLite целиком.
+        """
+        if not name or len(name.strip()) < 2 or self.version is None:
+            return
+        search_name = name.strip().lower()
+        conn = self._connection()
+        if len(search_name) >= 3:
+            cursor = conn.execute(
+                f"SELECT p.position, {', '.join('p.' + c for c in _COLUMNS.split(', '))} "
+                "FROM products_fts f JOIN products p ON p.position = f.rowid "
+                "WHERE products_fts MATCH ? AND f.rowid >= ? ORDER BY f.rowid",
+                ('"' + search_name.replace('"', '""') + '"', start)
+            )
+        else:
+            cursor = conn.execute(
+                f"SELECT position, {_COLUMNS} FROM products "
+                "WHERE instr(search_text, ?) > 0 AND position >= ? ORDER BY position",
+                (search_name, start)
+            )
+        for row in cursor:
+            yield row[0], self._row_to_item(row[1:])
+
+    def iter_products_by_group(self, group: str, start: int = 0) -> Iterator[Tuple[int, Dict]]:
+        """Товары группы (подстрока группы без учета регистра, как в VEDDatabase)"""
+        if not group or self.version is None:
+            return
+        for row in self._connection().execute(
+            f"SELECT position, {_COLUMNS} FROM products "
+            "WHERE instr(lower(grp), ?) > 0 AND position >= ? ORDER BY position",
+            (group.strip().lower(), start)
+        ):
+            yield row[0], self._row_to_item(row[1:])
+
+    def iter_products_by_prefix(self, prefix: str, start: int = 0) -> Iterator[Tuple[int, Dict]]:
+        """Товары по префиксу кода: диапазонное сканирование индекса"""
+        if self.version is None:
+            return
+        prefix = (prefix or '').strip()
+        for row in self._connection().execute(
+            f"SELECT code_rank, {_COLUMNS} FROM products "
+            "WHERE code >= ? AND code < ? AND code_rank >= ? ORDER BY code_rank",
+            (prefix, prefix + '\uffff', start)
+        ):
+            yield row[0], self._row_to_item(row[1:])
+
+    def iter_all_products(self, start: int = 0) -> Iterator[Tuple[int, Dict]]:
+        if self.version is None:
+            return
+        for row in self._connection().execute(
+            f"SELECT position, {_COLUMNS} FROM products WHERE position >= ? ORDER BY position", (start,)
+        ):
+            yield row[0], self._row_to_item(row[1:])
+
+    def iter_export(self, group: Optional[str] = None,
+                    prefix: Optional[str] = None) -> Tuple[Optional[str], Iterator[Dict]]:
+        """(версия, записи) из одной транзакции чтения отдельного соединения
+
+        Выгрузка может идти дольше жизни потока-обработчика, поэтому
+        соединение свое и закрывается по окончании чтения.
+        """
+        if self.version is None:
+            return None, iter(())
+        conn = sqlite3.connect(f"file:{os.path.abspath(self.db_file)}?mode=ro", uri=True,
+                               check_same_thread=False, isolation_level=None)
+        conn.execute("BEGIN")
+        version = conn.execute("SELECT value FROM metadata WHERE key = 'version'").fetchone()[0]
+        prefix = (prefix or '').strip()
+        cursor = conn.execute(
+            f"SELECT {_COLUMNS} FROM products "
+            "WHERE (? = '' OR grp = ?) AND code >= ? AND code < ? ORDER BY position",
+            ((group or '').strip(), (group or '').strip(), prefix, prefix + '\uffff')
+        )
+
+        def rows() -> Iterator[Dict]:
+            try:
+                for row in cursor:
+                    yield self._row_to_item(row)
+            finally:
+                conn.close()
+
+        return version, rows()
+
+    def get_all_products(self) -> List[Dict]:
+        """Получить все товары (список строится из файла при каждом вызове)"""
+        return [item for _, item in self.iter_all_products()]
+
+    def get_product_count(self) -> int:
+        if self.version is None:
+            return 0
+        return self._connection().execute("SELECT COUNT(*) FROM products").fetchone()[0]
+
+    def get_random_products(self, count: int = 5) -> List[Dict]:
+        """Получить случайные товары"""
+        total = self.get_product_count()
+        if total == 0:
+            return []
+        positions = random.sample(range(total), min(count, total))
+        placeholders = ', '.join('?' * len(positions))
+        return [self._row_to_item(row) for row in self._connection().execute(
+            f"SELECT {_COLUMNS} FROM products WHERE position IN ({placeholders})", positions
+        )]
+
+
+def benchmark(json_file: str = 'tnved_database.json', db_file: str = DEFAULT_SQLITE_FILE,
+              rounds: int = 2000) -> Dict[str, Dict[str, float]]:
+    """Сравнение VEDDatabase (в памяти) и SQLiteVEDDatabase: время операций и память"""
+    import tracemalloc
+
+    if not os.path.exists(db_file):
+        import_json(json_file, db_file)
+
+    results: Dict[str, Dict[str, float]] = {}
+    for label, factory in (('memory', lambda: VEDDatabase(json_file)),
+                           ('sqlite', lambda: SQLiteVEDDatabase(db_file))):
+        tracemalloc.start()
+        started = time.perf_counter()
+        db = factory()
+        load_time = time.perf_counter() - started
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        rng = random.Random(42)
+        codes = [item['код'] for item in db.get_random_products(200)]
+        sample_codes = [rng.choice(codes) for _ in range(rounds)]
+
+        timings = {'load_s': load_time, 'memory_mb': memory / 1024 / 1024}
+        operations = (
+            ('find_by_code_us', lambda i: db.find_by_code(sample_codes[i])),
+            ('search_by_name_us', lambda i: db.search_by_name(('рыба', 'мясо', 'кофе', 'прочие')[i % 4])),
+            ('get_products_by_group_us', lambda i: db.get_products_by_group(sample_codes[i][:2])),
+            ('prefix_scan_us', lambda i: db.get_products_by_prefix(sample_codes[i][:4])),
+        )
+        for name, operation in operations:
+            n = rounds if name == 'find_by_code_us' else rounds // 10
+            started = time.perf_counter()
+            for i in range(n):
+                operation(i)
+            timings[name] = (time.perf_counter() - started) / n * 1e6
+        results[label] = timings
+    return results
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    command = sys.argv[1] if len(sys.argv) > 1 else ''
+    source = sys.argv[2] if len(sys.argv) > 2 else 'tnved_database.json'
+    target = sys.argv[3] if len(sys.argv) > 3 else DEFAULT_SQLITE_FILE
+    if command == 'import':
+        import_json(source, target)
+    elif command == 'bench':
+        for backend, timings in benchmark(source, target).items():
+            print(f"{backend:>7}: " + ", ".join(f"{key}={value:.2f}" for key, value in timings.items()))
+    else:
+        print("Использование: python ved_sqlite.py import|bench [tnved_database.json] [tnved_database.sqlite]")
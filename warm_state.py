@@ -0,0 +1,121 @@
+"""
+Теплое состояние между перезапусками: кэши и счетчики в одном файле, атомарная запись
+"""
+
+import logging
+import os
+import pickle
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WARM_STATE_FILE = 'warm_state.pickle'
+WARM_STATE_FORMAT = 1
+
+
+def _fsync_directory(directory: str):
+    """fsync каталога: переименование файла переживает сбой питания"""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return  # каталоги нельзя открыть (Windows)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class WarmState:
+    """Реестр частей теплого состояния, сохраняемых в один файл
+
+    Часть восстанавливается только при совпадении версии ее данных.
+    Значения сохраняются через pickle, поэтому файл читается только из
+    собственного каталога сервиса.
+    """
+
+    def __init__(self, path: str = DEFAULT_WARM_STATE_FILE,
+                 version: Optional[Callable[[], Any]] = None):
+        self.path = path
+        self._version = version or (lambda: None)
+        self._parts: Dict[str, Tuple[Callable[[], Any], Callable[[Any], None], Callable[[], Any]]] = {}
+        self.stats: Dict[str, Any] = {'restored': [], 'skipped': [], 'saved': 0, 'bytes': 0, 'seconds': 0.0}
+
+    def register(self, name: str, dump: Callable[[], Any], restore: Callable[[Any], None],
+                 version: Optional[Callable[[], Any]] = None):
+        """Часть состояния; version — версия ее данных (по умолчанию общая)"""
+        self._parts[name] = (dump, restore, version or self._version)
+
+    def save(self) -> bool:
+        """Снимок всех частей в файл (атомарно); False при ошибке"""
+        started = time.perf_counter()
+        parts = {}
+        for name, (dump, _, version) in self._parts.items():
+            try:
+                parts[name] = (version(), dump())
+            except Exception as e:
+                logger.error(f"Ошибка снимка части {name}: {e}")
+
+        payload = {'format': WARM_STATE_FORMAT, 'saved_at': time.time(), 'parts': parts}
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.warm_state.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            _fsync_directory(directory)
+        except Exception as e:
+            logger.error(f"Ошибка сохранения теплого состояния {self.path}: {e}")
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            return False
+
+        seconds = time.perf_counter() - started
+        size = os.path.getsize(self.path)
+        self.stats.update(saved=len(parts), bytes=size, seconds=round(seconds, 3))
+        logger.info(f"Теплое состояние сохранено: {len(parts)} частей, "
+                    f"{size / 1024:.0f} КБ за {seconds * 1000:.0f}мс")
+        return True
+
+    def restore(self) -> List[str]:
+        """Восстановление частей с совпадающей версией; имена восстановленных"""
+        if not os.path.exists(self.path):
+            return []
+        started = time.perf_counter()
+        try:
+            with open(self.path, 'rb') as f:
+                payload = pickle.load(f)
+        except Exception as e:
+            logger.error(f"Ошибка чтения теплого состояния {self.path}: {e}")
+            return []
+        if not isinstance(payload, dict) or payload.get('format') != WARM_STATE_FORMAT:
+            logger.warning(f"Теплое состояние {self.path}: неизвестный формат, пропущено")
+            return []
+
+        restored, skipped = [], []
+        for name, (saved_version, value) in payload.get('parts', {}).items():
+            part = self._parts.get(name)
+            if part is None:
+                continue
+            _, restore, version = part
+            if saved_version != version():
+                skipped.append(name)
+                continue
+            try:
+                restore(value)
+                restored.append(name)
+            except Exception as e:
+                logger.error(f"Ошибка восстановления части {name}: {e}")
+                skipped.append(name)
+
+        age = time.time() - payload.get('saved_at', time.time())
+        self.stats.update(restored=restored, skipped=skipped)
+        logger.info(f"Теплое состояние (снимок {age:.0f}с назад): восстановлено {restored or '-'}, "
+                    f"пропущено {skipped or '-'} за "
+                    f"{(time.perf_counter() - started) * 1000:.0f}мс")
+        return restored
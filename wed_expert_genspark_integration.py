@@ -7,6 +7,8 @@ import re
 from typing import Dict, List
 from dataclasses import dataclass
 
+from similar_codes import SimilarCodesIndex
+
 @dataclass
 class TNVEDResult:
     """Результат определения кода ТН ВЭД"""
@@ -33,6 +35,8 @@ class GensparktWEDAgent:
     
     def __init__(self):
         self.knowledge_base = self._load_knowledge_base()
+        # Офлайн-индекс похожих кодов (python similar_codes.py build); None, если не собран
+        self.similar_index = SimilarCodesIndex.load_default()
         print("✅ WED Agent инициализирован с расширенной базой знаний Genspark")
         
     def _load_knowledge_base(self):
@@ -231,6 +235,13 @@ class GensparktWEDAgent:
 
     def get_similar_products(self, product_name):
         """Поиск похожих товаров в базе"""
+        if self.similar_index is not None:
+            return [
+                {'category': code[:2], 'product': self.similar_index.text(code), 'code': code,
+                 'similarity': round(score, 3)}
+                for code, score in self.similar_index.query([product_name], k=5)[0]
+            ]
+        
         similar = []
         name_words = product_name.lower().split()
         
@@ -244,3 +255,10 @@ class GensparktWEDAgent:
                     })
         
         return similar[:5]  # Топ 5 похожих товаров
+
+    def get_similar_codes(self, code, k=5):
+        """Похожие коды ТН ВЭД по заранее посчитанным соседям"""
+        if self.similar_index is None:
+            return []
+        return [{'code': other, 'product': self.similar_index.text(other), 'similarity': round(score, 3)}
+                for other, score in self.similar_index.similar(code, k)]